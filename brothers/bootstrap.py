@@ -3,12 +3,12 @@
 This module is used to provide a complete listing of the chapter's membership. It is also used to populate
 'big brother' fields in forms.
 
-This module exports a list of tuples called INITIAL_BROTHER_LIST. Each tuple in the list contains the badge number
-and name of one of the chapter's members.
+This module exports a tuple of tuples called INITIAL_BROTHER_LIST. Each inner tuple contains the badge number and
+name of one of the chapter's members. The outer tuple is immutable, since it is shared by every request.
 
 """
 
-INITIAL_BROTHER_LIST = [
+INITIAL_BROTHER_LIST = (
     (0, '---------'),
     (1, 'Evan Gibson'),     # alumni
     (2, 'Joe Carroll'),     # ...
@@ -123,4 +123,4 @@ INITIAL_BROTHER_LIST = [
     (111, 'Adam DeBruler'),     # undergrad
     (112, 'John Brawley'),      # undergrad
     (113, 'Joseph Reynolds')    # undergrad
-]
\ No newline at end of file
+)
@@ -0,0 +1,337 @@
+"""Bulk import and export of user accounts for the gtphipsi.brothers package.
+
+Files of accounts are either CSV files, whose first line names the fields, or JSON files containing one object per line;
+the fields are listed in FIELDS, and dates may be written in any of the formats in settings.DATE_INPUT_FORMATS. Files are
+read and written one row at a time, so neither importing nor exporting holds a whole file in memory.
+
+Rows are validated in batches: each row is checked by an ImportUserForm, and the usernames and badges of a whole batch
+are checked against the database with one query each. If any row is invalid, no accounts are created. Otherwise, the
+users, profiles, visibility settings, and group memberships of each batch are created with one bulk insert per table,
+all in a single transaction. Imported accounts have no usable password; brothers set their passwords by following the
+'forgot password' link on the sign-in page.
+
+A whole graduating class can also be made alumni at once: their statuses are updated, and their memberships in the
+Undergraduates group are swapped for memberships in the Alumni group, with a few statements per batch of brothers.
+
+This module exports the following functions:
+    - read_rows (stream[, format])
+    - validate_rows (rows[, batch_size])
+    - import_users (rows[, batch_size])
+    - export_rows ([format])
+    - export_directory (profiles)
+    - graduate_class ([badges, graduation])
+
+This module exports the following constants:
+    - FIELDS
+    - FORMATS
+    - BATCH_SIZE
+
+"""
+
+import csv
+import json
+from itertools import islice
+from StringIO import StringIO
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+
+from gtphipsi.brothers.forms import ImportUserForm
+from gtphipsi.brothers.models import UserProfile, VisibilitySettings, BROTHERS_CACHE
+from gtphipsi.brothers.permissions import get_account_group_id, invalidate_group_perms
+from gtphipsi.caching import bump_version
+
+
+# The fields of a row of an import or export file, in the order of the columns of a CSV file.
+FIELDS = ('badge', 'username', 'email', 'first_name', 'middle_name', 'last_name', 'suffix', 'nickname', 'status',
+          'big_brother', 'major', 'hometown', 'current_city', 'initiation', 'graduation', 'dob', 'phone', 'admin')
+
+# The supported file formats.
+FORMATS = ('csv', 'json')
+
+# The number of rows validated (and then inserted) at a time.
+BATCH_SIZE = 200
+
+
+def read_rows(stream, format='csv'):
+    """Return an iterator over the rows of an import file, each a dictionary mapping field names to values.
+
+    Required parameters:
+        - stream    =>  an iterable of the lines of the file (e.g., an open file or an uploaded file)
+
+    Optional parameters:
+        - format    =>  the format of the file, one of FORMATS: defaults to 'csv'
+
+    A line of a JSON file that cannot be parsed is returned as None.
+
+    """
+    if format == 'json':
+        return (_parse_json_line(line) for line in stream if line.strip())
+    return (dict((field, (value or '').decode('utf-8')) for field, value in row.items() if field is not None)
+            for row in csv.DictReader(stream))
+
+
+def validate_rows(rows, batch_size=BATCH_SIZE):
+    """Return a tuple (cleaned, errors) for the provided rows of an import file.
+
+    Required parameters:
+        - rows  =>  an iterable of rows, as returned by read_rows()
+
+    Optional parameters:
+        - batch_size    =>  the number of rows to check against the database at a time: defaults to BATCH_SIZE
+
+    'cleaned' is a list of the cleaned data of every valid row, and 'errors' is a list of (row number, message) tuples
+    describing every invalid row; rows are numbered from 1. Usernames and badges must not be taken, either by existing
+    accounts or by earlier rows of the same file.
+
+    """
+    cleaned = []
+    errors = []
+    usernames = set()
+    badges = set()
+    rows = iter(rows)
+    number = 0
+    while True:
+        chunk = list(islice(rows, batch_size))
+        if not chunk:
+            break
+        batch = []
+        for row in chunk:
+            number += 1
+            if row is None:
+                errors.append((number, 'The row could not be read.'))
+                continue
+            form = ImportUserForm(row)
+            if form.is_valid():
+                batch.append((number, form.cleaned_data))
+            else:
+                errors.extend((number, '%s: %s' % (field, ' '.join(messages))) for field, messages in form.errors.items())
+        if not batch:
+            continue
+        taken_usernames = frozenset(User.objects.filter(username__in=[data['username'] for n, data in batch])
+                                    .values_list('username', flat=True))
+        taken_badges = frozenset(UserProfile.objects.filter(badge__in=[data['badge'] for n, data in batch])
+                                 .values_list('badge', flat=True))
+        for row_number, data in batch:
+            if data['username'] in taken_usernames or data['username'] in usernames:
+                errors.append((row_number, 'username: That username is taken.'))
+            elif data['badge'] in taken_badges or data['badge'] in badges:
+                errors.append((row_number, 'badge: A brother with that badge number already exists.'))
+            else:
+                usernames.add(data['username'])
+                badges.add(data['badge'])
+                cleaned.append(data)
+    return cleaned, errors
+
+
+def import_users(rows, batch_size=BATCH_SIZE):
+    """Create an account for every row of an import file, returning a tuple (num_created, errors).
+
+    Required parameters:
+        - rows  =>  an iterable of rows, as returned by read_rows()
+
+    Optional parameters:
+        - batch_size    =>  the number of rows to validate and insert at a time: defaults to BATCH_SIZE
+
+    'errors' is a list of (row number, message) tuples (see validate_rows()). If it is not empty, no accounts are created.
+
+    """
+    cleaned, errors = validate_rows(rows, batch_size)
+    if errors or not cleaned:
+        return 0, errors
+    _create_accounts(cleaned, batch_size)
+    return len(cleaned), []
+
+
+def export_rows(format='csv'):
+    """Return an iterator over the lines of an export file of every brother with an account, ordered by badge.
+
+    Optional parameters:
+        - format    =>  the format of the file, one of FORMATS: defaults to 'csv'
+
+    The file has the same fields as an import file, so it can be imported into another database.
+
+    """
+    admins = frozenset(User.objects.filter(groups__name='Administrators').values_list('id', flat=True))
+    if format != 'json':
+        yield _csv_line(FIELDS)
+    for profile in UserProfile.objects.select_related('user').order_by('badge').iterator():
+        row = _export_row(profile, profile.user_id in admins)
+        if format == 'json':
+            yield json.dumps(row) + '\n'
+        else:
+            yield _csv_line([row[field] for field in FIELDS])
+
+
+def export_directory(profiles):
+    """Return an iterator over the lines of a CSV file of the user directory (names, email addresses, etc.).
+
+    Required parameters:
+        - profiles  =>  a queryset of the profiles to list, in order
+
+    Unlike export_rows(), which is meant for administrators, this respects each brother's chapter visibility settings.
+
+    """
+    yield _csv_line(('badge', 'name', 'email', 'phone', 'current_city'))
+    for profile in profiles.select_related('user', 'chapter_visibility').iterator():
+        visibility = profile.chapter_visibility
+        phone = profile.phone if visibility is not None and visibility.phone else ''
+        city = profile.current_city if visibility is not None and visibility.current_city else ''
+        yield _csv_line((profile.badge, profile.full_name(), profile.user.email, phone, city))
+
+
+@transaction.commit_on_success
+def graduate_class(badges=None, graduation=None):
+    """Make alumni of a class of brothers who are not alumni yet, returning the number of brothers who graduated.
+
+    Optional parameters:
+        - badges        =>  an iterable of the badges of the brothers to graduate: defaults to None (any badge)
+        - graduation    =>  a date; only brothers graduating on or before it graduate: defaults to None (any date)
+
+    At least one of 'badges' and 'graduation' must be provided; otherwise, ValueError is raised.
+
+    """
+    if badges is None and graduation is None:
+        raise ValueError('Either badges or a graduation date must be provided.')
+    profiles = UserProfile.objects.exclude(status='A')
+    if badges is not None:
+        profiles = profiles.filter(badge__in=list(badges))
+    if graduation is not None:
+        profiles = profiles.filter(graduation__lte=graduation)
+    user_ids = list(profiles.values_list('user_id', flat=True))
+    if not user_ids:
+        return 0
+    undergrads = get_account_group_id('Undergraduates')
+    alumni = get_account_group_id('Alumni')
+    membership = User.groups.through
+    for start in range(0, len(user_ids), BATCH_SIZE):
+        batch = user_ids[start:start + BATCH_SIZE]
+        UserProfile.objects.filter(user__in=batch).update(status='A')
+        membership.objects.filter(user__in=batch, group=undergrads).delete()
+        members = frozenset(membership.objects.filter(user__in=batch, group=alumni).values_list('user_id', flat=True))
+        membership.objects.bulk_create([membership(user_id=id, group_id=alumni) for id in batch if id not in members])
+    # neither update() nor bulk inserts send the signals that normally invalidate the directory and the member counts
+    bump_version(BROTHERS_CACHE)
+    invalidate_group_perms()
+    return len(user_ids)
+
+
+
+
+
+
+## ============================================= ##
+##                                               ##
+##               Private Functions               ##
+##                                               ##
+## ============================================= ##
+
+
+def _parse_json_line(line):
+    """Return the object (a dictionary) on the provided line of a JSON file, or None if there is none."""
+    try:
+        row = json.loads(line)
+    except ValueError:
+        return None
+    return row if isinstance(row, dict) else None
+
+
+@transaction.commit_on_success
+def _create_accounts(cleaned, batch_size):
+    """Create the users, profiles, visibility settings, and group memberships for the provided cleaned rows.
+
+    Bulk inserts do not report the IDs of the rows they create. The IDs of each batch of users are therefore selected
+    by username after the users are inserted, and IDs for the visibility settings, which profiles refer to, are reserved
+    in advance (see _reserve_ids()). Profiles and memberships are inserted without IDs, so accounts created at the same
+    time by other requests do not conflict with the import.
+
+    """
+    names = set('Alumni' if data['status'] == 'A' else 'Undergraduates' for data in cleaned)
+    if any(data['admin'] for data in cleaned):
+        names.add('Administrators')
+    group_ids = dict((name, get_account_group_id(name)) for name in names)
+    membership = User.groups.through
+    for start in range(0, len(cleaned), batch_size):
+        batch = cleaned[start:start + batch_size]
+        users = []
+        for data in batch:
+            user = User(username=data['username'], email=data['email'], first_name=data['first_name'],
+                        last_name=data['last_name'])
+            user.set_unusable_password()
+            users.append(user)
+        User.objects.bulk_create(users)
+        user_ids = dict(User.objects.filter(username__in=[data['username'] for data in batch])
+                        .values_list('username', 'id'))
+        settings_ids = iter(_reserve_ids(VisibilitySettings, 2 * len(batch)))
+        visibility, profiles, memberships = [], [], []
+        for data in batch:
+            user_id = user_ids[data['username']]
+            public, chapter = next(settings_ids), next(settings_ids)
+            visibility.append(VisibilitySettings(id=public, **_visibility_defaults(False)))
+            visibility.append(VisibilitySettings(id=chapter, **_visibility_defaults(True)))
+            profiles.append(UserProfile(user_id=user_id, public_visibility_id=public, chapter_visibility_id=chapter,
+                                        badge=data['badge'], status=data['status'], big_brother=data['big_brother'],
+                                        middle_name=data['middle_name'], suffix=data['suffix'],
+                                        nickname=data['nickname'], major=data['major'], hometown=data['hometown'],
+                                        current_city=data['current_city'], initiation=data['initiation'],
+                                        graduation=data['graduation'], dob=data['dob'], phone=data['phone']))
+            group_id = group_ids['Alumni' if data['status'] == 'A' else 'Undergraduates']
+            memberships.append(membership(user_id=user_id, group_id=group_id))
+            if data['admin']:
+                memberships.append(membership(user_id=user_id, group_id=group_ids['Administrators']))
+        VisibilitySettings.objects.bulk_create(visibility)
+        UserProfile.objects.bulk_create(profiles)
+        membership.objects.bulk_create(memberships)
+    # bulk inserts do not send the signals that normally invalidate the directory and the groups' member counts
+    bump_version(BROTHERS_CACHE)
+    invalidate_group_perms()
+
+
+def _reserve_ids(model, count):
+    """Return a list of the provided number of IDs for new instances of the provided model, which no one else can use.
+
+    On PostgreSQL, the IDs are drawn from the table's sequence, so other transactions are never given them. Other
+    databases have no sequence to draw from, so the IDs follow the table's highest ID, which is selected for update: on
+    MySQL (InnoDB), this keeps other transactions from inserting above it until this transaction ends, and SQLite only
+    allows one transaction at a time to write, which this one already does by the time this function is called. This
+    function must be called within a transaction.
+
+    """
+    if connection.vendor == 'postgresql':
+        cursor = connection.cursor()
+        cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                       [model._meta.db_table, count])
+        return [row[0] for row in cursor.fetchall()]
+    highest = list(model.objects.select_for_update().order_by('-id').values_list('id', flat=True)[:1])
+    first = (highest[0] if highest else 0) + 1
+    return range(first, first + count)
+
+
+def _visibility_defaults(visible):
+    """Return a dictionary setting every field of a VisibilitySettings instance to the provided value."""
+    return dict((field.name, visible) for field in VisibilitySettings._meta.fields if field.name != 'id')
+
+
+def _export_row(profile, admin):
+    """Return a dictionary mapping the fields of an export file to the values of the provided profile."""
+    user = profile.user
+    return {
+        'badge': profile.badge, 'username': user.username, 'email': user.email, 'first_name': user.first_name,
+        'middle_name': profile.middle_name, 'last_name': user.last_name, 'suffix': profile.suffix,
+        'nickname': profile.nickname, 'status': profile.status, 'big_brother': profile.big_brother,
+        'major': profile.major, 'hometown': profile.hometown, 'current_city': profile.current_city,
+        'initiation': _format_date(profile.initiation), 'graduation': _format_date(profile.graduation),
+        'dob': _format_date(profile.dob), 'phone': profile.phone, 'admin': admin
+    }
+
+
+def _format_date(date):
+    """Return the provided date in the format 'YYYY-MM-DD', or an empty string if it is None."""
+    return '' if date is None else date.strftime('%Y-%m-%d')
+
+
+def _csv_line(values):
+    """Return a line of a CSV file (encoded as UTF-8) containing the provided values."""
+    buf = StringIO()
+    csv.writer(buf).writerow([unicode(value).encode('utf-8') for value in values])
+    return buf.getvalue()
@@ -0,0 +1,126 @@
+"""The cached directory of the chapter's brothers for the gtphipsi.brothers package.
+
+The directory merges the brothers who have accounts with the names of the chapter's early members who do not (see
+gtphipsi.brothers.bootstrap) into two sorted lists, one of undergraduates and one of alumni, and into a registry of
+every brother's name keyed by badge, along with the choices of the 'big brother' fields of forms. It is built with a
+single query and cached (see gtphipsi.caching) until a brother's name, badge, or status changes, or a profile or user
+is deleted, when the BROTHERS_CACHE namespace is invalidated (see gtphipsi.brothers.models). The column layouts of the
+brother list page are cached along with it. Nothing in a directory is ever modified once the directory has been built.
+
+This module exports the following class:
+    - Directory
+
+This module exports the following functions:
+    - get_directory ()
+    - get_listing (num_cols)
+
+"""
+
+from gtphipsi.brothers.bootstrap import INITIAL_BROTHER_LIST
+from gtphipsi.brothers.models import UserProfile, BROTHERS_CACHE
+from gtphipsi.caching import get_cached
+
+
+class Directory(object):
+
+    """A snapshot of the chapter's membership.
+
+    The 'undergrads' and 'alumni' attributes are tuples of (badge, name, has_account) tuples, sorted by badge. The
+    'lowest_undergrad_badge' attribute is the lowest badge of all undergraduates with accounts (or None if there are
+    none); brothers without accounts are listed as undergraduates if their badges are at least that high.
+
+    The names of all brothers (including those who are out of town, who are not listed as undergraduates or alumni) can
+    be looked up by badge with name_for(). A brother with an account is named as in his profile, and other brothers are
+    named as in the list of early members. The 'big_brother_choices' attribute is a tuple of (badge, name) tuples of
+    every brother, sorted by badge, preceded by an empty choice with badge 0.
+
+    """
+
+    def __init__(self, undergrads, alumni, lowest_undergrad_badge, names):
+        """Create a directory from the provided lists of undergraduates and alumni and dictionary of names by badge."""
+        self.undergrads = tuple(undergrads)
+        self.alumni = tuple(alumni)
+        self.lowest_undergrad_badge = lowest_undergrad_badge
+        self._names = dict(names)
+        self.big_brother_choices = ((0, INITIAL_BROTHER_LIST[0][1]),) + tuple(sorted(self._names.items()))
+
+    def __contains__(self, badge):
+        """Return True if a brother (with or without an account) has the provided badge, False otherwise."""
+        return badge in self._names
+
+    def name_for(self, badge):
+        """Return the name of the brother with the provided badge, or None if there is no such brother."""
+        return self._names.get(badge)
+
+    def is_undergrad_badge(self, badge):
+        """Return True if a brother without an account having the provided badge is an undergraduate, False otherwise."""
+        return self.lowest_undergrad_badge is not None and badge >= self.lowest_undergrad_badge
+
+
+def get_directory():
+    """Return the current Directory, building it (with a single query) if it is not cached."""
+    return get_cached(BROTHERS_CACHE, 'directory', _build_directory)
+
+
+def get_listing(num_cols):
+    """Return the column layouts of the brother list page, as a tuple (undergrad_rows, alumni_rows).
+
+    Required parameters:
+        - num_cols  =>  the number of columns in which to list the brothers (as an integer)
+
+    Each layout is a list of rows, and each row is a list of 'num_cols' (badge, name, has_account) tuples, filled in
+    column by column, so that badges increase down each column; empty tuples pad the end of the last column:
+        [ [ (badge, 'First Last', has_account), (badge, 'First Last', has_account) ], [ (...), (...) ], ... ]
+
+    """
+    return get_cached(BROTHERS_CACHE, 'listing:%d' % num_cols, lambda: _build_listing(num_cols))
+
+
+
+
+
+
+## ============================================= ##
+##                                               ##
+##               Private Functions               ##
+##                                               ##
+## ============================================= ##
+
+
+def _build_directory():
+    """Return a new Directory built from the database and the list of the chapter's early members."""
+    undergrads = {}
+    alumni = {}
+    names = {}
+    for profile in UserProfile.objects.select_related('user'):
+        names[profile.badge] = profile.common_name()
+        if profile.status in ('U', 'A'):
+            (undergrads if profile.status == 'U' else alumni)[profile.badge] = (profile.badge, names[profile.badge], True)
+    lowest = min(undergrads) if undergrads else None
+    for badge, name in INITIAL_BROTHER_LIST[1:]:
+        names.setdefault(badge, name)
+        if lowest is not None and badge >= lowest:
+            if badge not in undergrads and badge not in alumni:
+                undergrads[badge] = (badge, name, False)
+        elif badge not in alumni:
+            alumni[badge] = (badge, name, False)
+    return Directory(sorted(undergrads.values()), sorted(alumni.values()), lowest, names)
+
+
+def _build_listing(num_cols):
+    """Return the column layouts of the undergraduates and alumni in the current directory (see get_listing())."""
+    directory = get_directory()
+    return _layout(directory.undergrads, num_cols), _layout(directory.alumni, num_cols)
+
+
+def _layout(entries, num_cols):
+    """Return the provided entries arranged in rows of 'num_cols' entries, filled in column by column."""
+    num_rows = (len(entries) + num_cols - 1) // num_cols
+    rows = []
+    for j in range(num_rows):
+        row = []
+        for i in range(num_cols):
+            index = i * num_rows + j
+            row.append(entries[index] if index < len(entries) else tuple())
+        rows.append(row)
+    return rows
@@ -8,6 +8,9 @@ This module exports the following form classes:
     - NotificationSettingsForm
     - PublicVisibilityForm
     - ChapterVisibilityForm
+    - ImportFileForm
+    - ImportUserForm
+    - GraduateClassForm
 
 This module exports the following widget classes:
     - BrotherSelect
@@ -15,6 +18,7 @@ This module exports the following widget classes:
 """
 
 import hashlib
+import re
 
 from django import forms
 from django.conf import settings
@@ -254,6 +258,73 @@ class ChapterVisibilityForm(forms.ModelForm):
         exclude = ('full_name', 'big_brother', 'major', 'hometown', 'email')
 
 
+class ImportFileForm(forms.Form):
+    """A form to upload a file of new user accounts to be created all at once (see gtphipsi.brothers.bulk)."""
+
+    file = forms.FileField()
+    format = forms.ChoiceField(choices=(('csv', 'CSV'), ('json', 'JSON (one object per line)')), initial='csv')
+
+
+class ImportUserForm(forms.Form):
+    """A form to validate a single row of a file of new user accounts (see gtphipsi.brothers.bulk).
+
+    Unlike the UserForm, this form does not check whether the username and badge number are taken; rows are checked for
+    those in batches, with one query per batch.
+
+    """
+
+    badge = forms.IntegerField(min_value=1)
+    username = forms.CharField(max_length=30)
+    email = forms.EmailField(required=True)
+    first_name = forms.CharField(max_length=30)
+    middle_name = forms.CharField(max_length=30, required=False)
+    last_name = forms.CharField(max_length=30)
+    suffix = forms.ChoiceField(choices=SUFFIX_CHOICES, required=False)
+    nickname = forms.CharField(max_length=30, required=False)
+    status = forms.ChoiceField(choices=STATUS_CHOICES)
+    big_brother = forms.IntegerField(min_value=0, required=False)
+    major = forms.ChoiceField(choices=MAJOR_CHOICES, required=False)
+    hometown = forms.CharField(max_length=50, required=False)
+    current_city = forms.CharField(max_length=50, required=False)
+    initiation = forms.DateField(input_formats=settings.DATE_INPUT_FORMATS, required=False)
+    graduation = forms.DateField(input_formats=settings.DATE_INPUT_FORMATS, required=False)
+    dob = forms.DateField(input_formats=settings.DATE_INPUT_FORMATS, required=False)
+    phone = forms.RegexField(regex=r'^\d{3}-\d{3}-\d{4}$', min_length=12, max_length=12, required=False)
+    admin = forms.BooleanField(required=False)
+
+    def clean_big_brother(self):
+        """Ensure that a brother's big brother is not himself or a younger member (a missing big brother becomes 0)."""
+        badge = self.cleaned_data.get('badge')
+        big_bro_badge = self.cleaned_data.get('big_brother') or 0
+        if badge is not None and big_bro_badge > 0:
+            error = _get_big_bro_error_message(badge, big_bro_badge)
+            if error is not None:
+                self._errors['big_brother'] = self.error_class([error])
+                del self.cleaned_data['big_brother']
+                return None
+        return big_bro_badge
+
+
+class GraduateClassForm(forms.Form):
+    """A form to make alumni of a whole class of brothers at once (see gtphipsi.brothers.bulk)."""
+
+    badges = forms.RegexField(regex=r'^[\d,\s]*$', required=False, help_text='Separated by commas or spaces')
+    graduation = forms.DateField(input_formats=settings.DATE_INPUT_FORMATS, required=False,
+                                 label='Graduating on or before')
+
+    def clean_badges(self):
+        """Return a list of the badges (as integers) typed in the 'badges' field, or None if none were typed."""
+        badges = [int(badge) for badge in re.split(r'[,\s]+', self.cleaned_data.get('badges') or '') if badge]
+        return badges or None
+
+    def clean(self):
+        """Ensure that the user typed either some badges or a graduation date (or both)."""
+        if self.cleaned_data.get('badges') is None and self.cleaned_data.get('graduation') is None \
+                and 'badges' not in self._errors and 'graduation' not in self._errors:
+            raise forms.ValidationError('Enter the badges of the brothers who graduated, a graduation date, or both.')
+        return self.cleaned_data
+
+
 
 
 
@@ -0,0 +1,135 @@
+"""Family trees (big brother and little brother lineages) for the gtphipsi.brothers package.
+
+Every profile stores the badge of the brother's big brother (0 if none). Rather than following those badges one query at
+a time, the FamilyTree class loads every (badge, big brother) pair at once and answers questions about lineages (who a
+brother's ancestors and descendants are, how deep in his family he is, and so on) in memory. The tree of the whole
+chapter is cached (see gtphipsi.caching) until a brother's big brother or visibility settings change.
+
+Only brothers who show their big brothers to the chapter (see VisibilitySettings) are linked to them in the tree.
+
+This module exports the following class:
+    - FamilyTree
+
+This module exports the following function:
+    - get_family_tree ()
+
+"""
+
+from gtphipsi.brothers.models import UserProfile, BROTHERS_CACHE
+from gtphipsi.caching import get_cached
+
+
+class FamilyTree(object):
+
+    """A forest of brothers, in which each brother's parent is his big brother.
+
+    A tree is built from (badge, big brother's badge) pairs, in which a big brother's badge of 0 means the brother has no
+    big brother. Every method runs without recursion, so arbitrarily long lineages are handled, and no method loops
+    forever if the data contain a cycle (e.g., two brothers listed as each other's big brothers); the cycle is cut
+    where it is first detected.
+
+    """
+
+    def __init__(self, edges):
+        """Create a tree from the provided iterable of (badge, big brother's badge) pairs."""
+        self._bigs = {}
+        littles = {}
+        for badge, big in edges:
+            if big and big != badge:
+                self._bigs[badge] = big
+                littles.setdefault(big, []).append(badge)
+        self._littles = dict((big, tuple(sorted(badges))) for big, badges in littles.items())
+
+    def __contains__(self, badge):
+        """Return True if the brother with the provided badge has a big brother or a little brother, False otherwise."""
+        return badge in self._bigs or badge in self._littles
+
+    def big_brother(self, badge):
+        """Return the badge of the big brother of the brother with the provided badge, or None if he has none."""
+        return self._bigs.get(badge)
+
+    def little_brothers(self, badge):
+        """Return a tuple of the badges of the little brothers of the brother with the provided badge, sorted by badge."""
+        return self._littles.get(badge, ())
+
+    def ancestors(self, badge):
+        """Return a list of the badges of the brother's big brother, his big brother's big brother, and so on."""
+        result = []
+        seen = set([badge])
+        big = self._bigs.get(badge)
+        while big is not None and big not in seen:
+            result.append(big)
+            seen.add(big)
+            big = self._bigs.get(big)
+        return result
+
+    def depth(self, badge):
+        """Return the number of ancestors of the brother with the provided badge (0 for the founder of a family)."""
+        return len(self.ancestors(badge))
+
+    def root(self, badge):
+        """Return the badge of the founder of the brother's family (the brother himself if he has no big brother)."""
+        ancestors = self.ancestors(badge)
+        return ancestors[-1] if ancestors else badge
+
+    def family_line(self, badge):
+        """Return a list of the badges in the brother's line, from the founder of his family down to the brother."""
+        line = self.ancestors(badge)
+        line.reverse()
+        line.append(badge)
+        return line
+
+    def walk(self, badge):
+        """Return a list of (depth, badge) tuples for the brother and all of his descendants, in depth-first order.
+
+        Depths are relative to the provided brother (whose depth is 0), and little brothers are visited in order of badge,
+        so the list can be rendered as an indented outline of the brother's part of his family.
+
+        """
+        result = []
+        seen = set()
+        stack = [(0, badge)]
+        while stack:
+            depth, current = stack.pop()
+            if current in seen:
+                continue
+            seen.add(current)
+            result.append((depth, current))
+            for little in reversed(self._littles.get(current, ())):
+                stack.append((depth + 1, little))
+        return result
+
+    def descendants(self, badge):
+        """Return a list of the badges of the brother's little brothers, their little brothers, and so on."""
+        return [descendant for depth, descendant in self.walk(badge)[1:]]
+
+    def family(self, badge):
+        """Return a list of the badges of every brother in the brother's family, starting with its founder."""
+        return [member for depth, member in self.walk(self.root(badge))]
+
+    def roots(self):
+        """Return a sorted list of the badges of the founders of all families (brothers with littles but no big)."""
+        return sorted(badge for badge in self._littles if badge not in self._bigs)
+
+
+def get_family_tree():
+    """Return the FamilyTree of the whole chapter, building it (with a single query) if it is not cached."""
+    return get_cached(BROTHERS_CACHE, 'family_tree', _build_family_tree)
+
+
+
+
+
+
+## ============================================= ##
+##                                               ##
+##               Private Functions               ##
+##                                               ##
+## ============================================= ##
+
+
+def _build_family_tree():
+    """Return a new FamilyTree of every brother who shows his big brother to the chapter."""
+    edges = UserProfile.objects.filter(chapter_visibility__big_brother=True, big_brother__gt=0) \
+            .values_list('badge', 'big_brother')
+    return FamilyTree(edges)
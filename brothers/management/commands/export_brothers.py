@@ -0,0 +1,37 @@
+"""Management command to write the accounts of all brothers to a file, for the gtphipsi.brothers package.
+
+Run this command with 'python manage.py export_brothers' to write a CSV file to standard output, or with the
+'--format=json' option to write one JSON object per line. The '--output' option writes to a file instead. The rows have
+the same fields as the files read by the 'import_brothers' command.
+
+"""
+
+import sys
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from gtphipsi.brothers.bulk import export_rows, FORMATS
+
+
+class Command(NoArgsCommand):
+    """Write a row for the account of every brother, ordered by badge."""
+
+    help = 'Write a row for the account of every brother, ordered by badge.'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--format', type='choice', choices=FORMATS, dest='format', default='csv',
+                    help='The format of the file: csv (the default) or json (one object per line).'),
+        make_option('--output', dest='output', default=None,
+                    help='The file to write (default: standard output).'),
+    )
+
+    def handle_noargs(self, **options):
+        """Write the export one line at a time."""
+        output = options.get('output')
+        stream = sys.stdout if output is None else open(output, 'wb')
+        try:
+            for line in export_rows(options.get('format')):
+                stream.write(line)
+        finally:
+            if output is not None:
+                stream.close()
@@ -0,0 +1,44 @@
+"""Management command to make alumni of a whole graduating class at once, for the gtphipsi.brothers package.
+
+Run this command with 'python manage.py graduate_class <badge> [<badge> ...]' to graduate the brothers with the given
+badges, or with the '--date' option (e.g., '--date=2012-05-05') to graduate every brother whose graduation date is on or
+before the given date; if both are given, only brothers matching both graduate. Brothers who are already alumni are not
+affected.
+
+"""
+
+from datetime import datetime
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gtphipsi.brothers.bulk import graduate_class
+
+
+class Command(BaseCommand):
+    """Change the status of each matching brother to alumnus and move him from the Undergraduates to the Alumni group."""
+
+    args = '[<badge> ...]'
+    help = 'Change the status of each matching brother to alumnus and move him from the Undergraduates to the Alumni group.'
+    option_list = BaseCommand.option_list + (
+        make_option('--date', dest='date', default=None,
+                    help='Graduate brothers graduating on or before this date (in the format YYYY-MM-DD).'),
+    )
+
+    def handle(self, *args, **options):
+        """Graduate the matching brothers in a single transaction."""
+        try:
+            badges = [int(badge) for badge in args] or None
+        except ValueError:
+            raise CommandError('Badges must be integers.')
+        date = options.get('date')
+        if date is not None:
+            try:
+                date = datetime.strptime(date, '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Dates must be in the format YYYY-MM-DD.')
+        if badges is None and date is None:
+            raise CommandError('Usage: graduate_class %s [--date=YYYY-MM-DD]' % self.args)
+        num_graduated = graduate_class(badges, date)
+        if int(options.get('verbosity', 1)) > 0:
+            self.stdout.write('Graduated %d brothers.\n' % num_graduated)
@@ -0,0 +1,45 @@
+"""Management command to create many user accounts at once from a file, for the gtphipsi.brothers package.
+
+Run this command with 'python manage.py import_brothers <file>' to import a CSV file, or with the '--format=json' option
+to import a file containing one JSON object per line (see gtphipsi.brothers.bulk for the fields of each row). If any row
+of the file is invalid, the problems are listed and no accounts are created.
+
+"""
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gtphipsi.brothers.bulk import import_users, read_rows, BATCH_SIZE, FORMATS
+
+
+class Command(BaseCommand):
+    """Validate every row of the provided file, then create an account for each row."""
+
+    args = '<file>'
+    help = 'Validate every row of the provided file, then create an account for each row.'
+    option_list = BaseCommand.option_list + (
+        make_option('--format', type='choice', choices=FORMATS, dest='format', default='csv',
+                    help='The format of the file: csv (the default) or json (one object per line).'),
+        make_option('--batch-size', type='int', dest='batch_size', default=BATCH_SIZE,
+                    help='The number of rows to validate and insert at a time (default: %d).' % BATCH_SIZE),
+    )
+
+    def handle(self, *args, **options):
+        """Import the file, reporting either the number of accounts created or every invalid row."""
+        if len(args) != 1:
+            raise CommandError('Usage: import_brothers %s' % self.args)
+        try:
+            stream = open(args[0], 'rb')
+        except IOError as e:
+            raise CommandError('Could not open %s: %s' % (args[0], e))
+        try:
+            num_created, errors = import_users(read_rows(stream, options.get('format')), options.get('batch_size'))
+        finally:
+            stream.close()
+        if errors:
+            for number, message in errors:
+                self.stderr.write('Row %d: %s\n' % (number, message))
+            raise CommandError('No accounts were created because %d rows were invalid.' % len(set(n for n, m in errors)))
+        if int(options.get('verbosity', 1)) > 0:
+            self.stdout.write('Created %d accounts.\n' % num_created)
@@ -0,0 +1,30 @@
+"""Management command to copy the status bits of every profile to their indexed fields in the gtphipsi.brothers package.
+
+The indexed fields (see STATUS_BIT_FIELDS in gtphipsi.brothers.models) are kept in sync as profiles are saved, but
+profiles that existed before the fields did all start out with every field set to False. Run this command with
+'python manage.py sync_status_flags' after adding the new columns to an existing database ('python manage.py sqlall
+brothers' shows their definitions and indexes), or at any time the recipients of notifications appear to be out of sync
+with the brothers' notification settings.
+
+"""
+
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+
+from gtphipsi.brothers.models import UserProfile, STATUS_BIT_FIELDS
+
+
+class Command(NoArgsCommand):
+    """Set each indexed status field of every profile from the profile's status bits."""
+
+    help = 'Set each indexed status field of every profile from the profile\'s status bits.'
+
+    @transaction.commit_on_success
+    def handle_noargs(self, **options):
+        """Update all profiles with two statements per status bit (one for profiles having it, one for the rest)."""
+        verbosity = int(options.get('verbosity', 1))
+        for bit, field in sorted(STATUS_BIT_FIELDS.items()):
+            num_set = UserProfile.objects.extra(where=['(bits & %s) > 0'], params=[bit]).update(**{field: True})
+            UserProfile.objects.extra(where=['(bits & %s) = 0'], params=[bit]).update(**{field: False})
+            if verbosity > 0:
+                self.stdout.write('%s: %d profiles\n' % (field, num_set))
@@ -10,15 +10,23 @@ This module exports the following tuples of field choices:
     - STATUS_CHOICES
     - MAJOR_CHOICES
 
-This module exports the following dictionary, mapping 'status' strings to unique bits:
+This module exports the following dictionaries, mapping 'status' strings to unique bits and bits to indexed fields:
     - STATUS_BITS
+    - STATUS_BIT_FIELDS
+
+This module exports the following constant definitions:
+    - BROTHERS_CACHE
 
 """
 
-from django.contrib.auth.models import User
+from django.contrib.auth.models import Group, Permission, User
 from django.contrib.localflavor.us.models import PhoneNumberField
 from django.core.urlresolvers import reverse
 from django.db import models
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save
+
+from gtphipsi.brothers.permissions import forget_account_groups, invalidate_group_perms
+from gtphipsi.caching import bump_version
 
 
 # Maps 'status' strings to unique bits. A user may have multiple 'status' bits set in the 'bits' field of his profile.
@@ -30,6 +38,23 @@ STATUS_BITS = {
     'EMAIL_NEW_ANNOUNCEMENT':   0x10
 }
 
+# Maps each status bit to the indexed boolean field of UserProfile that mirrors it. The 'bits' field remains the record
+# of a user's status; the boolean fields are copied from it whenever a profile is saved, so that profiles having a given
+# bit can be found with an index rather than by testing the bits of every profile. They are ONLY copied by save(): code
+# that changes 'bits' with QuerySet.update() or creates profiles with bulk_create() must set the boolean fields itself,
+# or the profiles will silently be missed by all_profiles_with_bit() (the 'sync_status_flags' command repairs them).
+STATUS_BIT_FIELDS = {
+    STATUS_BITS['LOCKED_OUT']:              'locked_out',
+    STATUS_BITS['PASSWORD_RESET']:          'password_reset',
+    STATUS_BITS['EMAIL_NEW_INFOCARD']:      'email_new_infocard',
+    STATUS_BITS['EMAIL_NEW_CONTACT']:       'email_new_contact',
+    STATUS_BITS['EMAIL_NEW_ANNOUNCEMENT']:  'email_new_announcement'
+}
+
+
+# The cache namespace of everything derived from the chapter's membership (e.g., the directory of brothers).
+BROTHERS_CACHE = 'brothers'
+
 
 # Possible suffixes for names.
 SUFFIX_CHOICES = (
@@ -146,20 +171,36 @@ class UserProfile(models.Model):
     phone = PhoneNumberField(blank=True)
     bits = models.IntegerField(blank=True, default=0)
 
+    # copies of the status bits (see STATUS_BIT_FIELDS), kept in sync with 'bits' by save() only, not by bulk updates
+    locked_out = models.BooleanField(default=False, db_index=True, editable=False)
+    password_reset = models.BooleanField(default=False, db_index=True, editable=False)
+    email_new_infocard = models.BooleanField(default=False, db_index=True, editable=False)
+    email_new_contact = models.BooleanField(default=False, db_index=True, editable=False)
+    email_new_announcement = models.BooleanField(default=False, db_index=True, editable=False)
+
     public_visibility = models.ForeignKey(VisibilitySettings, blank=False, null=True, related_name='public_profiles')
     chapter_visibility = models.ForeignKey(VisibilitySettings, blank=False, null=True, related_name='chapter_profiles')
 
     @classmethod
     def all_profiles_with_bit(cls, bit=0):
-        """Return a list of all user profiles having the specified status bit."""
-        return cls.objects.raw('SELECT * FROM brothers_userprofile WHERE (bits & %s) > 0', [bit])
+        """Return a queryset of all user profiles having any of the specified status bits."""
+        query = None
+        for flag, field in STATUS_BIT_FIELDS.items():
+            if bit & flag:
+                q = models.Q(**{field: True})
+                query = q if query is None else query | q
+        return cls.objects.none() if query is None else cls.objects.filter(query)
 
     @classmethod
     def all_emails_with_bit(cls, bit=0):
-        """Return a list of the email addresses of all user profiles having the specified status bit."""
-        query = 'SELECT u.id, u.email FROM auth_user u JOIN brothers_userprofile b ON (b.user_id = u.id) WHERE (b.bits & %s) > 0'
-        queryset = cls.objects.raw(query, [bit])
-        return [user.email for user in queryset]
+        """Return a list of the email addresses of all user profiles having any of the specified status bits."""
+        return list(cls.all_profiles_with_bit(bit).values_list('user__email', flat=True))
+
+    def save(self, *args, **kwargs):
+        """Copy the status bits to their indexed fields, then save the profile."""
+        for flag, field in STATUS_BIT_FIELDS.items():
+            setattr(self, field, self.has_bit(flag))
+        super(UserProfile, self).save(*args, **kwargs)
 
     def __unicode__(self):
         """Return a Unicode string representation of the user profile."""
@@ -194,13 +235,19 @@ class UserProfile(models.Model):
         """Return True if the brother is currently an active undergraduate, False otherwise."""
         return self.status == 'U'
 
+    def group_names(self):
+        """Return a frozenset of the names of the groups to which the brother belongs, loading them at most once."""
+        if not hasattr(self, '_group_names'):
+            self._group_names = frozenset(self.user.groups.values_list('name', flat=True))
+        return self._group_names
+
     def is_admin(self):
         """Return True if the brother is an administrator (i.e., a member of the Administrators group), False otherwise."""
-        return self.user.groups.filter(name='Administrators').count() > 0
+        return 'Administrators' in self.group_names()
 
     def get_little_brothers(self):
         """Return the set of UserProfile objects having the user as their big brother."""
-        return self.objects.filter(big_brother=self.badge)
+        return UserProfile.objects.filter(big_brother=self.badge)
 
     def has_bit(self, bit):
         """Return True if the brother has the specified bit set, False otherwise."""
@@ -224,3 +271,58 @@ class EmailChangeRequest(models.Model):
     user = models.ForeignKey(User)
     email = models.EmailField()
     hash = models.CharField(max_length=64)
+
+
+# Discard the cached group permissions whenever a group's permissions or members change, or a group is deleted (and
+# the cached IDs of the account groups whenever a group is saved or deleted, since it may have been renamed).
+m2m_changed.connect(invalidate_group_perms, sender=Group.permissions.through,
+                    dispatch_uid='gtphipsi.brothers.models.group_permissions_changed')
+m2m_changed.connect(invalidate_group_perms, sender=User.groups.through,
+                    dispatch_uid='gtphipsi.brothers.models.group_members_changed')
+post_delete.connect(invalidate_group_perms, sender=Group, dispatch_uid='gtphipsi.brothers.models.group_deleted')
+post_save.connect(forget_account_groups, sender=Group, dispatch_uid='gtphipsi.brothers.models.account_group_saved')
+post_delete.connect(forget_account_groups, sender=Group, dispatch_uid='gtphipsi.brothers.models.account_group_deleted')
+post_delete.connect(invalidate_group_perms, sender=Permission, dispatch_uid='gtphipsi.brothers.models.permission_deleted')
+
+
+def _invalidate_brothers(sender, **kwargs):
+    """Discard everything cached about the chapter's membership (e.g., when a profile or user is deleted)."""
+    bump_version(BROTHERS_CACHE)
+
+
+# The fields of users and profiles from which the values cached in BROTHERS_CACHE are derived (names, badges, status,
+# big brothers, and which settings decide whether a brother's big brother is shown). Saving a user or profile only
+# invalidates the cache if one of these fields has changed, so that logging in or changing a status bit does not.
+_DIRECTORY_FIELDS = {
+    User: ('first_name', 'last_name', 'email'),
+    UserProfile: ('badge', 'status', 'big_brother', 'middle_name', 'suffix', 'nickname', 'chapter_visibility_id')
+}
+
+
+def _remember_directory_values(sender, instance, **kwargs):
+    """Remember the directory fields of a newly loaded user or profile, to compare with them when it is saved."""
+    instance._directory_values = _get_directory_values(sender, instance)
+
+
+def _invalidate_brothers_if_changed(sender, instance, created, **kwargs):
+    """Discard the cached membership of the chapter if a saved user's or profile's directory fields changed."""
+    values = _get_directory_values(sender, instance)
+    if created or values != getattr(instance, '_directory_values', None):
+        instance._directory_values = values
+        bump_version(BROTHERS_CACHE)
+
+
+def _get_directory_values(model, instance):
+    """Return a tuple of the values of the fields of the provided user or profile listed in _DIRECTORY_FIELDS."""
+    # read from the instance's dictionary, since reading a deferred field would run a query
+    return tuple(instance.__dict__.get(field) for field in _DIRECTORY_FIELDS[model])
+
+post_init.connect(_remember_directory_values, sender=UserProfile,
+                  dispatch_uid='gtphipsi.brothers.models.profile_loaded')
+post_save.connect(_invalidate_brothers_if_changed, sender=UserProfile,
+                  dispatch_uid='gtphipsi.brothers.models.profile_saved')
+post_delete.connect(_invalidate_brothers, sender=UserProfile, dispatch_uid='gtphipsi.brothers.models.profile_deleted')
+post_init.connect(_remember_directory_values, sender=User, dispatch_uid='gtphipsi.brothers.models.user_loaded')
+post_save.connect(_invalidate_brothers_if_changed, sender=User, dispatch_uid='gtphipsi.brothers.models.user_saved')
+post_delete.connect(_invalidate_brothers, sender=User, dispatch_uid='gtphipsi.brothers.models.user_deleted')
+post_save.connect(_invalidate_brothers, sender=VisibilitySettings, dispatch_uid='gtphipsi.brothers.models.visibility_saved')
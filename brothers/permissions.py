@@ -0,0 +1,91 @@
+"""Cached group permissions for the gtphipsi.brothers package.
+
+Templates decide which links and buttons to show by checking whether a permission's codename is in 'group_perms', the
+set of codenames of the permissions granted to the current user's groups. The set for each user is computed with a
+single query and then cached under a version number shared by all users (see gtphipsi.caching). Whenever a group, a
+group's permissions, or a group's members change, the version is bumped, so every user's set is recomputed the next
+time it is needed, and the change takes effect immediately, even for users who are already signed in. The number of
+members of each group, shown on the group administration pages, is cached under the same version.
+
+The IDs of the groups to which accounts are added according to their status (see ACCOUNT_GROUPS) are cached under a
+version of their own, since they are needed every time an account is created or changes status; the version is bumped
+whenever a group is saved or deleted, so no process keeps using the ID of a group that no longer exists.
+
+This module exports the following functions:
+    - get_group_perms (user)
+    - get_member_counts ()
+    - invalidate_group_perms ()
+    - get_account_group_id (name)
+    - forget_account_groups ()
+
+This module exports the following constant definitions:
+    - PERMISSIONS_CACHE
+    - ACCOUNT_GROUPS_CACHE
+    - ACCOUNT_GROUPS
+
+"""
+
+from django.conf import settings
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.db.models import Count
+
+from gtphipsi.caching import bump_version, get_cached, versioned_key
+
+
+# The cache namespace of the users' sets of group permissions.
+PERMISSIONS_CACHE = 'permissions'
+
+# The cache namespace of the IDs of the groups named in ACCOUNT_GROUPS.
+ACCOUNT_GROUPS_CACHE = 'account_groups'
+
+# The groups to which accounts are added according to their status, mapped to the names of the settings listing the
+# permissions to grant each group when it is created.
+ACCOUNT_GROUPS = {
+    'Undergraduates': 'UNDERGRADUATE_PERMISSIONS',
+    'Alumni': 'ALUMNI_PERMISSIONS',
+    'Administrators': 'ADMINISTRATOR_PERMISSIONS'
+}
+
+
+def get_group_perms(user):
+    """Return a frozenset of the codenames of the permissions granted to the groups to which the provided user belongs."""
+    if not user.is_authenticated():
+        return frozenset()
+    return get_cached(PERMISSIONS_CACHE, str(user.id), lambda: frozenset(
+        Permission.objects.filter(group__user=user).values_list('codename', flat=True)))
+
+
+def get_member_counts():
+    """Return a dictionary mapping the ID of every group to the number of users belonging to it."""
+    return get_cached(PERMISSIONS_CACHE, 'member_counts', lambda: dict(
+        Group.objects.annotate(num_members=Count('user')).values_list('id', 'num_members')))
+
+
+def invalidate_group_perms(**kwargs):
+    """Discard every user's cached set of group permissions (this function may be connected to any signal)."""
+    bump_version(PERMISSIONS_CACHE)
+
+
+def get_account_group_id(name):
+    """Return the ID of the group with the provided name (one of ACCOUNT_GROUPS), creating the group if necessary.
+
+    When the group is created, it is granted the permissions listed in the setting named for it in ACCOUNT_GROUPS. The ID
+    of a group created by this call is not cached, since the transaction creating it may yet be rolled back.
+
+    """
+    key = versioned_key(ACCOUNT_GROUPS_CACHE, name)
+    group_id = cache.get(key)
+    if group_id is None:
+        group, created = Group.objects.get_or_create(name=name)
+        if created:
+            group.permissions = Permission.objects.filter(codename__in=getattr(settings, ACCOUNT_GROUPS[name], []))
+        else:
+            cache.set(key, group.id)
+        group_id = group.id
+    return group_id
+
+
+def forget_account_groups(**kwargs):
+    """Discard the cached IDs of the groups named in ACCOUNT_GROUPS (this function may be connected to any signal)."""
+    bump_version(ACCOUNT_GROUPS_CACHE)
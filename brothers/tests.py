@@ -5,7 +5,23 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
-from django.test import TestCase
+from datetime import date, datetime
+
+from django.contrib.auth.models import AnonymousUser, Group, User
+from django.db import IntegrityError
+from django.test import TestCase, TransactionTestCase
+from django.test.client import RequestFactory
+
+from gtphipsi.brothers.bulk import _create_accounts, export_rows, graduate_class, import_users, read_rows, validate_rows
+from gtphipsi.brothers.directory import get_directory
+from gtphipsi.brothers.forms import ImportUserForm
+from gtphipsi.brothers.lineage import FamilyTree, get_family_tree
+from gtphipsi.brothers.models import UserProfile, VisibilitySettings, BROTHERS_CACHE, STATUS_BITS
+from gtphipsi.brothers.permissions import forget_account_groups, get_account_group_id
+from gtphipsi.brothers.views import _get_group_members
+from gtphipsi.caching import get_version
+from gtphipsi.common import log_page_view
+from gtphipsi.middleware import UserProfileMiddleware
 
 
 class SimpleTest(TestCase):
@@ -14,3 +30,329 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class UserProfileMiddlewareTest(TestCase):
+    """Tests that a request's profile is loaded once and then shared by everything that uses it."""
+
+    def setUp(self):
+        """Create an administrator with a profile and visibility settings."""
+        user = User.objects.create_user('brother', 'brother@example.com', 'password')
+        user.groups.add(Group.objects.create(name='Administrators'))
+        UserProfile.objects.create(user=user, badge=1, public_visibility=VisibilitySettings.objects.create(),
+                                   chapter_visibility=VisibilitySettings.objects.create())
+        self.user_id = user.id
+
+    def get_request(self):
+        """Return a request from the administrator that has been through the middleware."""
+        request = RequestFactory().get('/')
+        request.user = User.objects.get(id=self.user_id)
+        UserProfileMiddleware().process_request(request)
+        return request
+
+    def use_profile(self, request):
+        """Use the request's profile the way a typical view does: log the view, check permissions, and show settings."""
+        log_page_view(request, 'Test')
+        request.user.get_profile().common_name()
+        request.profile.is_admin()
+        request.profile.is_admin()
+        request.profile.public_visibility.full_name
+        request.profile.chapter_visibility.full_name
+
+    def test_profile_loaded_once(self):
+        """One query loads the profile, its user, and its visibility settings; one more loads the user's groups."""
+        request = self.get_request()
+        self.assertNumQueries(2, self.use_profile, request)
+        self.assertNumQueries(0, self.use_profile, request)
+        self.assertEqual(request.user.get_profile(), request.profile)
+        self.assertNumQueries(0, request.user.get_profile)
+
+    def test_anonymous_user(self):
+        """An anonymous user has no profile, and finding that out takes no queries."""
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        UserProfileMiddleware().process_request(request)
+        self.assertNumQueries(0, lambda: request.profile)
+        self.assertEqual(request.profile, None)
+
+
+class FamilyTreeTest(TestCase):
+    """Tests lineage questions on a synthetic chapter of 10,000 brothers, in which the big brother of badge n is n / 3."""
+
+    num_badges = 10000
+
+    def setUp(self):
+        """Build the synthetic tree (badges 1 and 2 found the only two families)."""
+        self.tree = FamilyTree((badge, badge // 3) for badge in range(1, self.num_badges + 1))
+
+    def test_ancestors(self):
+        """A brother's ancestors are found by repeatedly dividing his badge by 3."""
+        self.assertEqual(self.tree.ancestors(10000), [3333, 1111, 370, 123, 41, 13, 4, 1])
+        self.assertEqual(self.tree.ancestors(1), [])
+        self.assertEqual(self.tree.big_brother(10000), 3333)
+        self.assertEqual(self.tree.big_brother(2), None)
+
+    def test_family_line_and_depth(self):
+        """A brother's family line runs from the founder of his family down to himself."""
+        self.assertEqual(self.tree.family_line(10000), [1, 4, 13, 41, 123, 370, 1111, 3333, 10000])
+        self.assertEqual(self.tree.depth(10000), 8)
+        self.assertEqual(self.tree.depth(2), 0)
+        self.assertEqual(self.tree.root(4374), 2)
+        self.assertEqual(self.tree.root(6561), 1)
+
+    def test_descendants(self):
+        """Every brother is a descendant of exactly one founder, and the littles of n are 3n, 3n + 1, and 3n + 2."""
+        self.assertEqual(self.tree.roots(), [1, 2])
+        self.assertEqual(self.tree.little_brothers(5), (15, 16, 17))
+        self.assertEqual(self.tree.little_brothers(4000), ())
+        first, second = self.tree.descendants(1), self.tree.descendants(2)
+        self.assertEqual(len(first) + len(second) + 2, self.num_badges)
+        self.assertEqual(set(first + second + [1, 2]), set(range(1, self.num_badges + 1)))
+        self.assertEqual(self.tree.descendants(1111), [3333, 9999, 10000, 3334, 3335])
+
+    def test_walk(self):
+        """A walk visits a brother's littles in order of badge, each followed by its own littles."""
+        self.assertEqual(self.tree.walk(1111), [(0, 1111), (1, 3333), (2, 9999), (2, 10000), (1, 3334), (1, 3335)])
+        self.assertEqual(self.tree.family(10000)[:3], [1, 3, 9])
+
+    def test_long_chain(self):
+        """A single line of 10,000 brothers is handled without recursion."""
+        tree = FamilyTree((badge, badge - 1) for badge in range(1, self.num_badges + 1))
+        self.assertEqual(tree.depth(self.num_badges), self.num_badges - 1)
+        self.assertEqual(len(tree.descendants(1)), self.num_badges - 1)
+        self.assertEqual(tree.roots(), [1])
+
+    def test_cycle(self):
+        """Brothers listed as each other's big brothers do not cause an infinite loop."""
+        tree = FamilyTree([(1, 2), (2, 1), (3, 1), (4, 4)])
+        self.assertEqual(tree.ancestors(3), [1, 2])
+        self.assertEqual(sorted(tree.descendants(1)), [2, 3])
+        self.assertEqual(tree.big_brother(4), None)
+        self.assertEqual(tree.roots(), [])
+
+
+class GetFamilyTreeTest(TestCase):
+    """Tests that the chapter's family tree is loaded in one query, cached, and rebuilt when a profile changes."""
+
+    def create_profile(self, badge, big_brother, show_big=True):
+        """Create and return a profile with the provided badge and big brother."""
+        user = User.objects.create_user('brother%d' % badge, 'brother%d@example.com' % badge, 'password')
+        return UserProfile.objects.create(user=user, badge=badge, big_brother=big_brother,
+                                          public_visibility=VisibilitySettings.objects.create(),
+                                          chapter_visibility=VisibilitySettings.objects.create(big_brother=show_big))
+
+    def test_cached_tree(self):
+        """Hidden big brothers are left out, and saving a profile discards the cached tree."""
+        self.create_profile(1, 0)
+        self.create_profile(2, 1)
+        profile = self.create_profile(3, 1, show_big=False)
+        with self.assertNumQueries(1):
+            tree = get_family_tree()
+        self.assertEqual(tree.little_brothers(1), (2,))
+        self.assertNumQueries(0, get_family_tree)
+        profile.big_brother = 2
+        profile.save()
+        profile.chapter_visibility.big_brother = True
+        profile.chapter_visibility.save()
+        self.assertEqual(get_family_tree().family_line(3), [1, 2, 3])
+
+
+class InvalidateBrothersTest(TestCase):
+    """Tests that the cached directory is only discarded when a field it is built from changes."""
+
+    def test_unrelated_changes(self):
+        """Logging in and changing a status bit keep the cache; changing a name or status discards it."""
+        profile = _create_profile(1, 'brother')
+        profile = UserProfile.objects.select_related('user').get(id=profile.id)
+        version = get_version(BROTHERS_CACHE)
+        profile.user.last_login = datetime.now()
+        profile.user.save()
+        profile.set_bit(STATUS_BITS['EMAIL_NEW_ANNOUNCEMENT'])
+        profile.save()
+        self.assertEqual(get_version(BROTHERS_CACHE), version)
+        profile.user.first_name = 'George'
+        profile.user.save()
+        self.assertNotEqual(get_version(BROTHERS_CACHE), version)
+        version = get_version(BROTHERS_CACHE)
+        profile.status = 'A'
+        profile.save()
+        self.assertNotEqual(get_version(BROTHERS_CACHE), version)
+
+
+class ImportUsersTest(TestCase):
+    """Tests the validation of import files and the accounts created from them."""
+
+    def setUp(self):
+        """Discard the account group IDs cached by earlier tests, whose groups were rolled back."""
+        forget_account_groups()
+
+    def test_duplicates_in_file(self):
+        """Usernames and badges may not repeat within a file, whether in the same batch or in different batches."""
+        rows = [_import_row(1, 'first'), _import_row(2, 'first'), _import_row(1, 'third'), _import_row(4, 'fourth')]
+        for batch_size in (1, 2, 10):
+            cleaned, errors = validate_rows(rows, batch_size)
+            self.assertEqual([data['username'] for data in cleaned], ['first', 'fourth'])
+            self.assertEqual([number for number, message in errors], [2, 3])
+            self.assertTrue(errors[0][1].startswith('username:') and errors[1][1].startswith('badge:'))
+
+    def test_duplicates_in_database(self):
+        """Usernames and badges of existing accounts are checked with one query each per batch."""
+        _create_profile(1, 'taken')
+        rows = [_import_row(2, 'taken'), _import_row(1, 'other'), _import_row(3, 'free'), None, _import_row(0, 'zero')]
+        with self.assertNumQueries(2):
+            cleaned, errors = validate_rows(rows)
+        self.assertEqual([data['username'] for data in cleaned], ['free'])
+        self.assertEqual(sorted(number for number, message in errors), [1, 2, 4, 5])
+
+    def test_nothing_created_on_error(self):
+        """If any row is invalid, no accounts are created."""
+        num_created, errors = import_users([_import_row(1, 'good'), _import_row(2, 'bad', email='nope')])
+        self.assertEqual((num_created, len(errors)), (0, 1))
+        self.assertEqual(User.objects.count(), 0)
+
+    def test_accounts_created(self):
+        """Users, profiles, visibility settings, and group memberships are created for every row, in batches."""
+        existing = _create_profile(1, 'existing')
+        rows = [_import_row(2, 'undergrad', big_brother='1'), _import_row(3, 'alumnus', status='A'),
+                _import_row(4, 'admin', admin='True')]
+        self.assertEqual(import_users(rows, batch_size=2), (3, []))
+        profile = UserProfile.objects.select_related('user').get(badge=2)
+        self.assertEqual((profile.user.username, profile.big_brother, profile.status), ('undergrad', 1, 'U'))
+        self.assertFalse(profile.user.has_usable_password())
+        self.assertFalse(profile.public_visibility.full_name)
+        self.assertTrue(profile.chapter_visibility.full_name)
+        self.assertEqual(VisibilitySettings.objects.count(), 8)
+        settings_ids = UserProfile.objects.filter(badge__gt=1).values_list('public_visibility', 'chapter_visibility')
+        self.assertEqual(len(set(id for pair in settings_ids for id in pair)), 6)
+        self.assertEqual(_group_names(2), ['Undergraduates'])
+        self.assertEqual(_group_names(3), ['Alumni'])
+        self.assertEqual(_group_names(4), ['Administrators', 'Undergraduates'])
+        self.assertEqual(User.objects.filter(id__gt=existing.user_id).count(), 3)
+        # accounts can still be created one at a time after an import, without reusing any of its IDs
+        later = _create_profile(5, 'later')
+        self.assertTrue(later.user_id > UserProfile.objects.get(badge=4).user_id)
+        self.assertTrue(later.id > UserProfile.objects.get(badge=4).id)
+
+    def test_export_and_import(self):
+        """An export file can be imported into an empty database, recreating the same accounts."""
+        rows = [_import_row(1, 'first', middle_name=u'J\xfcrgen', graduation='2012-05-01', phone='404-555-1852'),
+                _import_row(2, 'second', status='A', big_brother='1', admin='True')]
+        self.assertEqual(import_users(rows), (2, []))
+        for format in ('csv', 'json'):
+            lines = list(export_rows(format))
+            before = list(read_rows(lines, format))
+            UserProfile.objects.all().delete()
+            User.objects.all().delete()
+            self.assertEqual(import_users(read_rows(lines, format)), (2, []))
+            after = list(read_rows(list(export_rows(format)), format))
+            self.assertEqual(after, before)
+        self.assertEqual(UserProfile.objects.get(badge=1).middle_name, u'J\xfcrgen')
+        self.assertEqual(_group_names(2), ['Administrators', 'Alumni'])
+
+
+class CreateAccountsRollbackTest(TransactionTestCase):
+    """Tests that accounts are created all or nothing, even when a later batch fails to insert."""
+
+    def setUp(self):
+        """Discard the account group IDs cached by earlier tests, whose groups were rolled back."""
+        forget_account_groups()
+
+    def test_rollback(self):
+        """A failed insert in the second batch also undoes the first batch."""
+        cleaned = []
+        for badge in (1, 2):
+            form = ImportUserForm(_import_row(badge, 'same'))  # the same username, which validate_rows() would reject
+            self.assertTrue(form.is_valid())
+            cleaned.append(form.cleaned_data)
+        self.assertRaises(IntegrityError, _create_accounts, cleaned, 1)
+        self.assertEqual((User.objects.count(), UserProfile.objects.count(), VisibilitySettings.objects.count()),
+                         (0, 0, 0))
+
+
+class GraduateClassTest(TestCase):
+    """Tests that graduating a class updates statuses and swaps group memberships, creating the groups if necessary."""
+
+    def setUp(self):
+        """Discard the account group IDs cached by earlier tests, whose groups were rolled back."""
+        forget_account_groups()
+
+    def test_without_groups(self):
+        """Graduating a class on a database with no groups creates the Alumni group instead of failing."""
+        _create_profile(1, 'first')
+        _create_profile(2, 'second')
+        self.assertEqual(graduate_class(badges=[1, 2]), 2)
+        self.assertEqual(list(UserProfile.objects.order_by('badge').values_list('status', flat=True)), ['A', 'A'])
+        self.assertEqual(_group_names(1), ['Alumni'])
+        self.assertFalse(Group.objects.filter(name='Undergraduates').exists())
+
+    def test_memberships_swapped(self):
+        """Only brothers graduating by the date graduate; brothers who are already alumni are left alone."""
+        undergrads = get_account_group_id('Undergraduates')
+        alumni = get_account_group_id('Alumni')
+        _create_profile(1, 'first', graduation=date(2012, 5, 1), group=undergrads)
+        _create_profile(2, 'second', graduation=date(2013, 5, 1), group=undergrads)
+        _create_profile(3, 'third', status='A', graduation=date(2010, 5, 1), group=alumni)
+        self.assertEqual(graduate_class(graduation=date(2012, 5, 1)), 1)
+        self.assertEqual(UserProfile.objects.get(badge=1).status, 'A')
+        self.assertEqual(UserProfile.objects.get(badge=2).status, 'U')
+        self.assertEqual(_group_names(1), ['Alumni'])
+        self.assertEqual(_group_names(2), ['Undergraduates'])
+        self.assertEqual(_group_names(3), ['Alumni'])
+
+    def test_group_deleted(self):
+        """Deleting an account group discards its cached ID, so the group is created again when it is next needed."""
+        get_account_group_id('Alumni')      # creates the group; the next lookup caches its ID
+        Group.objects.filter(id=get_account_group_id('Alumni')).delete()
+        Group.objects.create(name='Officers')      # may be given the deleted group's ID
+        self.assertEqual(Group.objects.get(id=get_account_group_id('Alumni')).name, 'Alumni')
+
+
+class GroupMembersTest(TestCase):
+    """Tests that the members of the groups are listed, by badge, from a single query of the membership table."""
+
+    def setUp(self):
+        """Create two groups: one with two brothers and the superuser, and one with one of those brothers."""
+        self.officers = Group.objects.create(name='Officers')
+        self.chairs = Group.objects.create(name='Chairs')
+        _create_profile(2, 'second', group=self.officers).user.groups.add(self.chairs)
+        _create_profile(1, 'first', group=self.officers)
+        User.objects.create_superuser('admin', 'admin@example.com', 'password').groups.add(self.officers)
+
+    def name(self, badge):
+        """Return the listed name of the brother with the provided badge."""
+        return '%s ... %d' % (get_directory().name_for(badge), badge)
+
+    def test_all_groups(self):
+        """Tests that every group's members are listed in order of badge, without the superuser."""
+        get_directory()
+        with self.assertNumQueries(1):
+            members = _get_group_members()
+        self.assertEqual(members, {self.officers.id: [self.name(1), self.name(2)], self.chairs.id: [self.name(2)]})
+
+    def test_one_group(self):
+        """Tests that only the provided group is listed, even for members who belong to other groups too."""
+        self.assertEqual(_get_group_members(self.chairs.id), {self.chairs.id: [self.name(2)]})
+        self.assertEqual(_get_group_members(self.officers.id), {self.officers.id: [self.name(1), self.name(2)]})
+
+
+def _import_row(badge, username, **fields):
+    """Return a row of an import file (as read from a CSV file) for a new undergraduate with the provided fields."""
+    row = {'badge': str(badge), 'username': username, 'email': '%s@example.com' % username, 'first_name': 'George',
+           'last_name': 'Burdell', 'status': 'U'}
+    row.update(fields)
+    return row
+
+
+def _create_profile(badge, username, status='U', graduation=None, group=None):
+    """Create and return a profile with the provided badge, status, and graduation date, in the provided group."""
+    user = User.objects.create_user(username, '%s@example.com' % username, 'password')
+    if group is not None:
+        user.groups.add(group)
+    return UserProfile.objects.create(user=user, badge=badge, status=status, graduation=graduation,
+                                      public_visibility=VisibilitySettings.objects.create(),
+                                      chapter_visibility=VisibilitySettings.objects.create())
+
+
+def _group_names(badge):
+    """Return a sorted list of the names of the groups of the brother with the provided badge."""
+    return sorted(UserProfile.objects.get(badge=badge).user.groups.values_list('name', flat=True))
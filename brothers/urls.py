@@ -19,8 +19,13 @@ urlpatterns = patterns('gtphipsi.brothers.views',
     ##              Authenticated Pages              ##
     ## ============================================= ##
     url(r'^profile/$', 'my_profile', name='my_profile'),
+    url(r'^(?P<badge>\d+)/lineage/$', 'lineage', name='view_lineage'),
+    url(r'^tree/$', 'family_tree', name='family_tree'),
     url(r'^manage/$', 'manage', name='manage_users'),
     url(r'^add/$', 'add', name='add_user'),
+    url(r'^import/$', 'import_brothers', name='import_users'),
+    url(r'^export/$', 'export_brothers', name='export_users'),
+    url(r'^graduate/$', 'graduate', name='graduate_class'),
     url(r'^edit/$', 'edit', name='edit_profile'),
     url(r'^account/$', 'edit_account', name='edit_my_account'),
     url(r'^(?P<badge>\d+)/account/$', 'edit_account', name='edit_account'),
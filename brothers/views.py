@@ -6,8 +6,13 @@ This module exports the following view functions:
     - change_email (request)
     - change_email_success (request)
     - my_profile (request)
+    - lineage (request, badge)
+    - family_tree (request)
     - manage (request)
     - add (request)
+    - import_brothers (request)
+    - export_brothers (request)
+    - graduate (request)
     - edit (request)
     - unlock (request, badge)
     - edit_account (request[, badge])
@@ -31,26 +36,52 @@ import hashlib
 import logging
 from re import match
 
-from django.db.models import Min
 from django.conf import settings
 from django.core.mail import send_mail
 from django.core.urlresolvers import reverse
 from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib.auth.models import Group, Permission, User
-from django.http import Http404, HttpResponseRedirect
+from django.core.paginator import EmptyPage, InvalidPage, Paginator
+from django.db.models import Q
+from django.http import Http404, HttpResponse, HttpResponseRedirect
 from django.shortcuts import get_object_or_404, render
 from django.template import RequestContext
 
-from gtphipsi.brothers.bootstrap import INITIAL_BROTHER_LIST as IBL
+from gtphipsi.brothers.bulk import export_directory, export_rows, graduate_class, import_users, read_rows
+from gtphipsi.brothers.directory import get_directory, get_listing
 from gtphipsi.brothers.forms import ChangePasswordForm, ChapterVisibilityForm, EditAccountForm, EditProfileForm,\
-    NotificationSettingsForm, PublicVisibilityForm, UserForm
-from gtphipsi.brothers.models import EmailChangeRequest, UserProfile, STATUS_BITS
-from gtphipsi.common import create_user_and_profile, get_name_from_badge, log_page_view
+    GraduateClassForm, ImportFileForm, NotificationSettingsForm, PublicVisibilityForm, UserForm
+from gtphipsi.brothers.lineage import get_family_tree
+from gtphipsi.brothers.models import EmailChangeRequest, UserProfile, STATUS_BITS, STATUS_CHOICES
+from gtphipsi.brothers.permissions import get_account_group_id, get_group_perms, get_member_counts
+from gtphipsi.common import create_user_and_profile, log_page_view
 from gtphipsi.messages import get_message
 
 
 log = logging.getLogger('django')
 
+# The fields that may be shown on a profile page, in the order they are listed: (name, name of the VisibilitySettings
+# field controlling who may see it, function returning True if the field has been provided). Email is required.
+_PROFILE_FIELDS = (
+    ('Full name', 'full_name', lambda profile: bool(profile.middle_name or profile.nickname)),
+    ('Big brother', 'big_brother', lambda profile: profile.big_brother > 0),
+    ('Major', 'major', lambda profile: bool(profile.major)),
+    ('Initiation', 'initiation', lambda profile: profile.initiation is not None),
+    ('Graduation', 'graduation', lambda profile: profile.graduation is not None),
+    ('Hometown', 'hometown', lambda profile: bool(profile.hometown)),
+    ('Current city', 'current_city', lambda profile: bool(profile.current_city)),
+    ('Date of birth', 'dob', lambda profile: profile.dob is not None),
+    ('Phone', 'phone', lambda profile: bool(profile.phone)),
+    ('Email', 'email', lambda profile: True),
+)
+
+# Maps the names of profile fields to the sections of the profile page in which they are shown.
+_FIELD_CATEGORIES = {
+    'Big brother': 'chapter', 'Major': 'chapter', 'Initiation': 'chapter', 'Graduation': 'chapter',
+    'Hometown': 'personal', 'Current city': 'personal', 'Date of birth': 'personal',
+    'Phone': 'contact', 'Email': 'contact',
+}
+
 
 ## ============================================= ##
 ##                                               ##
@@ -63,8 +94,8 @@ def list(request):
     """Render a listing of all members of the chapter, separating undergraduates from alumni."""
     log_page_view(request, 'Brother List')
     columns = 3
-    undergrad_rows, num_undergrads = _get_brother_listing(num_cols=columns)
-    alumni_rows, num_alumni = _get_brother_listing(False, columns)
+    undergrad_rows, alumni_rows = get_listing(columns)
+    num_undergrads = len(get_directory().undergrads)
     return render(request, 'brothers/list.html',
                   {'undergrad_rows': undergrad_rows, 'num_undergrads': num_undergrads, 'alumni_rows': alumni_rows, 'col_width': 100/columns},
                   context_instance=RequestContext(request))
@@ -76,17 +107,22 @@ def show(request, badge):
     Required parameters:
         - badge =>  the badge number of the brother to view (as an integer)
 
+    The profile is loaded along with its user and visibility settings in a single query (none at all for the user's own
+    profile), and the big brother's name comes from the cached directory, so once the directory is cached the page takes
+    at most two queries.
+
     """
     log_page_view(request, 'View Profile')
+    badge = int(badge)
+    directory = get_directory()
     try:
-        profile = UserProfile.objects.get(badge=badge)
+        profile = _get_profile(request, badge)
         user = profile.user
     except UserProfile.DoesNotExist:
-        name = get_name_from_badge(int(badge))
+        name = directory.name_for(badge)
         if name is None:
             raise Http404
-        min = _get_lowest_undergrad_badge()
-        status = 'Undergraduate' if int(badge) > min else 'Alumnus'
+        status = 'Undergraduate' if directory.is_undergrad_badge(badge) else 'Alumnus'
         context = {'account': None, 'name': name, 'badge': badge, 'status': status}
     else:
         show_public = ('public' in request.GET and request.GET.get('public') == 'true') or request.user.is_anonymous()
@@ -94,11 +130,8 @@ def show(request, badge):
         fields = _get_fields_from_profile(profile, visibility)
         chapter_fields, personal_fields, contact_fields = _get_field_categories(fields)
         big_bro = None
-        if 'Big brother' in fields:
-            try:
-                big_bro = '%s ... %d' % (UserProfile.objects.get(badge=profile.big_brother).common_name(), int(profile.big_brother))
-            except UserProfile.DoesNotExist:    # if user's big brother doesn't have an account, look up name by badge
-                big_bro = '%s ... %d' % (get_name_from_badge(profile.big_brother), int(profile.big_brother))
+        if 'Big brother' in fields:     # brothers without accounts are in the directory too, so the name is never missing
+            big_bro = '%s ... %d' % (directory.name_for(profile.big_brother), profile.big_brother)
         context = {'own_account': (user == request.user), 'account': user, 'profile': profile, 'public': show_public,
                    'big': big_bro, 'fields': fields, 'chapter_fields': chapter_fields, 'personal_fields': personal_fields,
                    'contact_fields': contact_fields}
@@ -137,24 +170,90 @@ def change_email_success(request):
 def my_profile(request):
     """Return a display of information about the currently authenticated user."""
     log_page_view(request, 'My Profile')
-    return show(request, request.user.get_profile().badge)
+    return show(request, request.profile.badge)
+
+
+@login_required
+def lineage(request, badge):
+    """Render a display of a brother's family line (his big brother, his big brother's big brother, etc.) and of all of
+    his little brothers, their little brothers, and so on.
+
+    Required parameters:
+        - badge =>  the badge number of the brother whose lineage to view (as an integer)
+
+    """
+    log_page_view(request, 'View Lineage')
+    badge = int(badge)
+    directory = get_directory()
+    if badge not in directory:
+        raise Http404
+    tree = get_family_tree()
+    line = [(member, directory.name_for(member)) for member in tree.family_line(badge)]
+    descendants = _get_outline(tree.walk(badge)[1:], directory)
+    return render(request, 'brothers/lineage.html',
+                  {'badge': badge, 'name': directory.name_for(badge), 'line': line, 'descendants': descendants},
+                  context_instance=RequestContext(request))
+
+
+@login_required
+def family_tree(request):
+    """Render a display of every family in the chapter, as an outline starting from the founder of each family."""
+    log_page_view(request, 'Family Tree')
+    directory = get_directory()
+    tree = get_family_tree()
+    families = [_get_outline(tree.walk(root), directory) for root in tree.roots()]
+    return render(request, 'brothers/family_tree.html', {'families': families}, context_instance=RequestContext(request))
 
 
 @login_required
 def manage(request):
-    """Return a listing of user accounts along with some administrative data (which users are locked out)."""
+    """Return a listing of user accounts along with some administrative data (which users are locked out).
+
+    The listing is filtered, sorted, and paginated by the database according to the query string: 'status' limits it to
+    one status ('U', 'A', or 'O'), 'locked=true' to locked-out accounts, and 'q' to brothers whose names contain every
+    word of the search (or whose badge is the search); 'sort' and 'order' choose the sort order (see _get_sort_field),
+    and 'page' the page. In the directory view ('view=directory'), 'format=csv' returns the whole filtered listing as a
+    CSV file instead of a page.
+
+    """
     log_page_view(request, 'Manage Users')
-    undergrads = UserProfile.objects.filter(status='U')
-    alumni = UserProfile.objects.filter(status='A')
-    if 'sort' in request.GET:
-        sort = _get_sort_field(request.GET.get('sort'), request.GET.get('order', 'asc'))
-        undergrads = undergrads.order_by(sort)
-        alumni = alumni.order_by(sort)
-    locked_out_undergrads = [profile for profile in undergrads if profile.has_bit(STATUS_BITS['LOCKED_OUT'])]
-    locked_out_alumni = [profile for profile in alumni if profile.has_bit(STATUS_BITS['LOCKED_OUT'])]
     directory = (request.GET.get('view', 'admin') == 'directory')
-    context = {'undergrads': undergrads, 'alumni': alumni, 'locked_out_undergrads': locked_out_undergrads,
-               'locked_out_alumni': locked_out_alumni, 'directory': directory}
+    admin_view = not directory and 'change_userprofile' in get_group_perms(request.user)
+    profiles = _filter_profiles(request.GET, admin_view)
+    if directory and request.GET.get('format') == 'csv':
+        response = HttpResponse(export_directory(profiles), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename=directory.csv'
+        return response
+
+    paginator = Paginator(profiles.select_related('user', 'chapter_visibility'), settings.BROTHERS_PER_PAGE)
+    try:
+        page = paginator.page(int(request.GET.get('page', '1')))
+    except ValueError:
+        page = paginator.page(1)    # if 'page' parameter is not an integer, default to page 1
+    except (EmptyPage, InvalidPage):
+        page = paginator.page(paginator.num_pages)
+
+    admin_ids = frozenset()
+    num_locked_out = 0
+    if admin_view:
+        admin_ids = frozenset(User.objects.filter(groups__name='Administrators',
+                                                  id__in=[profile.user_id for profile in page.object_list])
+                              .values_list('id', flat=True))
+        num_locked_out = UserProfile.objects.filter(locked_out=True).count()
+
+    params = request.GET.copy()
+    for name in ('page', 'format'):
+        params.pop(name, None)
+    page_url = '?%spage=' % (params.urlencode() + '&' if params else '')
+    for name in ('sort', 'order'):
+        params.pop(name, None)
+    context = {'brothers': page, 'directory': directory, 'admin_ids': admin_ids, 'num_locked_out': num_locked_out,
+               'status': request.GET.get('status', ''), 'search': request.GET.get('q', ''),
+               'locked': request.GET.get('locked') == 'true', 'status_choices': STATUS_CHOICES,
+               'sort': request.GET.get('sort', ''), 'order': request.GET.get('order', ''),
+               'filters': (params.urlencode() + '&' if params else ''), 'first_url': page_url + '1',
+               'prev_url': '%s%d' % (page_url, page.number - 1), 'next_url': '%s%d' % (page_url, page.number + 1),
+               'last_url': '%s%d' % (page_url, paginator.num_pages)}
     return render(request, 'brothers/manage.html', context, context_instance=RequestContext(request))
 
 
@@ -168,7 +267,7 @@ def add(request):
         if form.is_valid():
             create_user_and_profile(form.cleaned_data)
             log.info('Admin %s (#%d) created new user %s (badge = %d)', request.user.get_full_name(),
-                    request.user.get_profile().badge, form.cleaned_data['username'], form.cleaned_data['badge'])
+                    request.profile.badge, form.cleaned_data['username'], form.cleaned_data['badge'])
             return HttpResponseRedirect(reverse('manage_users'))
     else:
         form = UserForm()
@@ -177,6 +276,54 @@ def add(request):
                   context_instance=RequestContext(request))
 
 
+@login_required
+@permission_required('brothers.add_userprofile', login_url=settings.FORBIDDEN_URL)
+def import_brothers(request):
+    """Render and process a form for administrators to create many user accounts at once from an uploaded file."""
+    log_page_view(request, 'Import Users')
+    errors = []
+    if request.method == 'POST':
+        form = ImportFileForm(request.POST, request.FILES)
+        if form.is_valid():
+            num_created, errors = import_users(read_rows(request.FILES['file'], form.cleaned_data['format']))
+            if not errors:
+                log.info('Admin %s (#%d) imported %d new users', request.user.get_full_name(), request.profile.badge,
+                         num_created)
+                return HttpResponseRedirect(reverse('manage_users'))
+    else:
+        form = ImportFileForm()
+    return render(request, 'brothers/import.html', {'form': form, 'errors': errors},
+                  context_instance=RequestContext(request))
+
+
+@login_required
+@permission_required('brothers.change_userprofile', login_url=settings.FORBIDDEN_URL)
+def export_brothers(request):
+    """Return a file (CSV, or JSON if the query string says 'format=json') of the accounts of all brothers."""
+    log_page_view(request, 'Export Users')
+    format = 'json' if request.GET.get('format') == 'json' else 'csv'
+    response = HttpResponse(export_rows(format), content_type=('application/json' if format == 'json' else 'text/csv'))
+    response['Content-Disposition'] = 'attachment; filename=brothers.%s' % format
+    return response
+
+
+@login_required
+@permission_required('brothers.change_userprofile', login_url=settings.FORBIDDEN_URL)
+def graduate(request):
+    """Render and process a form for administrators to make alumni of a whole graduating class at once."""
+    log_page_view(request, 'Graduate Class')
+    if request.method == 'POST':
+        form = GraduateClassForm(request.POST)
+        if form.is_valid():
+            num_graduated = graduate_class(form.cleaned_data['badges'], form.cleaned_data['graduation'])
+            log.info('Admin %s (#%d) graduated %d brothers', request.user.get_full_name(), request.profile.badge,
+                     num_graduated)
+            return HttpResponseRedirect(reverse('manage_users') + '?status=A')
+    else:
+        form = GraduateClassForm()
+    return render(request, 'brothers/graduate.html', {'form': form}, context_instance=RequestContext(request))
+
+
 @login_required
 def edit(request):
     """Render a form for the currently authenticated user to modify his user profile."""
@@ -229,7 +376,7 @@ def edit_account(request, badge=0):
         profile = user.get_profile()
 
     own_account = (user == request.user)
-    if not (own_account or request.user.get_profile().is_admin()):
+    if not (own_account or request.profile.is_admin()):
         return HttpResponseRedirect(reverse('forbidden'))
 
     if request.method == 'POST':
@@ -262,7 +409,7 @@ def edit_account(request, badge=0):
                 redirect = reverse('my_profile')
             else:
                 log.info('Admin %s (badge %d) edited account details of %s (%s %s)', request.user.get_full_name(),
-                         request.user.get_profile().badge, user.username, data['first_name'], data['last_name'])
+                         request.profile.badge, user.username, data['first_name'], data['last_name'])
                 redirect = profile.get_absolute_url()
             return HttpResponseRedirect(redirect)
 
@@ -321,16 +468,15 @@ def change_password_success(request):
 def manage_groups(request):
     """Render a listing of user groups and the brothers or permissions belonging to each group."""
     log_page_view(request, 'Manage User Groups')
-    groups = Group.objects.all()
+    counts = get_member_counts()
     if request.GET.get('view', '') == 'members':
-        group_list = []
-        for group in groups:
-            profiles = UserProfile.objects.filter(user__id__in=group.user_set.values_list('id', flat=True)).order_by('badge')
-            names = ['%s ... %d' % (profile.common_name(), profile.badge) for profile in profiles]
-            group_list.append((group.id, group.name, names))
+        members = _get_group_members()
+        group_list = [(id, name, members.get(id, []), counts.get(id, 0))
+                      for id, name in Group.objects.order_by('name').values_list('id', 'name')]
         context = {'group_list': group_list, 'show_perms': False}
     else:
-        context = {'groups': groups, 'show_perms': True}
+        groups = Group.objects.order_by('name').prefetch_related('permissions')
+        context = {'groups': [(group, counts.get(group.id, 0)) for group in groups], 'show_perms': True}
     return render(request, 'brothers/manage_groups.html', context, context_instance=RequestContext(request))
 
 
@@ -391,18 +537,13 @@ def edit_group_perms(request, id):
                 ids.append(int(value))
         group.permissions = Permission.objects.filter(id__in=ids)
         group.save()
-        del request.session['group_perms']  # clear existing group permissions in case they just changed
         log.info('%s (%s) edited permissions for group \'%s\'', request.user.username, request.user.get_full_name(), group.name)
         return HttpResponseRedirect(reverse('view_group', kwargs={'id': group.id}))
     else:
         perms = _get_available_permissions()
-        group_perms = group.permissions.all()
-        choices = []
-        initial = []
-        for perm in perms:
-            choices.append([perm.id, perm.name])
-            if perm in group_perms:
-                initial.append(perm.id)
+        group_perms = frozenset(group.permissions.values_list('id', flat=True))
+        choices = [[perm.id, perm.name] for perm in perms]
+        initial = [perm.id for perm in perms if perm.id in group_perms]
     return render(request, 'brothers/edit_group_perms.html',
                   {'group': group, 'perms': choices, 'initial': initial},
                   context_instance=RequestContext(request))
@@ -426,18 +567,13 @@ def edit_group_members(request, id):
                 user_ids.append(int(value))
         group.user_set = User.objects.filter(id__in=user_ids)
         group.save()
-        del request.session['group_perms']  # clear existing group permissions in case they just changed
         log.info('%s (%s) edited members of group \'%s\'', request.user.username, request.user.get_full_name(), group.name)
         return HttpResponseRedirect(reverse('view_group', kwargs={'id': group.id}))
     else:
-        users = User.objects.exclude(is_superuser=True) # only one superuser (root) should exist, so exclude that user
-        group_members = group.user_set.all()
-        choices = []
-        initial = []
-        for user in users:
-            choices.append([user.id, '%s ... %d' % (user.get_full_name(), user.get_profile().badge)])
-            if user in group_members:
-                initial.append(user.id)
+        # only one superuser (root) should exist, so exclude that user
+        profiles = UserProfile.objects.select_related('user').exclude(user__is_superuser=True).order_by('badge')
+        choices = [[profile.user_id, '%s ... %d' % (profile.user.get_full_name(), profile.badge)] for profile in profiles]
+        initial = frozenset(group.user_set.values_list('id', flat=True))
     return render(request, 'brothers/edit_group_members.html',
                   {'group': group, 'choices': choices, 'initial': initial},
                   context_instance=RequestContext(request))
@@ -472,9 +608,9 @@ def show_group(request, id):
     """
     log_page_view(request, 'View User Group')
     group = get_object_or_404(Group, id=id)
-    profiles = UserProfile.objects.filter(user__id__in=group.user_set.values_list('id', flat=True)).order_by('badge')
-    names = ['%s ... %d' % (profile.common_name(), profile.badge) for profile in profiles]
-    return render(request, 'brothers/show_group.html', {'group': group, 'users': names},
+    names = _get_group_members(group.id).get(group.id, [])
+    permissions = group.permissions.values_list('name', flat=True)
+    return render(request, 'brothers/show_group.html', {'group': group, 'users': names, 'permissions': permissions},
                   context_instance=RequestContext(request))
 
 
@@ -482,7 +618,7 @@ def show_group(request, id):
 def visibility(request):
     """Render a display of the currently authenticated user's visibility settings, both public and private."""
     log_page_view(request, 'Visibility Settings')
-    profile = request.user.get_profile()
+    profile = request.profile
     public = profile.public_visibility
     chapter = profile.chapter_visibility
     fields = _get_fields_from_profile(profile)
@@ -498,7 +634,7 @@ def edit_visibility(request, public=True):
         - public => whether to edit the user's public or chapter visibility settings (as a boolean): defaults to public
 
     """
-    viz = request.user.get_profile().public_visibility if public else request.user.get_profile().chapter_visibility
+    viz = request.profile.public_visibility if public else request.profile.chapter_visibility
     if request.method == 'POST':
         if public:
             form = PublicVisibilityForm(request.POST, instance=viz)
@@ -512,7 +648,7 @@ def edit_visibility(request, public=True):
             form = PublicVisibilityForm(instance=viz)
         else:
             form = ChapterVisibilityForm(instance=viz)
-    fields = _get_fields_from_profile(request.user.get_profile())
+    fields = _get_fields_from_profile(request.profile)
     vis_type = 'public' if public else 'chapter'
     message = get_message('visibility.edit.public') if public else get_message('visibility.edit.chapter')
     full_name_msg = get_message('visibility.fullname')
@@ -540,7 +676,7 @@ def edit_notification_settings(request):
     """Render and process a form for the currently authenticated user to modify his notification settings."""
 
     log_page_view(request, 'Edit Notification Settings')
-    profile = request.user.get_profile()
+    profile = request.profile
     initial = {'infocard': profile.has_bit(STATUS_BITS['EMAIL_NEW_INFOCARD']),
                'contact': profile.has_bit(STATUS_BITS['EMAIL_NEW_CONTACT']),
                'announcement': profile.has_bit(STATUS_BITS['EMAIL_NEW_ANNOUNCEMENT'])}
@@ -586,112 +722,67 @@ def edit_notification_settings(request):
 ## ============================================= ##
 
 
-def _get_lowest_undergrad_badge():
-    """Return the lowest badge number of all undergraduates with user accounts."""
-    return UserProfile.objects.filter(status='U').aggregate(Min('badge'))['badge__min']
-
+def _get_fields_from_profile(profile, vis=None):
+    """Return a list of field names (as strings) that a user has provided and, optionally, made visible.
 
-def _get_brother_listing(undergrad=True, num_cols=2):
-    """Return a list of lists (each sub-list containing the specified number of elements) of data about users.
+    Required parameters:
+        - profile   =>  the profile whose fields to inspect
 
     Optional parameters:
-        - undergrad =>  whether to return a listing of undergraduates or alumni (as a boolean): defaults to undergrads
-        - num_cols  =>  the number of elements to put in each inner list
-
-    The function returns a list of lists in the following format (in this case, num_cols = 2):
-        [ [ (badge, 'First Last', has_account), (badge, 'First Last', has_account) ], [ (...), (...) ], ... ]
+        - vis   =>  the visibility settings to use for restricting which fields are returned: defaults to None
 
-    In addition, the function returns the total number of users in all the inner lists.
+    If 'vis' is None, the function returns all nonempty fields in the user's profile. Otherwise, the function returns
+    all nonempty fields in the profile that are marked as visible by the provided visibility settings. The nonempty
+    fields are found once per profile object, so showing the same profile to several audiences does not repeat the work.
 
     """
+    if not hasattr(profile, '_filled_fields'):
+        profile._filled_fields = tuple((name, attr) for name, attr, filled in _PROFILE_FIELDS if filled(profile))
+    return [name for name, attr in profile._filled_fields if vis is None or getattr(vis, attr)]
 
-    # first, look up brothers with accounts and add them to a dictionary keyed by badge
-    map = {}
-    for profile in UserProfile.objects.filter(status=('U' if undergrad else 'A')):
-        map[int(profile.badge)] = (profile.common_name(), True)
-
-    # next, add brothers without accounts to the dictionary as necessary
-    no_profile_list = IBL[_get_lowest_undergrad_badge():] if undergrad else IBL[1:_get_lowest_undergrad_badge()]
-    ignore_list = UserProfile.objects.filter(status='A').values_list('badge', flat=True) if undergrad else []
-    for badge, name in no_profile_list:
-        if badge not in ignore_list and not map.has_key(badge):
-            map[badge] = (name, False)
-
-    # sort the dictionary by badge and use the sorted values to generate the final list
-    sorted_list = sorted(map.iteritems())
-    num_bros = len(sorted_list)
-    num_rows = num_bros/num_cols
-    if num_bros % num_cols:
-        num_rows += 1
-    result = []
-    for i in range(num_cols):
-        for j in range(num_rows):
-            if len(result) == j:
-                result.append([])
-            index = i * num_rows + j
-            if index < num_bros:
-                data = sorted_list[index]   # data is a tuple in the format (badge, (name, has_account))
-                result[j].append((data[0], data[1][0], data[1][1]))
-            else:
-                result[j].append(tuple())   # append empty tuples at the end if needed
 
-    return result, num_bros
+def _get_field_categories(fields):
+    """Return the number of nonempty fields for each of three categories (chapter, personal, and contact info)."""
+    counts = {'chapter': 0, 'personal': 0, 'contact': 0}
+    for field in fields:
+        category = _FIELD_CATEGORIES.get(field)
+        if category is not None:
+            counts[category] += 1
+    return counts['chapter'], counts['personal'], counts['contact']
 
 
-def _get_fields_from_profile(profile, vis=None):
-    """Return a list of field names (as strings) that a user has provided and, optionally, made visible.
+def _get_profile(request, badge):
+    """Return the profile (with its user and visibility settings) of the brother with the provided badge.
 
-    Required parameters:
-        - profile   =>  the profile whose fields to inspect
+    The currently authenticated user's own profile has already been loaded (see gtphipsi.middleware), so it is reused
+    rather than fetched again. Raises UserProfile.DoesNotExist if no brother with the provided badge has an account.
 
-    Optional parameters:
-        - vis   =>  the visibility settings to use for restricting which fields are returned: defaults to None
+    """
+    if request.profile is not None and request.profile.badge == badge:
+        return request.profile
+    return UserProfile.objects.select_related('user', 'public_visibility', 'chapter_visibility').get(badge=badge)
 
-    If 'vis' is None, the function returns all nonempty fields in the user's profile. Otherwise, the function returns
-    all nonempty fields in the profile that are marked as visible by the provided visibility settings.
 
-    """
+def _get_group_members(group_id=None):
+    """Return a dictionary mapping group IDs to lists of their members' names, in the format 'First Last ... badge'.
 
-    fields = []
-    if (profile.middle_name or profile.nickname) and (vis is None or vis.full_name):
-        fields.append('Full name')
-
-    # chapter information
-    if profile.big_brother > 0 and (vis is None or vis.big_brother):
-        fields.append('Big brother')
-    if profile.major and (vis is None or vis.major):
-        fields.append('Major')
-    if profile.initiation is not None and (vis is None or vis.initiation):
-        fields.append('Initiation')
-    if profile.graduation is not None and (vis is None or vis.graduation):
-        fields.append('Graduation')
-
-    # personal information
-    if profile.hometown and (vis is None or vis.hometown):
-        fields.append('Hometown')
-    if profile.current_city and (vis is None or vis.current_city):
-        fields.append('Current city')
-    if profile.dob is not None and (vis is None or vis.dob):
-        fields.append('Date of birth')
-
-    # contact information
-    if profile.phone and (vis is None or vis.phone):
-        fields.append('Phone')
-    if vis is None or vis.email:
-        fields.append('Email') # email is required
-
-    return fields
+    Optional parameters:
+        - group_id  =>  the ID of the only group whose members to list (as an integer): defaults to all groups
 
+    The members of every group are found with a single query against the membership table (joined only to the profiles,
+    for their badges), and their names are looked up in the cached directory. Members are listed in order of badge;
+    users without profiles (i.e., the superuser) are not listed.
 
-def _get_field_categories(fields):
-    """Return the number of nonempty fields for each of three categories (chapter, personal, and contact info)."""
-    field_set = frozenset(fields)
-    chapter_set = frozenset(['Big brother', 'Major', 'Initiation', 'Graduation'])
-    personal_set = frozenset(['Hometown', 'Current city', 'Date of birth'])
-    contact_set = frozenset(['Phone', 'Email'])
-    return len(field_set.intersection(chapter_set)),\
-           len(field_set.intersection(personal_set)),\
-           len(field_set.intersection(contact_set))
+    """
+    memberships = User.groups.through.objects.filter(user__userprofile__isnull=False)
+    if group_id is not None:
+        memberships = memberships.filter(group=group_id)
+    directory = get_directory()
+    members = {}
+    memberships = memberships.order_by('user__userprofile__badge').values_list('group_id', 'user__userprofile__badge')
+    for id, badge in memberships:
+        members.setdefault(id, []).append('%s ... %d' % (directory.name_for(badge), badge))
+    return members
 
 
 def _get_available_permissions():
@@ -715,29 +806,65 @@ def _process_status_change(user, old_status, new_status):
 
     """
     result = False
-    try:
-        undergrads = Group.objects.get(name='Undergraduates')
-        alumni = Group.objects.get(name='Alumni')
-    except Group.DoesNotExist:
-        # this should never happen
-        log.warn("Failed to find default user group while processing status change for user '%s' (badge %d)",
-                 user.get_full_name(), user.get_profile().badge)
-    else:
-        if old_status == 'A' and new_status != 'A':
-            user.groups.remove(alumni)
-            user.groups.add(undergrads)
-            result = True
-        elif old_status != 'A' and new_status == 'A':
-            user.groups.remove(undergrads)
-            user.groups.add(alumni)
-            result = True
+    undergrads = get_account_group_id('Undergraduates')
+    alumni = get_account_group_id('Alumni')
+    if old_status == 'A' and new_status != 'A':
+        user.groups.remove(alumni)
+        user.groups.add(undergrads)
+        result = True
+    elif old_status != 'A' and new_status == 'A':
+        user.groups.remove(undergrads)
+        user.groups.add(alumni)
+        result = True
     return result
 
 
+def _get_outline(walk, directory):
+    """Return a list of (indentation, badge, name) tuples for the (depth, badge) tuples of a FamilyTree walk.
+
+    Required parameters:
+        - walk      =>  a list of (depth, badge) tuples, as returned by FamilyTree.walk()
+        - directory =>  the Directory from which to look up the brothers' names
+
+    """
+    if not walk:
+        return []
+    base = walk[0][0]
+    return [((depth - base) * 25, badge, directory.name_for(badge)) for depth, badge in walk]
+
+
+def _filter_profiles(params, admin_view=False):
+    """Return a queryset of the profiles matching the filters in the provided query string, sorted as it specifies.
+
+    Required parameters:
+        - params    =>  the query string (as a QueryDict) of a request for the user management page
+
+    Optional parameters:
+        - admin_view    =>  whether the locked-out filter may be used (as a boolean): defaults to False
+
+    """
+    profiles = UserProfile.objects.all()
+    status = params.get('status')
+    if status in dict(STATUS_CHOICES):
+        profiles = profiles.filter(status=status)
+    if admin_view and params.get('locked') == 'true':
+        profiles = profiles.filter(locked_out=True)
+    search = params.get('q', '').strip()
+    if search.isdigit():
+        profiles = profiles.filter(badge=int(search))
+    else:
+        for word in search.split():
+            profiles = profiles.filter(Q(user__first_name__icontains=word) | Q(user__last_name__icontains=word) |
+                                       Q(nickname__icontains=word) | Q(middle_name__icontains=word))
+    if 'sort' in params:
+        return profiles.order_by(_get_sort_field(params.get('sort'), params.get('order', 'asc')), 'badge')
+    return profiles.order_by('badge')
+
+
 def _get_sort_field(sort, order):
     """Return the name of the field by which to sort, based on the content of the request's query string."""
 
-    if sort not in ['name', 'email', 'phone', 'city', 'login']:
+    if sort not in ['name', 'email', 'phone', 'city', 'login', 'badge']:
         sort = 'name'
     if sort == 'name':
         sort = 'user__first_name'
@@ -0,0 +1,84 @@
+"""Versioned caching for the gtphipsi package.
+
+Cached values are grouped into named namespaces (e.g., 'announcements'), and each namespace has a version number stored
+in the cache. The key of every cached value includes the current version of its namespace, so bumping the version
+invalidates all of the namespace's values at once, without needing to know their keys; the stale values simply expire.
+
+This module exports the following functions:
+    - get_version (namespace)
+    - bump_version (namespace)
+    - versioned_key (namespace, key)
+    - get_cached (namespace, key, function[, timeout])
+
+"""
+
+import time
+
+from django.core.cache import cache
+
+
+# How long (in seconds) the version number of a namespace is cached. Values are never cached for longer than this.
+VERSION_TIMEOUT = 60 * 60 * 24 * 30
+
+
+def get_version(namespace):
+    """Return the current version number of the provided namespace, starting a new version if there is none."""
+    key = _version_key(namespace)
+    version = cache.get(key)
+    if version is None:
+        # start from the current time, so a version lost from the cache is never reused with stale values
+        cache.add(key, int(time.time() * 1000), VERSION_TIMEOUT)
+        version = cache.get(key, int(time.time() * 1000))
+    return version
+
+
+def bump_version(namespace):
+    """Invalidate every value cached in the provided namespace by moving the namespace to a new version."""
+    key = _version_key(namespace)
+    try:
+        cache.incr(key)
+    except ValueError:  # the version has not been cached (or has expired)
+        cache.set(key, int(time.time() * 1000), VERSION_TIMEOUT)
+
+
+def versioned_key(namespace, key):
+    """Return the cache key of the value with the provided key in the current version of the provided namespace."""
+    return '%s:%d:%s' % (namespace, get_version(namespace), key)
+
+
+def get_cached(namespace, key, function, timeout=None):
+    """Return the value cached under the provided key in the provided namespace, calling 'function' if there is none.
+
+    Required parameters:
+        - namespace =>  the name of the namespace to which the value belongs (as a string)
+        - key       =>  the key of the value within the namespace (as a string)
+        - function  =>  a function of no arguments, returning the value to cache if the value is not already cached
+
+    Optional parameters:
+        - timeout   =>  the number of seconds for which to cache the value: defaults to the cache's default timeout
+
+    The value returned by 'function' must not be None, since None means 'not cached'.
+
+    """
+    full_key = versioned_key(namespace, key)
+    value = cache.get(full_key)
+    if value is None:
+        value = function()
+        cache.set(full_key, value, timeout)
+    return value
+
+
+
+
+
+
+## ============================================= ##
+##                                               ##
+##               Private Functions               ##
+##                                               ##
+## ============================================= ##
+
+
+def _version_key(namespace):
+    """Return the cache key of the version number of the provided namespace."""
+    return 'version:%s' % namespace
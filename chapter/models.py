@@ -8,6 +8,9 @@ This module exports the following model classes:
 This module exports the following tuple of field choices:
     - YEAR_CHOICES
 
+This module exports the following constant definitions:
+    - ANNOUNCEMENTS_CACHE
+
 """
 
 from datetime import datetime, timedelta
@@ -17,6 +20,13 @@ from django.contrib.localflavor.us.models import PhoneNumberField
 from django.core.urlresolvers import reverse
 from django.core.validators import MaxLengthValidator
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+
+from gtphipsi.caching import bump_version, get_cached
+
+
+# The cache namespace of the lists of recent announcements.
+ANNOUNCEMENTS_CACHE = 'announcements'
 
 
 # Possible 'years' in college (based on academic standing).
@@ -41,18 +51,25 @@ class Announcement(models.Model):
 
     @classmethod
     def most_recent(cls, public=True):
-        """Return the five most recent announcements posted in the past six months.
+        """Return a list of the five most recent announcements posted in the past six months.
 
         Optional parameters:
             - public    =>  whether to include only public announcements (as a boolean): defaults to public only
 
+        The lists are cached until an announcement is added, changed, or deleted (or for an hour at most, so that
+        announcements older than six months eventually drop off the list).
+
         """
+        return get_cached(ANNOUNCEMENTS_CACHE, 'public' if public else 'all', lambda: cls._most_recent(public), 60 * 60)
+
+    @classmethod
+    def _most_recent(cls, public):
+        """Return a list of the five most recent announcements posted in the past six months, loaded from the database."""
         six_months_ago = datetime.now() - timedelta(days=180)
+        queryset = cls.objects.filter(created__gte=six_months_ago.strftime('%Y-%m-%d')).select_related('user')
         if public:
-            queryset = cls.objects.filter(public=True).filter(created__gte=six_months_ago.strftime('%Y-%m-%d'))[:5]
-        else:
-            queryset = cls.objects.filter(created__gte=six_months_ago.strftime('%Y-%m-%d'))[:5]
-        return queryset if queryset.count() > 0 else cls.objects.none()
+            queryset = queryset.filter(public=True)
+        return list(queryset[:5])
 
     def __unicode__(self):
         """Return a Unicode string representation of the announcement."""
@@ -120,4 +137,14 @@ class InformationCard(ContactRecord):
 
     class Meta:
         """Define a default sort by date created descending (most recent first)."""
-        ordering = ['-created']
\ No newline at end of file
+        ordering = ['-created']
+
+
+def _invalidate_announcements(sender, **kwargs):
+    """Discard the cached lists of recent announcements whenever an announcement is added, changed, or deleted."""
+    bump_version(ANNOUNCEMENTS_CACHE)
+
+post_save.connect(_invalidate_announcements, sender=Announcement,
+                  dispatch_uid='gtphipsi.chapter.models._invalidate_announcements')
+post_delete.connect(_invalidate_announcements, sender=Announcement,
+                    dispatch_uid='gtphipsi.chapter.models._invalidate_announcements')
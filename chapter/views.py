@@ -25,6 +25,7 @@ from gtphipsi.brothers.models import UserProfile, STATUS_BITS
 from gtphipsi.chapter.models import Announcement, InformationCard
 from gtphipsi.chapter.forms import AnnouncementForm
 from gtphipsi.common import log_page_view
+from gtphipsi.mailqueue.models import QueuedMessage
 from gtphipsi.messages import get_message as _
 
 
@@ -100,7 +101,7 @@ def announcements(request):
 def add_announcement(request):
     """Render and process a form to create a new announcement.
 
-    This function will email all users who have elected to be notified of new announcements and also all potentials
+    This function will email (by way of the outgoing mail queue) all users who have elected to be notified of new announcements and also all potentials
     who have submitted information cards and elected to subscribe to chapter updates.
 
     """
@@ -119,7 +120,7 @@ def add_announcement(request):
                                    _('notify.announcement.body', args=(announcement.user.get_profile().common_name(),
                                                                        date, announcement.text, settings.URI_PREFIX)),
                                    to=['messenger@gtphipsi.org'], bcc=recipients)
-            message.send()
+            QueuedMessage.enqueue(message)
             log.info('%s (%s) added a new announcement: \'%s\'', request.user.username, request.user.get_full_name(),
                      announcement.text)
             return HttpResponseRedirect(reverse('announcements'))
@@ -141,7 +142,7 @@ def edit_announcement(request, id):
     """
     log_page_view(request, 'Edit Announcement')
     announcement = get_object_or_404(Announcement, id=id)
-    profile = request.user.get_profile()
+    profile = request.profile
     if announcement.user != request.user and not profile.is_admin():
         return HttpResponseRedirect(reverse('forbidden'))   # only admins may edit other people's announcements
     if request.method == 'POST':
@@ -1,7 +1,6 @@
 """Functions and constants used in several modules of the gtphipsi package.
 
 This module exports the following functions:
-    - get_name_from_badge (badge)
     - get_all_big_bro_choices ()
     - create_user_and_profile (form_data)
     - log_page_view (request, name)
@@ -13,11 +12,9 @@ This module exports the following constant definitions:
 
 import logging
 
-from django.conf import settings
-from django.contrib.auth.models import Group, Permission
-
-from gtphipsi.brothers.bootstrap import INITIAL_BROTHER_LIST
+from gtphipsi.brothers.directory import get_directory
 from gtphipsi.brothers.models import User, UserProfile, VisibilitySettings
+from gtphipsi.brothers.permissions import get_account_group_id
 
 
 log = logging.getLogger('django.request')
@@ -25,20 +22,17 @@ log = logging.getLogger('django.request')
 # The literal name of the HTTP Referrer header. The typo below in 'referrer' is intentional.
 REFERRER = 'HTTP_REFERER'
 
-
-def get_name_from_badge(badge):
-    """Return a brother's first and last name given his badge number, assuming he doesn't have an account."""
-    return INITIAL_BROTHER_LIST[badge][1] if 0 < badge < len(INITIAL_BROTHER_LIST) else None
+# POST parameters that are never logged, since they contain passwords and other secrets.
+_UNLOGGED_POST_KEYS = frozenset(['csrfmiddlewaretoken', 'password', 'confirm', 'old_pass', 'secret_key', 'admin_password'])
 
 
 def get_all_big_bro_choices():
-    """Return a list of tuples (in the format (badge, name)) of all possible big brothers."""
-    list = INITIAL_BROTHER_LIST
-    for profile in UserProfile.objects.filter(badge__gte=len(INITIAL_BROTHER_LIST)).order_by('badge'):
-        tup = (profile.badge, profile.common_name())
-        if tup not in list:
-            list.append(tup)
-    return list
+    """Return a tuple of tuples (in the format (badge, name)) of all possible big brothers, sorted by badge.
+
+    The choices are built once per change to the chapter's membership and cached (see gtphipsi.brothers.directory).
+
+    """
+    return get_directory().big_brother_choices
 
 
 def create_user_and_profile(form_data):
@@ -66,27 +60,29 @@ def create_user_and_profile(form_data):
 
 
 def log_page_view(request, name):
-    """Log a view to the specified page (view), including information about the client viewing the page."""
-    method = request.method
-    path = request.path
-    if method == 'POST':
-        post = ', POST Data: { '
-        for key, value in request.POST.iteritems():
-            if key not in ['csrfmiddlewaretoken', 'password', 'confirm', 'old_pass', 'secret_key', 'admin_password']:
-                post += '%s: \'%s\', ' % (key, unicode(value))
-        post += '}'
+    """Log a view to the specified page (view), including information about the client viewing the page.
+
+    The page name is also attached to the request, so that the access log (see gtphipsi.monitoring) can report it. The
+    detailed message below is only built if debug logging is enabled.
+
+    """
+    request.page_name = name
+    if not log.isEnabledFor(logging.DEBUG):
+        return
+    if request.method == 'POST':
+        post = ', POST Data: { %s }' % ', '.join('%s: \'%s\'' % (key, unicode(value))
+                                                 for key, value in request.POST.iteritems()
+                                                 if key not in _UNLOGGED_POST_KEYS)
     else:
         post = ''
     if request.user.is_authenticated():
-        profile = request.user.get_profile()
+        profile = request.profile
         client_string = ' User: %s (%s ... %d),' % (request.user.username, profile.common_name(), profile.badge)
     else:
         client_string = ''
-    if 'HTTP_USER_AGENT' in request.META:
-        user_agent = request.META['HTTP_USER_AGENT']
-    else:
-        user_agent = '<not supplied>'
-    log.debug('[%s]%s Request: %s %s%s, User Agent: %s' % (name, client_string, method, path, post, user_agent))
+    user_agent = request.META.get('HTTP_USER_AGENT', '<not supplied>')
+    log.debug('[%s]%s Request: %s %s%s, User Agent: %s', name, client_string, request.method, request.path, post,
+              user_agent)
 
 
 
@@ -101,26 +97,9 @@ def log_page_view(request, name):
 
 def _create_user_permissions(user, undergrad, admin):
     """Add a new user to the appropriate permissions group(s)."""
-
-    if undergrad:
-        group, created = Group.objects.get_or_create(name='Undergraduates')
-        if created:
-            group.permissions = Permission.objects.filter(codename__in=settings.UNDERGRADUATE_PERMISSIONS)
-            group.save()
-        user.groups.add(group)
-    else:
-        group, created = Group.objects.get_or_create(name='Alumni')
-        if created:
-            group.permissions = Permission.objects.filter(codename__in=settings.ALUMNI_PERMISSIONS)
-            group.save()
-        user.groups.add(group)
-
+    user.groups.add(get_account_group_id('Undergraduates' if undergrad else 'Alumni'))
     if admin:
-        group, created = Group.objects.get_or_create(name='Administrators')
-        if created:
-            group.permissions = Permission.objects.filter(codename__in=settings.ADMINISTRATOR_PERMISSIONS)
-            group.save()
-        user.groups.add(group)
+        user.groups.add(get_account_group_id('Administrators'))
 
 
 def _create_visibility_settings():
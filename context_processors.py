@@ -8,31 +8,69 @@ This module exports the following context processor functions:
 
 """
 
+from gtphipsi.brothers.permissions import get_group_perms
 from gtphipsi.chapter.models import Announcement
 
 
+class _LazyCollection(object):
+    """A collection whose items are computed by calling a function the first time they are used, and then remembered."""
+
+    def __init__(self, function):
+        """Create a lazy collection whose items (a list or a set) will be returned by the provided function."""
+        self._function = function
+        self._items = None
+
+    def _get_items(self):
+        """Return the collection's items, calling the function to compute them if it has not been called yet."""
+        if self._items is None:
+            self._items = self._function()
+        return self._items
+
+    def __contains__(self, item):
+        """Return True if the provided item is in the collection, False otherwise."""
+        return item in self._get_items()
+
+    def __iter__(self):
+        """Return an iterator over the collection's items."""
+        return iter(self._get_items())
+
+    def __len__(self):
+        """Return the number of items in the collection."""
+        return len(self._get_items())
+
+    def __getitem__(self, index):
+        """Return the item (or slice of items) at the provided index."""
+        return self._get_items()[index]
+
+    def __nonzero__(self):
+        """Return True if the collection has any items, False otherwise."""
+        return len(self._get_items()) > 0
+
+    __bool__ = __nonzero__
+
+
 def announcements_processor(request):
-    """Add an item 'recent_news', containing the most recently posted announcements, to all requests."""
-    return {'recent_news': Announcement.most_recent(public=request.user.is_anonymous())}
+    """Add an item 'recent_news', containing the most recently posted announcements, to all requests.
+
+    The announcements are not looked up (in the cache or in the database) unless a template actually uses them.
+
+    """
+    public = request.user.is_anonymous()
+    return {'recent_news': _LazyCollection(lambda: Announcement.most_recent(public=public))}
 
 
 def user_profile_processor(request):
     """Add an item 'user_profile', containing the profile of the currently authenticated user, to all requests."""
-    return {'user_profile': request.user.get_profile() if request.user.is_authenticated() else None}
+    return {'user_profile': request.profile}
 
 
 def group_perms_processor(request):
-    """Add an item 'group_perms', containing the permissions associated with the user's groups, to all requests."""
-    if 'group_perms' not in request.session:
-        perms = []
-        if request.user.is_authenticated():
-            for group in request.user.groups.all():
-                for perm in group.permissions.values_list('codename', flat=True):
-                    if perm not in perms:
-                        perms.append(perm)
-        request.session['group_perms'] = perms
-    return {'group_perms': request.session['group_perms']}
+    """Add an item 'group_perms', the set of codenames of the permissions granted to the user's groups, to all requests.
+
+    The set is looked up (see gtphipsi.brothers.permissions) only if a template actually uses it.
 
+    """
+    return {'group_perms': _LazyCollection(lambda: get_group_perms(request.user))}
 
 
 def menu_item_processor(request):
@@ -0,0 +1,176 @@
+"""BB code support for the gtphipsi.forums package.
+
+Posts are written in BB code ('[B]bold[/B]', '[URL="/"]link[/URL]', etc.) and stored twice: once as the source the
+user typed, which is what the edit forms show, and once as rendered HTML, which is what the thread pages show. The HTML
+is produced by escaping the whole source with a chain of string replacements, and then replacing the tags in the escaped
+text by a single substitution with one precompiled regular expression that matches any tag in the tag table. Supporting
+a new tag only requires a new entry in TAGS; it does not add another pass over the text.
+
+Tags may be nested. A closing tag closes any tags left open inside it, tags that are never closed are closed at the end
+of the post, and anything that is not a well-formed tag (including links with unsafe schemes, such as 'javascript:', or
+with whitespace in their addresses) is rendered as escaped plain text, so user input can never inject HTML into a page.
+
+This module exports the following functions:
+    - render (source)
+    - legacy_escape (text)
+    - legacy_unescape (text)
+
+This module exports the following dictionary, mapping tag names to their opening and closing HTML:
+    - TAGS
+
+"""
+
+import re
+
+
+# Maps (lowercase) tag names to their opening and closing HTML. The opening HTML of [URL] depends on the linked address,
+# and the contents of [CODE] are rendered literally (tags inside a code block are not interpreted).
+TAGS = {
+    'b':        ('<b>', '</b>'),
+    'i':        ('<i>', '</i>'),
+    'u':        ('<u>', '</u>'),
+    's':        ('<s>', '</s>'),
+    'sub':      ('<sub>', '</sub>'),
+    'sup':      ('<sup>', '</sup>'),
+    'quote':    ('<blockquote>', '</blockquote>'),
+    'code':     ('<pre>', '</pre>'),
+    'url':      (None, '</a>'),
+}
+
+# URL schemes that may appear in links. Links without a scheme (e.g., '/forums/') are always allowed.
+ALLOWED_SCHEMES = frozenset(['http', 'https', 'ftp', 'mailto'])
+
+# Tags are matched in the escaped source (see render()), so a quoted argument is delimited by '&quot;' and no argument
+# may contain '<' (which only appears in the '<br />' of a line break). Groups: 1 = the contents of a [CODE] block, 2 =
+# '/' for closing tags, 3 = tag name, 4 = quoted argument, 5 = unquoted argument. Longer tag names come first so that
+# '[SUB]' is not read as '[S]' followed by 'UB]'.
+_TAG_RE = re.compile(r'\[(?:code\](.*?)(?:\[/code\]|\Z)|'
+                     r'(/?)(%s)(?:=&quot;((?:[^&\]<]|&(?!quot;))*)&quot;|=([^\]<]*))?\])' %
+                     '|'.join(sorted(TAGS, key=len, reverse=True)), re.IGNORECASE | re.DOTALL)
+
+# Maps each tag without an argument, in lowercase and in uppercase, to a tuple (name, closing, HTML), so that the usual
+# tags are replaced without parsing their match.
+_PLAIN_TAGS = dict(('[%s%s]' % (slash, case(name)), (name, bool(slash), TAGS[name][bool(slash)]))
+                   for name in TAGS for slash in ('', '/') for case in (str.lower, str.upper))
+
+_URL_CONTENTS_RE = re.compile(r'([^\[<]*)\[/url\]', re.IGNORECASE)
+_SCHEME_RE = re.compile(r'^([a-zA-Z][a-zA-Z0-9+.\-]*):')
+_URL_SPACE_RE = re.compile(r'[\x00-\x20]')
+
+
+def render(source):
+    r"""Return the HTML rendering of the provided BB code source.
+
+    The source '<b>bold</b> & [B]bold[/B] [I]italic[/I] [U]underline[/U] \n [URL="/"]link[/URL]'
+    becomes    '&lt;b&gt;bold&lt;/b&gt; &amp; <b>bold</b> <i>italic</i> <u>underline</u> <br /> <a href="/">link</a>'.
+
+    The whole source is escaped first, by the same kind of chain of string replacements as legacy_escape(), and the tags
+    are then replaced in the escaped text by a single regular expression substitution. Text that is not a well-formed
+    tag is therefore already escaped and is left as it is.
+
+    """
+    stack = []      # names of the tags that are currently open, innermost last
+
+    def replace(match):
+        """Return the HTML that replaces the matched tag (or [CODE] block), keeping track of the open tags."""
+        plain = _PLAIN_TAGS.get(match.group(0))
+        if plain is not None:
+            name, close, html = plain
+            if not close and html is not None:
+                stack.append(name)
+                return html
+            if close and stack and stack[-1] == name:
+                stack.pop()
+                return html
+        code, close, name, quoted, unquoted = match.groups()
+        if code is not None:
+            return '<pre>%s</pre>' % code.replace('<br />', '\n')
+        name = name.lower()
+        arg = quoted if quoted is not None else unquoted
+        if close:
+            if arg is not None or name not in stack:
+                return match.group(0)
+            html = []
+            while True:
+                top = stack.pop()
+                html.append(TAGS[top][1])
+                if top == name:
+                    return ''.join(html)
+        if name == 'url':
+            if arg is None:     # [URL]http://...[/URL] links to its own contents
+                contents = _URL_CONTENTS_RE.match(match.string, match.end())
+                arg = None if contents is None else contents.group(1)
+            href = _clean_url(arg)
+            if href is None:
+                return match.group(0)
+            stack.append(name)
+            return '<a href="%s">' % href
+        if arg is not None:     # only [URL] takes an argument
+            return match.group(0)
+        stack.append(name)
+        return TAGS[name][0]
+
+    html = _escape_text(source)
+    if '[' not in html:
+        return html
+    html = _TAG_RE.sub(replace, html)
+    if stack:
+        html += ''.join(TAGS[name][1] for name in reversed(stack))
+    return html
+
+
+def legacy_escape(text):
+    """Return the HTML that the original chain of string replacements produced for the provided BB code.
+
+    Posts were once rendered with this function and stored only as HTML. It is kept for converting those posts (see the
+    'convert_post_sources' management command) and as the baseline of the 'bbcode_benchmark' management command.
+
+    """
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;') \
+            .replace('[B]', '<b>').replace('[/B]', '</b>').replace('[I]', '<i>').replace('[/I]', '</i>') \
+            .replace('[U]', '<u>').replace('[/U]', '</u>').replace('\n', '<br />') \
+            .replace('[URL=\"', '<a href=\"').replace('\"]', '\">').replace('[/URL]', '</a>')
+
+
+def legacy_unescape(text):
+    """Return the BB code from which legacy_escape() produced the provided HTML (as closely as it can be recovered)."""
+    return text.replace('<b>', '[B]').replace('</b>', '[/B]').replace('<i>', '[I]').replace('</i>', '[/I]') \
+            .replace('<u>', '[U]').replace('</u>', '[/U]').replace('<br />', '\n') \
+            .replace('<a href=\"', '[URL=\"').replace('\">', '\"]').replace('</a>', '[/URL]') \
+            .replace('&amp;', '&').replace('&lt;', '<').replace('&gt;', '>')
+
+
+
+
+
+
+## ============================================= ##
+##                                               ##
+##               Private Functions               ##
+##                                               ##
+## ============================================= ##
+
+
+def _escape_text(text):
+    """Return the provided text with '&', '<', '>', and '"' replaced by HTML entities and line breaks by '<br />'."""
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;') \
+            .replace('\r\n', '<br />').replace('\r', '<br />').replace('\n', '<br />')
+
+
+def _clean_url(url):
+    """Return the provided (escaped) link address without surrounding whitespace, or None if it should not be linked.
+
+    Addresses containing whitespace or control characters are not linked, since browsers ignore such characters within
+    a scheme. Escaping does not change the characters that may appear in a scheme, so checking the scheme of the escaped
+    address is the same as checking the scheme of the address the user typed.
+
+    """
+    if url is None:
+        return None
+    url = url.strip()
+    if not url or _URL_SPACE_RE.search(url):
+        return None
+    scheme = _SCHEME_RE.match(url)
+    if scheme is not None and scheme.group(1).lower() not in ALLOWED_SCHEMES:
+        return None
+    return url
@@ -18,20 +18,21 @@ from gtphipsi.forums.models import Forum, Post, Thread
 class ForumForm(ModelForm):
     """A form to create and modify forums, based on the Forum model class.
 
-    The 'slug' field is omitted from the form because it is generated automatically from the forum's name.
+    The 'slug' field is omitted from the form because it is generated automatically from the forum's name. The forum's
+    counters and last post are also omitted, since they are maintained by the view functions.
 
     """
 
     def clean_name(self):
         """Return a 'cleaned' value for the forum's name.
 
-        Due to the nature of the forum URLs, forums with names such as 'Subscriptions' or 'Edit Post' are problematic,
+        Due to the nature of the forum URLs, forums with names such as 'Subscriptions', 'Search', or 'Edit Post' are problematic,
         so we ensure that forums with such names are not created. The need to create forums with such names is likely
         never to arise, so this limitation should not be an issue.
         
         """
         name = self.cleaned_data.get('name')
-        if name is not None and slugify(name) in ['add', 'subscriptions', 'edit-post']:
+        if name is not None and slugify(name) in ['add', 'subscriptions', 'edit-post', 'search']:
             self._errors['name'] = self.error_class(['That name is not allowed.'])
             del self.cleaned_data['name']
         return self.cleaned_data.get('name') if 'name' in self.cleaned_data else None
@@ -39,21 +40,21 @@ class ForumForm(ModelForm):
     class Meta:
         """Associate the form with the Forum model."""
         model = Forum
-        exclude = ('slug',)
+        exclude = ('slug', 'num_threads', 'num_posts', 'last_post')
 
 
 class PostForm(ModelForm):
     """A form to create and modify posts, based on the Post model class.
 
-    Only the 'body' field is included in the form. All other fields are managed by the view functions behind the scenes,
-    except the 'created' and 'updated' fields, which are updated by Django automatically.
+    Only the 'source' field (the post's BB code) is included in the form. All other fields are managed by the view
+    functions behind the scenes, except the 'created' and 'updated' fields, which are updated by Django automatically.
 
     """
 
     class Meta:
         """Associate the form with the Post model."""
         model = Post
-        fields = ('body',)
+        fields = ('source',)
 
 
 class ThreadForm(ModelForm):
@@ -0,0 +1,42 @@
+"""Management command to compare the speed of the BB code renderer with the original chain of string replacements.
+
+Run this command with 'python manage.py bbcode_benchmark'. It renders synthetic posts of increasing size, which mix
+plain text, characters that must be escaped, line breaks, and tags, with both gtphipsi.forums.bbcode.render and
+gtphipsi.forums.bbcode.legacy_escape, and reports the best time of several runs for each.
+
+"""
+
+from optparse import make_option
+from timeit import Timer
+
+from django.core.management.base import NoArgsCommand
+
+from gtphipsi.forums.bbcode import legacy_escape, render
+
+
+# One 'paragraph' of a synthetic post; it is repeated to build posts of the requested sizes.
+SAMPLE_PARAGRAPH = ('Lorem ipsum dolor sit amet, [B]consectetur[/B] adipiscing elit & sed do <eiusmod> tempor. '
+                    '[I]Ut enim[/I] ad minim veniam, [U]quis nostrud[/U] exercitation; see '
+                    '[URL="http://gtphipsi.org/forums/"]the forums[/URL] for more.\n')
+
+
+class Command(NoArgsCommand):
+    """Time the BB code renderer against the original chain of string replacements on large post bodies."""
+
+    help = 'Time the BB code renderer against the original chain of string replacements on large post bodies.'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--sizes', dest='sizes', default='1,10,100,1000',
+                    help='A comma-separated list of post sizes, in kilobytes (default: 1,10,100,1000).'),
+        make_option('--repeat', type='int', dest='repeat', default=5,
+                    help='The number of times to time each renderer; the best time is reported (default: 5).'),
+    )
+
+    def handle_noargs(self, **options):
+        """Time both renderers on a synthetic post of each requested size."""
+        repeat = options.get('repeat')
+        self.stdout.write('%10s %14s %14s %8s\n' % ('size (KB)', 'render (ms)', 'legacy (ms)', 'ratio'))
+        for size in [int(size) for size in options.get('sizes').split(',')]:
+            body = SAMPLE_PARAGRAPH * (size * 1024 / len(SAMPLE_PARAGRAPH) + 1)
+            new = min(Timer(lambda: render(body)).repeat(repeat, 1)) * 1000
+            old = min(Timer(lambda: legacy_escape(body)).repeat(repeat, 1)) * 1000
+            self.stdout.write('%10d %14.2f %14.2f %8.2f\n' % (size, new, old, new / old if old else 0))
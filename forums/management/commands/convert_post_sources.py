@@ -0,0 +1,60 @@
+"""Management command to convert posts stored only as HTML into BB code source and freshly rendered HTML.
+
+Before posts stored their BB code source, the HTML produced from it was the only copy of a post. To upgrade an existing
+database, first add the 'source' column to the posts table ('syncdb' only creates new tables), leaving it empty for the
+existing posts. On SQLite or PostgreSQL, run:
+
+    ALTER TABLE forums_post ADD COLUMN source text NOT NULL DEFAULT '';
+
+On MySQL, whose text columns cannot have defaults, run the following instead (existing rows are given empty strings):
+
+    ALTER TABLE forums_post ADD COLUMN source longtext NOT NULL;
+
+Then run this command with 'python manage.py convert_post_sources' to recover the source of each existing post (see
+gtphipsi.forums.bbcode.legacy_unescape) and render it again with the current renderer.
+
+A post still needs to be converted if its source is empty but its body is not. Posts saved since the upgrade never look
+like that, since their bodies are rendered from their sources and only an empty source renders to an empty body; nor do
+converted posts, since legacy_unescape() never turns a non-empty body into an empty source. So the command may safely
+be run again (e.g., if it was interrupted), and it only converts the posts it has not converted yet.
+
+"""
+
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+
+from gtphipsi.forums.bbcode import legacy_unescape
+from gtphipsi.forums.models import Post
+
+
+class Command(NoArgsCommand):
+    """Recover the BB code source of every post that has a body but no source, and render it to HTML again."""
+
+    help = 'Recover the BB code source of every post that has a body but no source, and render it to HTML again.'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--batch-size', type='int', dest='batch_size', default=500,
+                    help='The number of posts to convert in each transaction (default: 500).'),
+    )
+
+    def handle_noargs(self, **options):
+        """Convert posts in batches, ordered by ID, committing after each batch."""
+        batch_size = options.get('batch_size')
+        verbosity = int(options.get('verbosity', 1))
+        converted = 0
+        last_id = 0
+        while True:
+            batch = list(Post.objects.filter(source='', id__gt=last_id).exclude(body='').order_by('id')[:batch_size])
+            if not batch:
+                break
+            with transaction.commit_on_success():
+                for post in batch:
+                    post.set_source(legacy_unescape(post.body))
+                    Post.objects.filter(id=post.id).update(source=post.source, body=post.body)
+            converted += len(batch)
+            last_id = batch[-1].id
+            if verbosity > 1:
+                self.stdout.write('Converted %d posts...\n' % converted)
+        if verbosity > 0:
+            self.stdout.write('Converted %d posts.\n' % converted)
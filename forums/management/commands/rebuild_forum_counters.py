@@ -0,0 +1,35 @@
+"""Management command to rebuild the denormalized counters of the gtphipsi.forums package.
+
+Run this command with 'python manage.py rebuild_forum_counters' after upgrading an existing database, or at any time
+the counters shown on the forum listings (or the number of pages in a thread) appear to be out of sync with the actual
+threads and posts.
+
+"""
+
+from django.core.management.base import NoArgsCommand
+from django.db.models import Count
+
+from gtphipsi.forums.models import Forum, Thread
+
+
+class Command(NoArgsCommand):
+    """Recompute the post count of every thread, then the thread count, post count, and last post of every forum."""
+
+    help = 'Recompute the post count of every thread, then the thread count, post count, and last post of every forum.'
+
+    def handle_noargs(self, **options):
+        """Rebuild the counters of each thread and forum in turn."""
+        verbosity = int(options.get('verbosity', 1))
+        num_threads = 0
+        for id, num_posts, post_count in Thread.objects.annotate(post_count=Count('posts')) \
+                .values_list('id', 'num_posts', 'post_count'):
+            if num_posts != post_count:
+                Thread.objects.filter(id=id).update(num_posts=post_count)
+                num_threads += 1
+        for forum in Forum.objects.all():
+            forum.rebuild_counters()
+            if verbosity > 1:
+                self.stdout.write('%s: %d threads, %d posts\n' % (forum.name, forum.num_threads, forum.num_posts))
+        if verbosity > 0:
+            self.stdout.write('Corrected counters for %d threads; rebuilt counters for %d forums.\n' %
+                              (num_threads, Forum.objects.count()))
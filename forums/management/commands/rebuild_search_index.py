@@ -0,0 +1,51 @@
+"""Management command to rebuild the full-text search index of the gtphipsi.forums package.
+
+The index is kept up to date as posts are created and edited, but posts that existed before the index did (or that were
+changed by other commands, such as 'convert_post_sources', which update posts without saving them) are not indexed.
+Run this command with 'python manage.py rebuild_search_index' after upgrading an existing database, or at any time the
+search results appear to be out of sync with the actual posts.
+
+"""
+
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+from django.db import connection, transaction
+
+from gtphipsi.forums.models import IndexEntry, Post
+
+
+class Command(NoArgsCommand):
+    """Empty the search index, then index every post that has not been deleted."""
+
+    help = 'Empty the search index, then index every post that has not been deleted.'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--batch-size', type='int', dest='batch_size', default=500,
+                    help='The number of posts to index in each transaction (default: 500).'),
+    )
+
+    def handle_noargs(self, **options):
+        """Empty the index with a single statement, then index posts in batches, ordered by ID."""
+        batch_size = options.get('batch_size')
+        verbosity = int(options.get('verbosity', 1))
+        with transaction.commit_on_success():
+            # QuerySet.delete() would load every entry into memory first; the index has no dependent rows.
+            connection.cursor().execute('DELETE FROM %s' % connection.ops.quote_name(IndexEntry._meta.db_table))
+        indexed = 0
+        last_id = 0
+        while True:
+            batch = list(Post.objects.filter(deleted=False, id__gt=last_id).select_related('thread')
+                         .order_by('id')[:batch_size])
+            if not batch:
+                break
+            entries = []
+            for post in batch:
+                entries.extend(IndexEntry.entries_for(post))
+            with transaction.commit_on_success():
+                IndexEntry.insert(entries)
+            indexed += len(batch)
+            last_id = batch[-1].id
+            if verbosity > 1:
+                self.stdout.write('Indexed %d posts...\n' % indexed)
+        if verbosity > 0:
+            self.stdout.write('Indexed %d posts (%d entries).\n' % (indexed, IndexEntry.objects.count()))
@@ -2,18 +2,24 @@
 
 This module exports the following model classes:
     - Forum
+    - IndexEntry
     - Post
+    - ReadWatermark
     - Thread
 
 """
 
-from datetime import timedelta
+from datetime import datetime, timedelta
 
-from django.conf import settings
 from django.core.urlresolvers import reverse
-from django.db import models
+from django.db import IntegrityError, models
+from django.db.models import Count, F, Sum
+from django.db.models.signals import post_save
 
 from gtphipsi.brothers.models import UserProfile
+from gtphipsi.forums.bbcode import render as render_bb_code
+from gtphipsi.forums.pagination import page_for_number
+from gtphipsi.forums.search import MAX_TERM_LENGTH, TITLE_WEIGHT, tokenize
 
 
 class Forum(models.Model):
@@ -28,16 +34,108 @@ class Forum(models.Model):
     slug = models.SlugField(unique=True)    # used in URLs instead of name
     description = models.CharField(max_length=1000, blank=True)
     moderators = models.ManyToManyField(UserProfile, limit_choices_to={'status': 'U'})
+    num_threads = models.PositiveIntegerField(default=0)   # denormalized count of the forum's threads
+    num_posts = models.PositiveIntegerField(default=0)     # denormalized count of the posts in all of the forum's threads
+    last_post = models.ForeignKey('Post', related_name='+', blank=True, null=True, on_delete=models.SET_NULL)
 
     def get_absolute_url(self):
         """Return the absolute URL path for the forum."""
         return reverse('view_forum', kwargs={'slug': self.slug})
 
+    def record_new_post(self, post, new_thread=False):
+        """Update the forum's counters and last post after a post (and possibly a new thread) is added to the forum.
+
+        Required parameters:
+            - post  =>  the post that was just created
+
+        Optional parameters:
+            - new_thread    =>  whether the post is the first post of a new thread (as a boolean): defaults to False
+
+        The counters are incremented in the database (not in Python), so concurrent posts do not overwrite each other.
+
+        """
+        Forum.objects.filter(id=self.id).update(num_posts=F('num_posts') + 1,
+                                                num_threads=F('num_threads') + (1 if new_thread else 0),
+                                                last_post=post)
+
+    def record_updated_post(self, post):
+        """Make the provided post, which was just edited, the forum's last post (posts are listed by date updated)."""
+        Forum.objects.filter(id=self.id).update(last_post=post)
+
+    def rebuild_counters(self):
+        """Recompute the forum's counters and last post from scratch (e.g., after a thread is deleted)."""
+        posts = Post.objects.filter(thread__forum=self)
+        latest = posts.order_by('-updated')[:1]
+        self.num_threads = Thread.objects.filter(forum=self).count()
+        self.num_posts = posts.count()
+        self.last_post = latest[0] if latest else None
+        Forum.objects.filter(id=self.id).update(num_threads=self.num_threads, num_posts=self.num_posts,
+                                                last_post=self.last_post)
+
     class Meta:
         """Define a default sort by name ascending."""
         ordering = ['name']
 
 
+class IndexEntry(models.Model):
+
+    """An entry in the full-text search index, recording that a term appears in a post.
+
+    The index contains one entry for each distinct term in each post that has not been deleted. A term's 'weight' is
+    the number of times it appears in the post, plus TITLE_WEIGHT for each time it appears in the title of the thread,
+    if the post is the thread's first post. The (term, post) unique index lets a search look up matching posts by term.
+
+    """
+
+    term = models.CharField(max_length=MAX_TERM_LENGTH)
+    post = models.ForeignKey('Post', related_name='index_entries')
+    thread = models.ForeignKey('Thread', related_name='+')
+    weight = models.PositiveIntegerField()
+
+    # The number of entries to insert with each INSERT statement (SQLite allows at most 999 parameters per statement).
+    INSERT_BATCH_SIZE = 200
+
+    @classmethod
+    def entries_for(cls, post):
+        """Return a list of (unsaved) index entries for the provided post, or an empty list if the post is deleted."""
+        if post.deleted:
+            return []
+        terms = tokenize(post.thread.title, TITLE_WEIGHT) if post.number == 1 else None
+        terms = tokenize(post.source, terms=terms)
+        return [cls(term=term, post_id=post.id, thread_id=post.thread_id, weight=weight)
+                for term, weight in terms.iteritems()]
+
+    @classmethod
+    def insert(cls, entries):
+        """Insert the provided (unsaved) index entries into the database, a batch at a time."""
+        for i in range(0, len(entries), cls.INSERT_BATCH_SIZE):
+            cls.objects.bulk_create(entries[i:i + cls.INSERT_BATCH_SIZE])
+
+    @classmethod
+    def search(cls, terms, forum=None):
+        """Return a ValuesQuerySet of dictionaries ('post', 'score') for the posts containing all of the provided terms.
+
+        Required parameters:
+            - terms =>  a list of distinct terms to search for (see gtphipsi.forums.search.parse_query)
+
+        Optional parameters:
+            - forum =>  the forum to which to restrict the results: defaults to None (all forums)
+
+        The results are ordered by score (the total weight of the terms in the post) descending, then by post ID
+        descending, so that newer posts come first among posts with equal scores.
+
+        """
+        queryset = cls.objects.filter(term__in=terms)
+        if forum is not None:
+            queryset = queryset.filter(thread__forum=forum)
+        return queryset.values('post').annotate(score=Sum('weight'), matches=Count('id')) \
+                .filter(matches=len(terms)).order_by('-score', '-post')
+
+    class Meta:
+        """Ensure that each term appears at most once per post (this also indexes entries by term)."""
+        unique_together = ('term', 'post')
+
+
 class Post(models.Model):
 
     """A post, the bottom level of the forum hierarchy.
@@ -46,6 +144,9 @@ class Post(models.Model):
     accessible through the 'quote' field of the reply post. A post may also be edited by someone other than its
     creator (e.g., a forum moderator), so the 'updated_by' field identifies the user who most recently edited the post.
 
+    A post's 'source' is the BB code its author typed, and its 'body' is the HTML rendering of that source (see the
+    gtphipsi.forums.bbcode module), which is computed when the post is saved so that pages can display it as-is.
+
     If a user deletes a post from a thread, the post's 'deleted' field is set to True, but the post is not actually
     deleted from the database. This is to avoid renumbering all subsequent posts within a thread after deleting a post
     from the middle of the thread. A post is only deleted from the database when its parent thread is deleted.
@@ -59,23 +160,79 @@ class Post(models.Model):
     number = models.PositiveIntegerField()  # the post's number within the thread (the thread's first post is #1)
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
-    body = models.TextField(verbose_name='Message')
+    source = models.TextField(verbose_name='Message')  # the post's BB code, as typed by its author
+    body = models.TextField(blank=True)     # the post's rendered (and escaped) HTML
     deleted = models.BooleanField(blank=True)   # a post is not deleted from the database until its thread is deleted
 
     def get_absolute_url(self):
         """Return the absolute URL path for the post."""
-        if self.number % settings.POSTS_PER_PAGE:
-            page = (self.number / settings.POSTS_PER_PAGE) + 1
-        else:
-            page = (self.number / settings.POSTS_PER_PAGE)
-        page_url = reverse('view_thread_page', kwargs={'forum': self.thread.forum.slug, 'id': self.thread.id,
-                                                       'thread': self.thread.slug, 'page': page})
-        return page_url + ('#post_%d' % self.number)
+        return self.thread.get_post_url(self.number)
+
+    def set_source(self, source):
+        """Set the post's BB code source and render it to HTML (the post still needs to be saved)."""
+        self.source = source
+        self.body = render_bb_code(source)
 
     def is_edited(self):
         """Return True if the post has been edited, False otherwise."""
         return self.updated > (self.created + timedelta(seconds=5))
 
+    def update_index(self):
+        """Replace the post's entries in the full-text search index with entries for its current content."""
+        IndexEntry.objects.filter(post=self).delete()
+        IndexEntry.insert(IndexEntry.entries_for(self))
+
+    class Meta:
+        """Ensure that no two posts in the same thread have the same number."""
+        unique_together = ('thread', 'number')
+
+
+class ReadWatermark(models.Model):
+
+    """The number of the last post a user has seen in a thread.
+
+    Posts are numbered densely within their thread, so a single number per user and thread is enough to tell which
+    posts the user has not read yet: all posts with greater numbers. Watermarks only ever move forward.
+
+    """
+
+    user = models.ForeignKey(UserProfile, related_name='read_watermarks')
+    thread = models.ForeignKey('Thread', related_name='read_watermarks')
+    number = models.PositiveIntegerField(default=0)
+
+    @classmethod
+    def record(cls, user, thread, number):
+        """Record that the provided user has seen the provided thread's posts up to (and including) the provided number.
+
+        The watermark is moved forward with a single UPDATE statement that does nothing if the user has already seen
+        the post; a watermark is only created the first time a user views a thread.
+
+        """
+        if cls.objects.filter(user=user, thread=thread, number__lt=number).update(number=number):
+            return
+        if not cls.objects.filter(user=user, thread=thread).exists():
+            try:
+                cls.objects.create(user=user, thread=thread, number=number)
+            except IntegrityError:
+                # another request created the watermark first; move it forward if this request saw more posts
+                cls.objects.filter(user=user, thread=thread, number__lt=number).update(number=number)
+
+    @classmethod
+    def annotate(cls, threads, user):
+        """Return the provided queryset of threads with each thread's 'last_read' set to the user's watermark.
+
+        The watermarks are selected by a correlated subquery, so the threads and their watermarks are loaded together
+        in a single query. Threads the user has never viewed have a 'last_read' of 0.
+
+        """
+        subquery = 'SELECT COALESCE(MAX(w.number), 0) FROM %s w WHERE w.user_id = %%s AND w.thread_id = %s.id' % \
+                   (cls._meta.db_table, Thread._meta.db_table)
+        return threads.extra(select={'last_read': subquery}, select_params=(user.id,))
+
+    class Meta:
+        """Ensure that each user has at most one watermark per thread."""
+        unique_together = ('user', 'thread')
+
 
 class Thread(models.Model):
 
@@ -92,17 +249,51 @@ class Thread(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField()          # used in URLs instead of name
     updated = models.DateTimeField(auto_now=True)
+    num_posts = models.PositiveIntegerField(default=0)     # denormalized count of the thread's posts (deleted or not)
     subscribers = models.ManyToManyField(UserProfile, blank=True, related_name='subscriptions')
 
     def get_absolute_url(self):
         """Return the absolute URL path for the thread."""
         return reverse('view_thread', kwargs={'forum': self.forum.slug, 'id': self.id, 'thread': self.slug})
 
+    def get_post_url(self, number):
+        """Return the absolute URL path for the post with the provided number in the thread."""
+        page_url = reverse('view_thread_page', kwargs={'forum': self.forum.slug, 'id': self.id, 'thread': self.slug,
+                                                       'page': page_for_number(number)})
+        return page_url + ('#post_%d' % number)
+
+    def unread_count(self):
+        """Return the number of posts the user has not read, if the thread was loaded with ReadWatermark.annotate()."""
+        return max(self.num_posts - getattr(self, 'last_read', self.num_posts), 0)
+
+    def first_unread_url(self):
+        """Return the URL of the first post the user has not read (see unread_count()), or of the last post if none."""
+        return self.get_post_url(min(getattr(self, 'last_read', self.num_posts) + 1, max(self.num_posts, 1)))
+
+    def reserve_post_number(self):
+        """Increment the thread's post counter, set its updated time to now, and return the number for a new post.
+
+        This method must be called within a transaction that also saves the new post. The UPDATE statement locks the
+        thread's row until the transaction ends, so concurrent replies to the same thread are numbered one after another
+        instead of receiving the same number, and no posts need to be counted to find the next number.
+
+        """
+        Thread.objects.filter(id=self.id).update(num_posts=F('num_posts') + 1, updated=datetime.now())
+        self.num_posts = Thread.objects.filter(id=self.id).values_list('num_posts', flat=True)[0]
+        return self.num_posts
+
     def latest_post(self):
         """Return the thread's latest post (most recently created, not most recently updated)."""
         return Post.objects.filter(thread=self).order_by('-created')[0]
 
 
+def _update_post_index(sender, instance, **kwargs):
+    """Keep the full-text search index up to date whenever a post is created, edited, or deleted."""
+    instance.update_index()
+
+post_save.connect(_update_post_index, sender=Post, dispatch_uid='gtphipsi.forums.models._update_post_index')
+
+
 #class Message(models.Model):
 #    public = models.BooleanField(blank=True)
 #    sender = models.ForeignKey(UserProfile)
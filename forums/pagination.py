@@ -0,0 +1,120 @@
+"""Pagination of forum threads by post number for the gtphipsi.forums package.
+
+Django's Paginator counts every post in a thread and then uses OFFSET to skip to the requested page, which gets slower
+the deeper into a long thread a user goes. Posts are numbered densely within their thread (the first post is #1, and
+posts are never removed from the database until their thread is), so the posts on any page can instead be selected by
+a range of post numbers, and the number of pages can be computed from the post counter stored on the thread.
+
+The paginator's thread should have its forum loaded already (e.g., with select_related('forum')), since the URL of
+every post on a page is built from the slugs of both.
+
+This module exports the following classes:
+    - PostPaginator
+    - PostPage
+
+This module exports the following functions:
+    - page_for_number (number[, per_page])
+
+"""
+
+from django.conf import settings
+from django.core.paginator import EmptyPage, PageNotAnInteger
+
+
+def page_for_number(number, per_page=None):
+    """Return the number of the page on which the post with the provided number appears.
+
+    Required parameters:
+        - number    =>  the number of the post within its thread (as an integer)
+
+    Optional parameters:
+        - per_page  =>  the number of posts on each page: defaults to settings.POSTS_PER_PAGE
+
+    """
+    per_page = per_page or settings.POSTS_PER_PAGE
+    return ((number - 1) / per_page) + 1 if number > 0 else 1
+
+
+class PostPaginator(object):
+    """A paginator over the posts of a thread, mirroring the interface of Django's Paginator class."""
+
+    def __init__(self, thread, per_page=None):
+        """Create a paginator over the posts of the provided thread, using the thread's stored post counter."""
+        self.thread = thread
+        self.per_page = per_page or settings.POSTS_PER_PAGE
+        self.count = thread.num_posts
+        self.num_pages = max(page_for_number(self.count, self.per_page), 1)
+        self.page_range = range(1, self.num_pages + 1)
+
+    def validate_number(self, number):
+        """Return the provided page number as an integer, raising PageNotAnInteger or EmptyPage if it is invalid."""
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        if number > self.num_pages:
+            raise EmptyPage('That page contains no results')
+        return number
+
+    def page(self, number):
+        """Return a PostPage object for the provided (1-based) page number.
+
+        The posts on the page are loaded in a single query, together with everything a thread page displays for them:
+        their authors, their editors, the posts they quote, and those posts' authors. Every post (and quoted post) is
+        also given the paginator's thread, so that building a post's URL does not load the thread and forum again.
+
+        """
+        number = self.validate_number(number)
+        first = (number - 1) * self.per_page + 1
+        last = number * self.per_page
+        posts = list(self.thread.posts.filter(number__range=(first, last)).order_by('number')
+                     .select_related('user__user', 'updated_by__user', 'quote__user__user'))
+        for post in posts:
+            post.thread = self.thread
+            if post.quote is not None and post.quote.thread_id == self.thread.id:
+                post.quote.thread = self.thread
+        return PostPage(posts, number, self)
+
+
+class PostPage(object):
+    """A single page of posts, mirroring the interface of Django's Page class."""
+
+    def __init__(self, object_list, number, paginator):
+        """Create a page containing the provided posts."""
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+
+    def __repr__(self):
+        """Return a string representation of the page."""
+        return '<Page %s of %s>' % (self.number, self.paginator.num_pages)
+
+    def has_next(self):
+        """Return True if there is a page after this one, False otherwise."""
+        return self.number < self.paginator.num_pages
+
+    def has_previous(self):
+        """Return True if there is a page before this one, False otherwise."""
+        return self.number > 1
+
+    def has_other_pages(self):
+        """Return True if there is a page before or after this one, False otherwise."""
+        return self.has_previous() or self.has_next()
+
+    def next_page_number(self):
+        """Return the number of the page after this one."""
+        return self.number + 1
+
+    def previous_page_number(self):
+        """Return the number of the page before this one."""
+        return self.number - 1
+
+    def start_index(self):
+        """Return the 1-based number of the first post on this page."""
+        return (self.number - 1) * self.paginator.per_page + 1 if self.paginator.count else 0
+
+    def end_index(self):
+        """Return the 1-based number of the last post on this page."""
+        return min(self.number * self.paginator.per_page, self.paginator.count)
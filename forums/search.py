@@ -0,0 +1,69 @@
+"""Text analysis for full-text search in the gtphipsi.forums package.
+
+Posts are searched through an inverted index (see the IndexEntry model), which records each term that appears in a
+post along with a weight reflecting how prominent the term is in that post. This module turns post sources, thread
+titles, and search queries into those terms; it does not touch the database.
+
+This module exports the following functions:
+    - tokenize (text[, weight, terms])
+    - parse_query (query)
+
+This module exports the following constants:
+    - MAX_TERM_LENGTH
+    - MAX_QUERY_TERMS
+    - TITLE_WEIGHT
+    - STOP_WORDS
+
+"""
+
+import re
+
+
+# Terms longer than this are truncated; it is also the length of the 'term' column of the index.
+MAX_TERM_LENGTH = 30
+
+# Only this many terms of a search query are used (all of them must appear in a post for it to match).
+MAX_QUERY_TERMS = 8
+
+# The weight of a term appearing in a thread's title, relative to a single appearance in a post's body.
+TITLE_WEIGHT = 5
+
+# Common words that are neither indexed nor searched for.
+STOP_WORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'for', 'if', 'in', 'into', 'is', 'it', 'no', 'not', 'of',
+    'on', 'or', 'so', 'such', 'that', 'the', 'their', 'then', 'there', 'these', 'they', 'this', 'to', 'was', 'will',
+    'with'
+])
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+_TAG_RE = re.compile(r'\[/?[a-zA-Z]+(?:=[^\]\r\n]*)?\]')
+
+
+def tokenize(text, weight=1, terms=None):
+    """Return a dictionary mapping each term in the provided text to its total weight.
+
+    Required parameters:
+        - text  =>  the text to tokenize, which may contain BB code tags (these are ignored)
+
+    Optional parameters:
+        - weight    =>  the weight to add for each appearance of a term: defaults to 1
+        - terms     =>  a dictionary of terms to add to (e.g., the terms of a thread's title): defaults to a new one
+
+    """
+    if terms is None:
+        terms = {}
+    for word in _WORD_RE.findall(_TAG_RE.sub(' ', text).lower()):
+        if len(word) > 1 and word not in STOP_WORDS:
+            term = word[:MAX_TERM_LENGTH]
+            terms[term] = terms.get(term, 0) + weight
+    return terms
+
+
+def parse_query(query):
+    """Return a list of the distinct terms in the provided search query, in the order in which they appear."""
+    result = []
+    for word in _WORD_RE.findall((query or '').lower()):
+        term = word[:MAX_TERM_LENGTH]
+        if len(term) > 1 and term not in STOP_WORDS and term not in result:
+            result.append(term)
+    return result[:MAX_QUERY_TERMS]
@@ -5,7 +5,22 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
+from StringIO import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.template.defaultfilters import slugify
 from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+
+from gtphipsi.brothers.models import UserProfile
+from gtphipsi.forums.bbcode import render
+from gtphipsi.forums.models import Forum, IndexEntry, Post, ReadWatermark, Thread
+from gtphipsi.forums.pagination import PostPaginator
+from gtphipsi.forums.search import MAX_QUERY_TERMS, MAX_TERM_LENGTH, TITLE_WEIGHT, parse_query, tokenize
+from gtphipsi.forums.views import _is_moderator, _moderated_forum_ids, _subscribed_thread_ids
 
 
 class SimpleTest(TestCase):
@@ -14,3 +29,324 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class BBCodeTest(TestCase):
+    """Tests that BB code is rendered to HTML without letting user input inject any HTML of its own."""
+
+    def test_escaping(self):
+        """Tests that '<', '>', '&', and '"' are escaped and line breaks become '<br />', inside and outside of tags."""
+        self.assertEqual(render('<script>"a" & b</script>\r\nc\nd'),
+                         '&lt;script&gt;&quot;a&quot; &amp; b&lt;/script&gt;<br />c<br />d')
+        self.assertEqual(render('[B]<i>[/B]'), '<b>&lt;i&gt;</b>')
+
+    def test_links(self):
+        """Tests that links are rendered with their escaped addresses, whether the address is an argument or not."""
+        self.assertEqual(render('[URL="/forums/"]forums[/URL]'), '<a href="/forums/">forums</a>')
+        self.assertEqual(render('[url=http://example.com/?a=1&b=2]x[/url]'),
+                         '<a href="http://example.com/?a=1&amp;b=2">x</a>')
+        self.assertEqual(render('[URL]https://example.com/[/URL]'),
+                         '<a href="https://example.com/">https://example.com/</a>')
+
+    def test_unsafe_links(self):
+        """Tests that links with unsafe schemes, or that try to add attributes, are rendered as plain text."""
+        self.assertEqual(render('[URL="javascript:alert(1)"]x[/URL]'), '[URL=&quot;javascript:alert(1)&quot;]x[/URL]')
+        self.assertEqual(render('[URL=" JavaScript:alert(1)"]x[/URL]'), '[URL=&quot; JavaScript:alert(1)&quot;]x[/URL]')
+        self.assertEqual(render('[URL]java\tscript:alert(1)[/URL]'), '[URL]java\tscript:alert(1)[/URL]')
+        self.assertEqual(render('[URL=x onclick=alert(1)]y[/URL]'), '[URL=x onclick=alert(1)]y[/URL]')
+        self.assertEqual(render('[URL="x" onclick="alert(1)"]y[/URL]'),
+                         '[URL=&quot;x&quot; onclick=&quot;alert(1)&quot;]y[/URL]')
+        self.assertEqual(render('[URL="/"" onclick="alert(1)"]y[/URL]'),
+                         '[URL=&quot;/&quot;&quot; onclick=&quot;alert(1)&quot;]y[/URL]')
+
+    def test_nesting(self):
+        """Tests that closing a tag closes the tags opened inside it, and that tags left open are closed at the end."""
+        self.assertEqual(render('[QUOTE][B]a[I]b[/QUOTE]c[/I]'), '<blockquote><b>a<i>b</i></b></blockquote>c[/I]')
+        self.assertEqual(render('[sub]a[SUP]b'), '<sub>a<sup>b</sup></sub>')
+        self.assertEqual(render('[/B][B=1]a'), '[/B][B=1]a')
+
+    def test_code(self):
+        """Tests that the contents of a [CODE] block are rendered literally, even if the block is never closed."""
+        self.assertEqual(render('[CODE][B]a[/B] <b>\n[/CODE][B]b[/B]'), '<pre>[B]a[/B] &lt;b&gt;\n</pre><b>b</b>')
+        self.assertEqual(render('[B]a[code][/B]'), '<b>a<pre>[/B]</pre></b>')
+
+
+class ConvertPostSourcesTest(TestCase):
+    """Tests that the 'convert_post_sources' command converts each post stored only as HTML exactly once."""
+
+    def test_convert(self):
+        """Tests that a legacy post gets its source back, and that posts without bodies are never selected."""
+        profile = _create_profile(1)
+        thread = _create_thread(Forum.objects.create(name='General', slug='general'), profile, 'Thread', 'New')
+        legacy = Post.objects.create(thread=thread, user=profile, updated_by=profile, number=2, source='',
+                                     body='<b>Bold</b> &amp; &lt;plain&gt;<br />text')
+        empty = Post.objects.create(thread=thread, user=profile, updated_by=profile, number=3, source='', body='')
+        output = StringIO()
+        call_command('convert_post_sources', stdout=output)
+        self.assertEqual(output.getvalue(), 'Converted 1 posts.\n')
+        legacy = Post.objects.get(id=legacy.id)
+        self.assertEqual(legacy.source, '[B]Bold[/B] & <plain>\ntext')
+        self.assertEqual(legacy.body, '<b>Bold</b> &amp; &lt;plain&gt;<br />text')
+        self.assertEqual(Post.objects.get(id=empty.id).body, '')
+        output = StringIO()
+        call_command('convert_post_sources', stdout=output)
+        self.assertEqual(output.getvalue(), 'Converted 0 posts.\n')
+
+
+class ThreadPageQueryTest(TestCase):
+    """Tests that rendering a page of a thread takes the same number of queries no matter how many posts it shows."""
+
+    NUM_POSTS = 40
+
+    def setUp(self):
+        """Create a thread with posts by two different users, every post after the first quoting the one before it."""
+        profiles = []
+        for badge in (1, 2):
+            user = User.objects.create_user('brother%d' % badge, 'brother%d@example.com' % badge, 'password')
+            profiles.append(UserProfile.objects.create(user=user, badge=badge))
+        forum = Forum.objects.create(name='General', slug='general')
+        self.thread = Thread.objects.create(forum=forum, owner=profiles[0], title='Thread', slug='thread',
+                                            num_posts=self.NUM_POSTS)
+        quote = None
+        for number in range(1, self.NUM_POSTS + 1):
+            author = profiles[number % 2]
+            post = Post(thread=self.thread, user=author, updated_by=profiles[0], quote=quote, number=number)
+            post.set_source('Post #%d' % number)
+            post.save()
+            quote = post
+
+    def render_page(self):
+        """Load the first page of the thread and touch every attribute of its posts that the thread page displays."""
+        thread = Thread.objects.select_related('forum').get(id=self.thread.id)
+        for post in PostPaginator(thread).page(1).object_list:
+            post.user.common_name()
+            post.updated_by.common_name()
+            post.get_absolute_url()
+            if post.quote is not None:
+                post.quote.user.common_name()
+                post.quote.get_absolute_url()
+
+    def test_query_count_is_constant(self):
+        """The thread and its forum take one query, and all of the posts on the page take one more."""
+        for per_page in (5, 20, self.NUM_POSTS):
+            with override_settings(POSTS_PER_PAGE=per_page):
+                self.assertNumQueries(2, self.render_page)
+
+
+class ForumCounterTest(TestCase):
+    """Tests that a forum's thread and post counters and its last post follow the posts added to it."""
+
+    def setUp(self):
+        """Create a forum and a profile to post in it."""
+        self.forum = Forum.objects.create(name='General', slug='general')
+        self.profile = _create_profile(1)
+
+    def assertCounters(self, num_threads, num_posts, last_post):
+        """Assert that the forum, as stored in the database, has the provided counters and last post."""
+        forum = Forum.objects.get(id=self.forum.id)
+        self.assertEqual((forum.num_threads, forum.num_posts, forum.last_post_id),
+                         (num_threads, num_posts, None if last_post is None else last_post.id))
+
+    def test_new_posts(self):
+        """Tests that new threads and replies are counted and become the forum's last post."""
+        first = _create_thread(self.forum, self.profile, 'First', 'One', 'Two')
+        self.assertCounters(1, 2, first.posts.get(number=2))
+        second = _create_thread(self.forum, self.profile, 'Second', 'Three')
+        self.assertCounters(2, 3, second.posts.get(number=1))
+
+    def test_edited_post(self):
+        """Tests that an edited post becomes the forum's last post without changing the counters."""
+        thread = _create_thread(self.forum, self.profile, 'Thread', 'One', 'Two')
+        post = thread.posts.get(number=1)
+        post.set_source('Edited')
+        post.save()
+        self.forum.record_updated_post(post)
+        self.assertCounters(1, 2, post)
+
+    def test_deleted_thread(self):
+        """Tests that rebuilding the counters after a thread is deleted leaves only the remaining thread's posts."""
+        kept = _create_thread(self.forum, self.profile, 'Kept', 'One')
+        deleted = _create_thread(self.forum, self.profile, 'Deleted', 'Two', 'Three')
+        deleted.delete()
+        self.assertCounters(2, 3, None)     # the last post was deleted along with its thread
+        self.forum.rebuild_counters()
+        self.assertCounters(1, 1, kept.posts.get(number=1))
+
+
+class PostNumberTest(TestCase):
+    """Tests that new posts are numbered from the thread's post counter, and that numbers cannot be reused."""
+
+    def setUp(self):
+        """Create a thread with two posts."""
+        self.profile = _create_profile(1)
+        self.thread = _create_thread(Forum.objects.create(name='General', slug='general'), self.profile, 'Thread',
+                                     'One', 'Two')
+
+    def test_reserve_post_number(self):
+        """Tests that each reserved number is one greater than the last and is stored in the thread's counter."""
+        self.assertEqual(list(self.thread.posts.order_by('number').values_list('number', flat=True)), [1, 2])
+        self.assertEqual([self.thread.reserve_post_number() for i in range(3)], [3, 4, 5])
+        self.assertEqual(Thread.objects.get(id=self.thread.id).num_posts, 5)
+
+    def test_duplicate_number(self):
+        """Tests that a second post with the same number in the same thread is rejected by the database."""
+        post = Post(thread=self.thread, user=self.profile, updated_by=self.profile, number=2, deleted=False)
+        post.set_source('Duplicate')
+        self.assertRaises(IntegrityError, post.save)
+
+
+class SearchTest(TestCase):
+    """Tests for the text analysis and the full-text search index of the forums."""
+
+    def setUp(self):
+        """Create two forums; only the first post of a thread is indexed with its thread's title."""
+        profile = _create_profile(1)
+        self.general = Forum.objects.create(name='General', slug='general')
+        self.rush = Forum.objects.create(name='Rush', slug='rush')
+        self.budget = _create_thread(self.general, profile, 'Rush budget', 'The budget is due.',
+                                     'Budget, budget, budget!', 'See you at the meeting.')
+        self.events = _create_thread(self.rush, profile, 'Events', 'Rush events need a budget.')
+
+    def search(self, query, forum=None):
+        """Return a list of the IDs of the posts matching the provided query, in ranked order."""
+        return [result['post'] for result in IndexEntry.search(parse_query(query), forum)]
+
+    def post_id(self, thread, number):
+        """Return the ID of the post with the provided number in the provided thread."""
+        return thread.posts.get(number=number).id
+
+    def test_tokenize(self):
+        """Tests that tags, stop words, and one-letter words are ignored, and that long words are truncated."""
+        self.assertEqual(tokenize('The [B]quick[/B] fox, a fox! x ' + 'y' * 40),
+                         {'quick': 1, 'fox': 2, 'y' * MAX_TERM_LENGTH: 1})
+        self.assertEqual(tokenize('Fox', TITLE_WEIGHT, {'fox': 1}), {'fox': TITLE_WEIGHT + 1})
+
+    def test_parse_query(self):
+        """Tests that a query's terms are distinct, exclude stop words, and are limited in length and number."""
+        self.assertEqual(parse_query('The fox and the FOX, x quick'), ['fox', 'quick'])
+        self.assertEqual(parse_query('z' * 40), ['z' * MAX_TERM_LENGTH])
+        terms = ['term%d' % i for i in range(MAX_QUERY_TERMS + 2)]
+        self.assertEqual(parse_query(' '.join(terms)), terms[:MAX_QUERY_TERMS])
+        self.assertEqual(parse_query(None), [])
+
+    def test_ranking(self):
+        """Tests that posts are ranked by the total weight of the terms, counting the thread's title for first posts."""
+        self.assertEqual(self.search('budget'), [self.post_id(self.budget, 1), self.post_id(self.budget, 2),
+                                                 self.post_id(self.events, 1)])
+
+    def test_all_terms(self):
+        """Tests that a post matches only if it contains every term of the query."""
+        self.assertEqual(self.search('rush budget'), [self.post_id(self.budget, 1), self.post_id(self.events, 1)])
+        self.assertEqual(self.search('budget meeting'), [])
+
+    def test_forum(self):
+        """Tests that the results can be restricted to a single forum."""
+        self.assertEqual(self.search('budget', self.rush), [self.post_id(self.events, 1)])
+
+    def test_edited_and_deleted_posts(self):
+        """Tests that an edited post is found by its new terms only, and that a deleted post is not found at all."""
+        post = self.budget.posts.get(number=3)
+        post.set_source('See you at the retreat.')
+        post.save()
+        self.assertEqual(self.search('meeting'), [])
+        self.assertEqual(self.search('retreat'), [post.id])
+        post.deleted = True
+        post.save()
+        self.assertEqual(self.search('retreat'), [])
+        self.assertFalse(IndexEntry.objects.filter(post=post).exists())
+
+
+class RequestCacheTest(TestCase):
+    """Tests that the IDs of the user's moderated forums and subscribed threads are loaded once per request."""
+
+    def setUp(self):
+        """Create a profile that moderates one of two forums and is subscribed to one of two threads."""
+        self.profile = _create_profile(1)
+        self.general = Forum.objects.create(name='General', slug='general')
+        self.rush = Forum.objects.create(name='Rush', slug='rush')
+        self.general.moderators.add(self.profile)
+        self.subscribed = Thread.objects.create(forum=self.rush, owner=self.profile, title='One', slug='one')
+        self.other = Thread.objects.create(forum=self.rush, owner=self.profile, title='Two', slug='two')
+        self.subscribed.subscribers.add(self.profile)
+
+    def get_request(self):
+        """Return a new request made by the profile's user."""
+        request = RequestFactory().get('/')
+        request.profile = self.profile
+        return request
+
+    def test_moderated_forums(self):
+        """Tests that any number of moderator checks made while handling a request take a single query."""
+        request = self.get_request()
+        with self.assertNumQueries(1):
+            self.assertTrue(_is_moderator(request, self.general))
+            self.assertFalse(_is_moderator(request, self.rush))
+            self.assertEqual(_moderated_forum_ids(request), set([self.general.id]))
+        self.assertNumQueries(1, _moderated_forum_ids, self.get_request())    # a new request loads the IDs again
+
+    def test_subscribed_threads(self):
+        """Tests that any number of subscription checks made while handling a request take a single query."""
+        request = self.get_request()
+        with self.assertNumQueries(1):
+            self.assertTrue(self.subscribed.id in _subscribed_thread_ids(request))
+            self.assertFalse(self.other.id in _subscribed_thread_ids(request))
+        self.assertNumQueries(1, _subscribed_thread_ids, self.get_request())
+
+
+class ReadWatermarkTest(TestCase):
+    """Tests that read watermarks only move forward and give each thread's number of unread posts."""
+
+    def setUp(self):
+        """Create two threads, of five posts and one post."""
+        self.profile = _create_profile(1)
+        forum = Forum.objects.create(name='General', slug='general')
+        self.long = _create_thread(forum, self.profile, 'Long', 'One', 'Two', 'Three', 'Four', 'Five')
+        self.short = _create_thread(forum, self.profile, 'Short', 'One')
+
+    def annotated(self):
+        """Return a dictionary mapping the titles of the threads to the threads, annotated with the watermarks."""
+        threads = ReadWatermark.annotate(Thread.objects.select_related('forum'), self.profile)
+        return dict((thread.title, thread) for thread in threads)
+
+    def test_record(self):
+        """Tests that a watermark is created on the first view and then only moves forward."""
+        ReadWatermark.record(self.profile, self.long, 2)
+        ReadWatermark.record(self.profile, self.long, 1)
+        self.assertEqual(ReadWatermark.objects.get(user=self.profile, thread=self.long).number, 2)
+        ReadWatermark.record(self.profile, self.long, 4)
+        self.assertEqual(ReadWatermark.objects.get(user=self.profile, thread=self.long).number, 4)
+
+    def test_annotate(self):
+        """Tests that all of the threads and their watermarks are loaded in one query, with the unread counts."""
+        ReadWatermark.record(self.profile, self.long, 2)
+        ReadWatermark.record(self.profile, self.short, 1)
+        with self.assertNumQueries(1):
+            threads = self.annotated()
+        self.assertEqual((threads['Long'].last_read, threads['Long'].unread_count()), (2, 3))
+        self.assertEqual((threads['Short'].last_read, threads['Short'].unread_count()), (1, 0))
+        self.assertEqual(threads['Long'].first_unread_url(), self.long.get_post_url(3))
+        self.assertEqual(threads['Short'].first_unread_url(), self.short.get_post_url(1))    # nothing left to read
+
+    def test_unviewed_thread(self):
+        """Tests that every post of a thread the user has never viewed is unread."""
+        thread = self.annotated()['Long']
+        self.assertEqual((thread.last_read, thread.unread_count()), (0, 5))
+        self.assertEqual(thread.first_unread_url(), self.long.get_post_url(1))
+
+
+def _create_profile(badge):
+    """Create and return a profile with the provided badge."""
+    user = User.objects.create_user('brother%d' % badge, 'brother%d@example.com' % badge, 'password')
+    return UserProfile.objects.create(user=user, badge=badge)
+
+
+def _create_thread(forum, owner, title, *sources):
+    """Create and return a thread in the provided forum, with one post for each provided source, as the views do."""
+    thread = Thread.objects.create(forum=forum, owner=owner, title=title, slug=slugify(title))
+    for number, source in enumerate(sources):
+        post = Post(thread=thread, user=owner, updated_by=owner, deleted=False)
+        post.set_source(source)
+        post.number = thread.reserve_post_number()
+        post.save()
+        forum.record_new_post(post, new_thread=(number == 0))
+    return thread
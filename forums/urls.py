@@ -12,6 +12,7 @@ urlpatterns = patterns('gtphipsi.forums.views',
     url(r'^add/$', 'add_forum', name='add_forum'),
     url(r'^subscriptions/$', 'subscriptions', name='subscribed_threads'),
     url(r'^my-threads/$', 'my_threads', name='my_threads'),
+    url(r'^search/$', 'search', name='search_forums'),
     url(r'^edit-post/(?P<id>\d+)/$', 'edit_post', name='edit_post'),
     url(r'^(?P<slug>[a-zA-Z0-9\-]+)/$', 'view_forum', name='view_forum'),
     url(r'^(?P<slug>[a-zA-Z0-9\-]+)/edit/$', 'edit_forum', name='edit_forum'),
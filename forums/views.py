@@ -8,6 +8,7 @@ This module exports the following view functions:
     - view_thread (request, forum, id, thread[, page])
     - subscriptions (request)
     - my_threads (request)
+    - search (request)
     - add_thread (request, slug)
     - edit_thread (request, forum, id, thread)
     - add_post (request, forum, id, thread)
@@ -15,14 +16,13 @@ This module exports the following view functions:
 
 """
 
-from datetime import datetime
 import logging
 
 from django.conf import settings
 from django.contrib.auth.decorators import login_required, permission_required
 from django.core.paginator import EmptyPage, InvalidPage, Paginator
 from django.core.urlresolvers import reverse
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from django.http import HttpResponseRedirect
 from django.shortcuts import get_object_or_404, render
 from django.template import RequestContext
@@ -30,7 +30,9 @@ from django.template.defaultfilters import slugify
 
 from gtphipsi.common import log_page_view
 from gtphipsi.forums.forms import ForumForm, PostForm, ThreadForm
-from gtphipsi.forums.models import Forum, Post, Thread
+from gtphipsi.forums.models import Forum, IndexEntry, Post, ReadWatermark, Thread
+from gtphipsi.forums.pagination import PostPaginator
+from gtphipsi.forums.search import parse_query
 
 
 log = logging.getLogger('django')
@@ -47,14 +49,9 @@ log = logging.getLogger('django')
 def forums(request):
     """Render a listing of all forums, including the most recent post of all threads within each forum."""
     log_page_view(request, 'Forum List')
-    forum_list = Forum.objects.all()
-    forums = []
-    for forum in forum_list:
-        if Post.objects.filter(thread__forum=forum).count():
-            last_post = Post.objects.filter(thread__forum=forum).order_by('-updated')[0]
-        else:
-            last_post = None
-        forums.append((forum, last_post))
+    forum_list = Forum.objects.select_related('last_post__thread__forum', 'last_post__user__user') \
+            .prefetch_related('moderators__user')
+    forums = [(forum, forum.last_post) for forum in forum_list]
     return render(request, 'forums/forums.html', {'forums': forums}, context_instance=RequestContext(request))
 
 
@@ -68,7 +65,7 @@ def view_forum(request, slug):
     """
     log_page_view(request, 'View Forum')
     forum = get_object_or_404(Forum, slug=slug)
-    is_mod = (request.user.get_profile() in forum.moderators.all())
+    is_mod = _is_moderator(request, forum)
     objects = Thread.objects.filter(forum=forum).order_by('-updated')
     paginator = Paginator(objects, settings.POSTS_PER_PAGE)
     try:
@@ -79,7 +76,8 @@ def view_forum(request, slug):
         threads = paginator.page(page)
     except (EmptyPage, InvalidPage):
         threads = paginator.page(paginator.num_pages)
-    return render(request, 'forums/view_forum.html', {'threads': threads, 'forum': forum, 'is_mod': is_mod},
+    return render(request, 'forums/view_forum.html',
+                  {'threads': threads, 'forum': forum, 'is_mod': is_mod, 'subscribed': _subscribed_thread_ids(request)},
                   context_instance=RequestContext(request))
 
 
@@ -122,8 +120,8 @@ def edit_forum(request, slug):
     """
     log_page_view(request, 'Edit Forum')
     forum = get_object_or_404(Forum, slug=slug)
-    profile = request.user.get_profile()
-    if profile not in forum.moderators.all() and not profile.is_admin():
+    profile = request.profile
+    if not _is_moderator(request, forum) and not profile.is_admin():
         return HttpResponseRedirect(reverse('forbidden'))
     if request.method == 'POST':
         form = ForumForm(request.POST, instance=forum)
@@ -156,53 +154,99 @@ def view_thread(request, forum, id, thread, page=1):
 
     log_page_view(request, 'View Thread')
     forum = get_object_or_404(Forum, slug=forum)
-    thread = get_object_or_404(Thread, id=id)
-    objects = Post.objects.filter(thread=thread).order_by('number')
-    paginator = Paginator(objects, settings.POSTS_PER_PAGE)
+    thread = get_object_or_404(Thread.objects.select_related('forum'), id=id)
+    paginator = PostPaginator(thread)
 
     try:
         posts = paginator.page(int(page))
     except (EmptyPage, InvalidPage):
         posts = paginator.page(paginator.num_pages)
 
-    profile = request.user.get_profile()
-    is_mod = (profile in forum.moderators.all())
-    subscribed = (profile in thread.subscribers.all())
+    profile = request.profile
+    is_mod = _is_moderator(request, forum)
+    subscribed = (thread.id in _subscribed_thread_ids(request))
 
     if subscribed and 'unsubscribe' in request.GET:
         profile.subscriptions.remove(thread)
         profile.save()
+        _subscribed_thread_ids(request).discard(thread.id)
         return HttpResponseRedirect(reverse('view_thread_page', kwargs={'forum': forum.slug, 'id': thread.id,
                                                                         'thread': thread.slug, 'page': page}))
     elif not subscribed and 'subscribe' in request.GET:
         profile.subscriptions.add(thread)
         profile.save()
+        _subscribed_thread_ids(request).add(thread.id)
         return HttpResponseRedirect(reverse('view_thread_page', kwargs={'forum': forum.slug, 'id': thread.id,
                                                                         'thread': thread.slug, 'page': page}))
 
+    if posts.object_list:
+        ReadWatermark.record(profile, thread, posts.end_index())
+
     return render(request, 'forums/view_thread.html',
-                  {'thread': thread, 'posts': posts, 'forum': forum, 'subscribed': subscribed, 'is_mod': is_mod},
+                  {'thread': thread, 'posts': posts, 'forum': forum, 'subscribed': subscribed, 'is_mod': is_mod,
+                   'can_moderate': is_mod or profile.is_admin()},
                   context_instance=RequestContext(request))
 
 
 @login_required
 def subscriptions(request):
-    """Render a listing of all threads to which the current user is subscribed."""
+    """Render a listing of all threads to which the current user is subscribed, with the number of unread posts in each."""
     log_page_view(request, 'Subscribed Threads')
-    threads = request.user.get_profile().subscriptions.all().order_by('-updated')
+    profile = request.profile
+    threads = ReadWatermark.annotate(profile.subscriptions.select_related('forum', 'owner__user').order_by('-updated'),
+                                     profile)
     return render(request, 'forums/subscriptions.html', {'threads': threads, 'subscribe': True},
                   context_instance=RequestContext(request))
 
 
 @login_required
 def my_threads(request):
-    """Render a listing of all threads belonging to the current user."""
+    """Render a listing of all threads belonging to the current user, with the number of unread posts in each."""
     log_page_view(request, 'My Threads')
-    threads = Thread.objects.filter(owner=request.user.get_profile()).order_by('-updated')
+    profile = request.profile
+    threads = ReadWatermark.annotate(Thread.objects.filter(owner=profile).select_related('forum').order_by('-updated'),
+                                     profile)
     return render(request, 'forums/subscriptions.html', {'threads': threads, 'subscribe': False},
                   context_instance=RequestContext(request))
 
 
+@login_required
+def search(request):
+    """Render a ranked, paginated listing of the posts matching a search query.
+
+    The query is read from the 'q' parameter of the query string, and the optional 'forum' parameter (a forum's slug)
+    restricts the results to a single forum. A post matches if it (or, for the first post of a thread, the thread's
+    title) contains every term of the query; deleted posts are never indexed, so they never match.
+
+    The ranking, counting, and paging are all done by the database against the search index, so only the posts on the
+    requested page are loaded.
+
+    """
+    log_page_view(request, 'Search Forums')
+    query = request.GET.get('q', '').strip()
+    forum = None
+    if request.GET.get('forum'):
+        forum = get_object_or_404(Forum, slug=request.GET.get('forum'))
+    terms = parse_query(query)
+    results = None
+    if terms:
+        paginator = Paginator(IndexEntry.search(terms, forum), settings.POSTS_PER_PAGE)
+        try:
+            page = int(request.GET.get('page', '1'))
+        except ValueError:
+            page = 1    # if 'page' parameter is not an integer, default to page 1
+        try:
+            results = paginator.page(page)
+        except (EmptyPage, InvalidPage):
+            results = paginator.page(paginator.num_pages)
+        ids = [result['post'] for result in results.object_list]
+        posts = Post.objects.select_related('thread__forum', 'user__user').in_bulk(ids)
+        results.object_list = [posts[id] for id in ids if id in posts]     # keep the posts in ranked order
+    return render(request, 'forums/search.html',
+                  {'query': query, 'terms': terms, 'forum': forum, 'results': results, 'forums': Forum.objects.all()},
+                  context_instance=RequestContext(request))
+
+
 @login_required
 @permission_required('forums.add_thread', login_url=settings.FORBIDDEN_URL)
 def add_thread(request, slug):
@@ -217,17 +261,20 @@ def add_thread(request, slug):
     if request.method == 'POST':
         form = ThreadForm(request.POST)
         if form.is_valid():
-            profile = request.user.get_profile()
+            profile = request.profile
             thread = form.save(commit=False)
             thread.forum = forum
             thread.owner = profile
             thread.slug = slugify(thread.title)
-            thread.save()
-            thread.subscribers.add(profile)
-            thread.save()
-            body = _bb_code_escape(form.cleaned_data.get('post'))
-            post = Post.objects.create(thread=thread, user=profile, updated_by=profile, number=1, deleted=False, body=body)
-            post.save()     # create and save the first post belonging to the new thread
+            thread.num_posts = 1
+            post = Post(user=profile, updated_by=profile, number=1, deleted=False)
+            post.set_source(form.cleaned_data.get('post'))
+            with transaction.commit_on_success():
+                thread.save()
+                thread.subscribers.add(profile)
+                post.thread = thread
+                post.save()     # create and save the first post belonging to the new thread
+            forum.record_new_post(post, new_thread=True)
             return HttpResponseRedirect(thread.get_absolute_url())
     else:
         form = ThreadForm()
@@ -254,22 +301,24 @@ def edit_thread(request, forum, id, thread):
     forum = get_object_or_404(Forum, slug=forum)
     thread = get_object_or_404(Thread, id=id)
     first_post = get_object_or_404(Post, thread=thread, number=1)
-    profile = request.user.get_profile()
-    if thread.owner != profile and profile not in thread.forum.moderators.all() and not profile.is_admin():
+    profile = request.profile
+    if thread.owner_id != profile.id and not _is_moderator(request, thread.forum) and not profile.is_admin():
         return HttpResponseRedirect(reverse('forbidden'))
     if request.method == 'POST':
         form = ThreadForm(request.POST, instance=thread)
         if form.is_valid():
             form.save()
-            first_post.body = _bb_code_escape(form.cleaned_data.get('post'))
+            first_post.set_source(form.cleaned_data.get('post'))
             first_post.updated_by = profile
             first_post.save()   # update and save the thread's first post
+            thread.forum.record_updated_post(first_post)
             return HttpResponseRedirect(thread.get_absolute_url())
     else:
         if 'delete' in request.GET and request.GET.get('delete') == 'true':
             thread.delete()
+            thread.forum.rebuild_counters()
             return HttpResponseRedirect(forum.get_absolute_url())
-        form = ThreadForm(instance=thread, initial={'post': _bb_code_unescape(first_post.body)})
+        form = ThreadForm(instance=thread, initial={'post': first_post.source})
     return render(request, 'forums/add_thread.html',
                   {'form': form, 'forum': forum, 'thread': thread, 'create': False},
                   context_instance=RequestContext(request))
@@ -300,19 +349,19 @@ def add_post(request, forum, id, thread):
                 pass
         form = PostForm(request.POST)
         if form.is_valid():
-            profile = request.user.get_profile()
+            profile = request.profile
             post = form.save(commit=False)
             post.thread = thread
             post.user = profile
             post.updated_by = profile
             post.deleted = False
-            post.number = Post.objects.filter(thread=thread).count() + 1
             if quote is not None:
                 post.quote = quote
-            post.body = _bb_code_escape(post.body)
-            post.save()
-            thread.updated = datetime.now()
-            thread.save()   # set the thread's updated time to now, since the thread has a new post
+            post.set_source(post.source)
+            with transaction.commit_on_success():
+                post.number = thread.reserve_post_number()  # also sets the thread's updated time to now
+                post.save()
+            thread.forum.record_new_post(post)
             return HttpResponseRedirect(post.get_absolute_url())
     else:
         quote = None
@@ -342,25 +391,25 @@ def edit_post(request, id):
     """
     log_page_view(request, 'Edit Post')
     post = get_object_or_404(Post, id=id)
-    profile = request.user.get_profile()
-    if post.user != profile and profile not in post.thread.forum.moderators.all() and not profile.is_admin():
+    profile = request.profile
+    if post.user_id != profile.id and not _is_moderator(request, post.thread.forum) and not profile.is_admin():
         return HttpResponseRedirect(reverse('forbidden'))
     if request.method == 'POST':
-        post.body = _bb_code_unescape(post.body)
         form = PostForm(request.POST, instance=post)
         if form.is_valid():
             post = form.save(commit=False)
-            post.body = _bb_code_escape(post.body)
+            post.set_source(post.source)
             post.updated_by = profile
             post.save()
+            post.thread.forum.record_updated_post(post)
             return HttpResponseRedirect(post.get_absolute_url())
     else:
         if 'delete' in request.GET and request.GET.get('delete') == 'true':
             post.deleted = True
             post.updated_by = profile
             post.save()
+            post.thread.forum.record_updated_post(post)
             return HttpResponseRedirect(post.thread.get_absolute_url())
-        post.body = _bb_code_unescape(post.body)
         form = PostForm(instance=post)
     return render(request, 'forums/add_post.html',
                   {'form': form, 'forum': post.thread.forum, 'thread': post.thread, 'quote': post.quote, 'create': False, 'post': post},
@@ -378,37 +427,32 @@ def edit_post(request, id):
 ## ============================================= ##
 
 
-def _bb_code_escape(text):
-    r"""Return an escaped version of the provided text, with BB markup converted to HTML.
+def _moderated_forum_ids(request):
+    """Return the set of IDs of the forums moderated by the current user, loading it at most once per request.
 
-    The text '<b>bold</b> & [B]bold[/B] [I]italic[/I] [U]underline[/U] \n [URL="/"]link[/URL]'
-    becomes  '&lt;b&gt;bold&lt;/b&gt; &amp; <b>bold</b> <i>italic</i> <u>underline</u> <br /> <a href="/">link</a>'.
-
-    Posts are rendered as-is (i.e., without HTML escaping) in the 'view_thread.html' template, so user input must be
-    escaped before being stored in the database and rendered in the browser. Any HTML tags in the input will be
-    converted to a safe representation (replacing '<', '>', and '&' with the HTML literals '&lt;', '&gt;', and '&amp;').
-    Then any BB markup in the input ('[B]...[/B]', '[URL="..."]...[/URL]', etc.) is converted to HTML.
+    The IDs are read from the index on the moderators table in a single query, without loading any profiles, and then
+    cached on the request, so that every membership check made while handling the request shares them.
 
     """
-    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;') \
-            .replace('[B]', '<b>').replace('[/B]', '</b>').replace('[I]', '<i>').replace('[/I]', '</i>') \
-            .replace('[U]', '<u>').replace('[/U]', '</u>').replace('\n', '<br />') \
-            .replace('[URL=\"', '<a href=\"').replace('\"]', '\">').replace('[/URL]', '</a>')
-
+    if not hasattr(request, '_moderated_forum_ids'):
+        request._moderated_forum_ids = set(Forum.moderators.through.objects.filter(
+            userprofile=request.profile).values_list('forum_id', flat=True))
+    return request._moderated_forum_ids
 
-def _bb_code_unescape(text):
-    r"""Return an unescaped version of the provided text, with HTML converted to BB markup.
 
-    The text '&lt;b&gt;bold&lt;/b&gt; &amp; <b>bold</b> <i>italic</i> <u>underline</u> <br /> <a href="/">link</a>'
-    becomes  '<b>bold</b> & [B]bold[/B] [I]italic[/I] [U]underline[/U] \n [URL="/"]link[/URL]'.
+def _subscribed_thread_ids(request):
+    """Return the set of IDs of the threads to which the current user is subscribed, loading it at most once per request.
 
-    When users edit posts, they expect to see the BB markup they originally wrote and not the escaped text returned by
-    _bb_code_escape(). Additionally, if previously-escaped text is re-escaped, the escaped HTML tags will be removed
-    and the post will not be properly formatted in the browser. This function avoids these issues by restoring escaped
-    text to its original (unescaped) form.
+    Like _moderated_forum_ids(), the set is cached on the request. Views that change the user's subscriptions should
+    update the returned set as well, so that the rest of the request sees the change.
 
     """
-    return text.replace('<b>', '[B]').replace('</b>', '[/B]').replace('<i>', '[I]').replace('</i>', '[/I]') \
-            .replace('<u>', '[U]').replace('</u>', '[/U]').replace('<br />', '\n') \
-            .replace('<a href=\"', '[URL=\"').replace('\">', '\"]').replace('</a>', '[/URL]') \
-            .replace('&amp;', '&').replace('&lt;', '<').replace('&gt;', '>')
+    if not hasattr(request, '_subscribed_thread_ids'):
+        request._subscribed_thread_ids = set(Thread.subscribers.through.objects.filter(
+            userprofile=request.profile).values_list('thread_id', flat=True))
+    return request._subscribed_thread_ids
+
+
+def _is_moderator(request, forum):
+    """Return True if the current user is one of the provided forum's moderators, False otherwise."""
+    return forum.id in _moderated_forum_ids(request)
@@ -0,0 +1,86 @@
+"""Management command to deliver the messages in the outgoing mail queue of the gtphipsi.mailqueue package.
+
+Run this command with 'python manage.py send_queued_mail' every minute or so (e.g., from cron), or start it once with
+'python manage.py send_queued_mail --loop' to keep it running and checking for new messages. Each batch of messages is
+claimed before it is delivered (see QueuedMessage.claim), so several copies of the command may run at once (e.g., a
+looping worker and a cron job) without delivering any message twice.
+
+"""
+
+import logging
+from optparse import make_option
+import smtplib
+import socket
+import time
+
+from django.core.mail import get_connection
+from django.core.management.base import NoArgsCommand
+
+from gtphipsi.mailqueue.models import QueuedMessage
+
+
+log = logging.getLogger('django')
+
+
+class Command(NoArgsCommand):
+    """Claim and deliver queued messages in batches, opening one SMTP connection for each batch."""
+
+    help = 'Deliver queued messages in batches, opening one SMTP connection for each batch.'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--batch-size', type='int', dest='batch_size', default=100,
+                    help='The number of messages to deliver over each SMTP connection (default: 100).'),
+        make_option('--loop', action='store_true', dest='loop', default=False,
+                    help='Keep running, checking for new messages whenever the queue is empty.'),
+        make_option('--sleep', type='int', dest='sleep', default=30,
+                    help='The number of seconds to wait between checks when running with --loop (default: 30).'),
+    )
+
+    def handle_noargs(self, **options):
+        """Deliver batches of messages until the queue is empty (and, with --loop, wait for more)."""
+        batch_size = options.get('batch_size')
+        verbosity = int(options.get('verbosity', 1))
+        sent = failed = 0
+        while True:
+            batch = QueuedMessage.claim(batch_size)
+            if batch:
+                batch_sent, batch_failed = self._send_batch(batch)
+                sent += batch_sent
+                failed += batch_failed
+                if verbosity > 1:
+                    self.stdout.write('Sent %d messages (%d failed)...\n' % (sent, failed))
+                if batch_sent:
+                    continue    # keep going while messages are being delivered; stop (or wait) if all of them failed
+            if not options.get('loop'):
+                break
+            time.sleep(options.get('sleep'))
+        if verbosity > 0:
+            self.stdout.write('Sent %d messages; %d deliveries failed.\n' % (sent, failed))
+
+    def _send_batch(self, batch):
+        """Deliver the provided messages over a single SMTP connection, and return the numbers sent and failed."""
+        sent = failed = 0
+        connection = get_connection(fail_silently=False)
+        try:
+            connection.open()
+        except (smtplib.SMTPException, socket.error) as e:
+            log.warning('Could not connect to the SMTP server to send queued mail: %s', e)
+            for message in batch:
+                message.defer(e)
+            return 0, len(batch)
+        try:
+            for message in batch:
+                try:
+                    connection.send_messages([message.to_email_message(connection)])
+                except (smtplib.SMTPException, socket.error) as e:
+                    log.warning('Could not send queued message %d (\'%s\'): %s', message.id, message.subject, e)
+                    message.defer(e)
+                    failed += 1
+                else:
+                    message.delete()
+                    sent += 1
+        finally:
+            try:
+                connection.close()
+            except (smtplib.SMTPException, socket.error):
+                pass
+        return sent, failed
@@ -0,0 +1,128 @@
+"""Models for the gtphipsi.mailqueue package.
+
+Sending mail over SMTP can take seconds per message, so view functions do not send mail themselves. Instead, they add
+their messages to a queue stored in the database (see QueuedMessage.enqueue), and the 'send_queued_mail' management
+command delivers the queued messages in batches, retrying failed deliveries with an increasing delay between attempts.
+
+This module exports the following model class:
+    - QueuedMessage
+
+This module exports the following constants:
+    - MAX_RECIPIENTS
+    - MAX_ATTEMPTS
+    - RETRY_DELAY
+    - CLAIM_TIMEOUT
+
+"""
+
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.mail.message import EmailMessage
+from django.db import models
+
+
+# The greatest number of recipients (including BCC recipients) of a single queued message. Messages with more recipients
+# are split into several messages when they are queued, since many SMTP servers reject messages with too many recipients.
+MAX_RECIPIENTS = 50
+
+# The number of times to try to deliver a message before giving up on it.
+MAX_ATTEMPTS = 6
+
+# The delay before the second attempt to deliver a message; the delay doubles after each failed attempt.
+RETRY_DELAY = timedelta(minutes=1)
+
+# How long a claimed message is reserved for the worker that claimed it (see QueuedMessage.claim). If the worker stops
+# before it delivers or defers the message, another worker tries again once the claim expires.
+CLAIM_TIMEOUT = timedelta(minutes=30)
+
+
+class QueuedMessage(models.Model):
+
+    """An email message waiting to be delivered.
+
+    Addresses are stored one per line. A message is deleted from the queue as soon as it has been delivered. If it cannot
+    be delivered after MAX_ATTEMPTS attempts, it is marked as 'failed' and kept, along with the last error, so that an
+    administrator can find out what went wrong; failed messages are never retried.
+
+    """
+
+    subject = models.CharField(max_length=250)
+    body = models.TextField()
+    from_email = models.CharField(max_length=250)
+    to = models.TextField(blank=True)
+    bcc = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    next_attempt = models.DateTimeField(default=datetime.now, db_index=True)    # when to try to deliver the message
+    attempts = models.PositiveIntegerField(default=0)
+    failed = models.BooleanField(blank=True)
+    last_error = models.TextField(blank=True)
+
+    @classmethod
+    def enqueue(cls, message):
+        """Add the provided EmailMessage to the queue, splitting it into several messages if it has many recipients.
+
+        Every recipient in the message's 'to' list receives exactly one copy: the first queued message is addressed to
+        them, and the BCC recipients are divided among the queued messages, at most MAX_RECIPIENTS per message.
+
+        """
+        to = list(message.to)
+        bcc = list(message.bcc)
+        chunks = [bcc[:max(MAX_RECIPIENTS - len(to), 0)]]
+        for i in range(len(chunks[0]), len(bcc), MAX_RECIPIENTS):
+            chunks.append(bcc[i:i + MAX_RECIPIENTS])
+        queued = []
+        for chunk in chunks:
+            if to or chunk:
+                queued.append(cls(subject=message.subject, body=message.body,
+                                  from_email=message.from_email or settings.DEFAULT_FROM_EMAIL,
+                                  to='\n'.join(to), bcc='\n'.join(chunk)))
+            to = []     # only the first message goes to the 'to' recipients
+        cls.objects.bulk_create(queued)
+
+    @classmethod
+    def pending(cls, limit):
+        """Return a list of at most 'limit' messages that are due to be delivered, oldest first."""
+        return list(cls.objects.filter(failed=False, next_attempt__lte=datetime.now()).order_by('id')[:limit])
+
+    @classmethod
+    def claim(cls, limit):
+        """Claim and return a list of at most 'limit' pending messages, oldest first, for the caller to deliver.
+
+        Each message is claimed by pushing its next attempt CLAIM_TIMEOUT into the future, with an UPDATE statement that
+        only matches the message if its next attempt is still the one that was read. If several workers (e.g., copies of
+        the 'send_queued_mail' command) read the same pending messages, each message is claimed, and thus delivered, by
+        only one of them; the others leave it out of their lists.
+
+        """
+        claimed_until = datetime.now() + CLAIM_TIMEOUT
+        claimed = []
+        for message in cls.pending(limit):
+            if cls.objects.filter(id=message.id, next_attempt=message.next_attempt).update(next_attempt=claimed_until):
+                message.next_attempt = claimed_until
+                claimed.append(message)
+        return claimed
+
+    def to_email_message(self, connection=None):
+        """Return an EmailMessage for the queued message, which will be sent over the provided connection (if any)."""
+        return EmailMessage(self.subject, self.body, self.from_email, to=self._split(self.to), bcc=self._split(self.bcc),
+                            connection=connection)
+
+    def defer(self, error):
+        """Record a failed attempt to deliver the message, and schedule the next attempt or mark the message as failed."""
+        self.attempts += 1
+        self.last_error = unicode(error)
+        if self.attempts >= MAX_ATTEMPTS:
+            self.failed = True
+        else:
+            self.next_attempt = datetime.now() + RETRY_DELAY * (2 ** (self.attempts - 1))
+        self.save()
+
+    def __unicode__(self):
+        """Return a Unicode string representation of the queued message."""
+        return unicode(self.subject)
+
+    @staticmethod
+    def _split(addresses):
+        """Return a list of the addresses in the provided newline-separated string."""
+        return [address for address in addresses.split('\n') if address]
@@ -0,0 +1,155 @@
+"""
+This file demonstrates writing tests using the unittest module. These will pass
+when you run "manage.py test".
+
+Replace this with more appropriate tests for your application.
+"""
+
+from datetime import datetime, timedelta
+import smtplib
+import socket
+from StringIO import StringIO
+
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.mail.message import EmailMessage
+from django.core.management import call_command
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from gtphipsi.mailqueue.models import QueuedMessage, CLAIM_TIMEOUT, MAX_ATTEMPTS, MAX_RECIPIENTS, RETRY_DELAY
+
+
+class SimpleTest(TestCase):
+    def test_basic_addition(self):
+        """
+        Tests that 1 + 1 always equals 2.
+        """
+        self.assertEqual(1 + 1, 2)
+
+
+class QueuedMessageTest(TestCase):
+    """Tests for queueing messages, finding the messages due to be delivered, and deferring failed deliveries."""
+
+    def test_enqueue(self):
+        """A message with few recipients is queued as is."""
+        QueuedMessage.enqueue(EmailMessage('Subject', 'Body', 'from@example.com', ['a@example.com', 'b@example.com'],
+                                           bcc=['c@example.com']))
+        message = QueuedMessage.objects.get()
+        self.assertEqual((message.subject, message.body, message.from_email), ('Subject', 'Body', 'from@example.com'))
+        email = message.to_email_message()
+        self.assertEqual((email.to, email.bcc), (['a@example.com', 'b@example.com'], ['c@example.com']))
+
+    def test_enqueue_many_recipients(self):
+        """A message with many recipients is split, and every recipient receives exactly one copy."""
+        to = ['to%d@example.com' % i for i in range(2)]
+        bcc = ['bcc%d@example.com' % i for i in range(2 * MAX_RECIPIENTS + 20)]
+        QueuedMessage.enqueue(EmailMessage('Subject', 'Body', None, to, bcc=bcc))
+        messages = [message.to_email_message() for message in QueuedMessage.objects.order_by('id')]
+        self.assertEqual(len(messages), 3)
+        self.assertEqual(messages[0].to, to)
+        self.assertEqual([message.to for message in messages[1:]], [[], []])
+        self.assertEqual(sum((message.bcc for message in messages), []), bcc)
+        self.assertTrue(all(len(message.recipients()) <= MAX_RECIPIENTS for message in messages))
+
+    def test_pending(self):
+        """Only messages that are due and have not failed are pending, oldest first, up to the limit."""
+        for subject in ('first', 'second', 'third'):
+            QueuedMessage.objects.create(subject=subject, body='', from_email='from@example.com', to='to@example.com')
+        QueuedMessage.objects.create(subject='later', body='', from_email='from@example.com', to='to@example.com',
+                                     next_attempt=datetime.now() + timedelta(hours=1))
+        QueuedMessage.objects.create(subject='failed', body='', from_email='from@example.com', to='to@example.com',
+                                     failed=True)
+        self.assertEqual([message.subject for message in QueuedMessage.pending(10)], ['first', 'second', 'third'])
+        self.assertEqual([message.subject for message in QueuedMessage.pending(2)], ['first', 'second'])
+
+    def test_claim(self):
+        """A claimed message is no longer pending, and a message another worker claimed first is not claimed again."""
+        for subject in ('first', 'second', 'third'):
+            QueuedMessage.objects.create(subject=subject, body='', from_email='from@example.com', to='to@example.com')
+        stale = QueuedMessage.pending(10)     # read by another worker, which has not claimed the messages yet
+        self.assertEqual([message.subject for message in QueuedMessage.claim(2)], ['first', 'second'])
+        self.assertTrue(all(message.next_attempt > datetime.now() + CLAIM_TIMEOUT - timedelta(minutes=1)
+                            for message in QueuedMessage.objects.filter(subject__in=['first', 'second'])))
+        self.assertEqual([message.subject for message in QueuedMessage.pending(10)], ['third'])
+        QueuedMessage.claim(10)
+        self.assertEqual(QueuedMessage.claim(10), [])
+        for message in stale:   # the other worker's updates no longer match any message
+            self.assertEqual(QueuedMessage.objects.filter(id=message.id, next_attempt=message.next_attempt).count(), 0)
+
+    def test_defer(self):
+        """Each failed attempt doubles the delay before the next one, until the message is marked as failed."""
+        message = QueuedMessage.objects.create(subject='Subject', body='', from_email='from@example.com', to='to@x.com')
+        for attempt in range(1, MAX_ATTEMPTS):
+            before = datetime.now()
+            message.defer(smtplib.SMTPException('try %d' % attempt))
+            message = QueuedMessage.objects.get(id=message.id)
+            delay = RETRY_DELAY * (2 ** (attempt - 1))
+            self.assertEqual((message.attempts, message.failed), (attempt, False))
+            self.assertEqual(message.last_error, 'try %d' % attempt)
+            self.assertTrue(before + delay <= message.next_attempt <= datetime.now() + delay)
+        message.defer(smtplib.SMTPException('last try'))
+        self.assertTrue(QueuedMessage.objects.get(id=message.id).failed)
+        self.assertEqual(QueuedMessage.pending(10), [])
+
+
+class SendQueuedMailTest(TestCase):
+    """Tests that the 'send_queued_mail' command delivers queued messages and defers those it cannot deliver."""
+
+    def setUp(self):
+        """Queue a message to a working address and a message to an address that bounces."""
+        QueuedMessage.enqueue(EmailMessage('Good', 'Body', 'from@example.com', ['good@example.com']))
+        QueuedMessage.enqueue(EmailMessage('Bad', 'Body', 'from@example.com', ['bounce@example.com']))
+
+    def send(self):
+        """Run the command, discarding its output."""
+        call_command('send_queued_mail', verbosity=0, stdout=StringIO())
+
+    @override_settings(EMAIL_BACKEND='gtphipsi.mailqueue.tests.BouncingBackend')
+    def test_success_and_retry(self):
+        """Delivered messages are removed from the queue; the others are kept and retried later."""
+        self.send()
+        self.assertEqual([message.subject for message in mail.outbox], ['Good'])
+        message = QueuedMessage.objects.get()
+        self.assertEqual((message.subject, message.attempts, message.failed), ('Bad', 1, False))
+        self.assertTrue(message.next_attempt > datetime.now())
+        self.send()     # the bounced message is not due yet, so nothing happens
+        self.assertEqual((len(mail.outbox), QueuedMessage.objects.get().attempts), (1, 1))
+
+    def test_claimed_messages_skipped(self):
+        """Messages claimed by another worker are not delivered again."""
+        QueuedMessage.claim(1)
+        self.send()
+        self.assertEqual([message.subject for message in mail.outbox], ['Bad'])
+        self.assertEqual(QueuedMessage.objects.get().subject, 'Good')
+
+    def test_all_delivered(self):
+        """With a working connection, every message is delivered and the queue is emptied."""
+        self.send()
+        self.assertEqual(sorted(message.subject for message in mail.outbox), ['Bad', 'Good'])
+        self.assertFalse(QueuedMessage.objects.exists())
+
+    @override_settings(EMAIL_BACKEND='gtphipsi.mailqueue.tests.UnreachableBackend')
+    def test_connection_failure(self):
+        """If the SMTP server cannot be reached, every message in the batch is deferred."""
+        self.send()
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(sorted(QueuedMessage.objects.values_list('attempts', flat=True)), [1, 1])
+
+
+class BouncingBackend(EmailBackend):
+    """An email backend that fails to deliver any message addressed to 'bounce@example.com'."""
+
+    def send_messages(self, messages):
+        """Deliver the provided messages to the test outbox, unless any of them bounces."""
+        if any('bounce@example.com' in message.recipients() for message in messages):
+            raise smtplib.SMTPRecipientsRefused({'bounce@example.com': (550, 'No such user')})
+        return super(BouncingBackend, self).send_messages(messages)
+
+
+class UnreachableBackend(EmailBackend):
+    """An email backend that cannot connect to its server."""
+
+    def open(self):
+        """Fail to connect."""
+        raise socket.error('Connection refused')
@@ -0,0 +1,49 @@
+"""Middleware for the gtphipsi web application.
+
+This module exports the following middleware classes:
+    - UserProfileMiddleware
+
+"""
+
+from django.utils.functional import SimpleLazyObject
+
+from gtphipsi.brothers.models import UserProfile
+
+
+class UserProfileMiddleware(object):
+    """Give every request a lazily loaded 'profile' attribute: the current user's UserProfile, or None if anonymous.
+
+    The profile is loaded the first time 'request.profile' is used, in a single query that also loads its User and both
+    of its visibility settings, and then remembered for the rest of the request. It is also stored as the user's cached
+    profile, so calls to request.user.get_profile() return the same object without another query. This middleware must
+    come after django.contrib.auth.middleware.AuthenticationMiddleware in MIDDLEWARE_CLASSES.
+
+    """
+
+    def process_request(self, request):
+        """Attach the lazy 'profile' attribute to the request (or None, if the user is anonymous)."""
+        if request.user.is_authenticated():
+            request.profile = SimpleLazyObject(lambda: _load_profile(request))
+        else:
+            request.profile = None
+        return None
+
+
+
+
+
+
+## ============================================= ##
+##                                               ##
+##               Private Functions               ##
+##                                               ##
+## ============================================= ##
+
+
+def _load_profile(request):
+    """Return the profile of the request's user, loaded along with its user and visibility settings."""
+    user = request.user
+    profile = UserProfile.objects.select_related('user', 'public_visibility', 'chapter_visibility').get(user=user)
+    profile.user = user     # share the request's user instance (it may have cached data of its own)
+    user._profile_cache = profile
+    return profile
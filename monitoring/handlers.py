@@ -0,0 +1,110 @@
+"""Logging handlers and formatters for the gtphipsi.monitoring package.
+
+Writing to a log file can block for as long as the disk takes, so the access log is not written by the thread handling
+a request. Instead, QueueFileHandler puts each log record on a queue, and a background thread formats the records and
+appends them to the file. JsonFormatter formats each record as a single line of JSON, so the log can be read back by
+programs (see the 'access_log_report' management command) without parsing free-form messages.
+
+This module exports the following classes:
+    - QueueFileHandler
+    - JsonFormatter
+
+"""
+
+from datetime import datetime
+import json
+import logging
+import os
+import threading
+
+try:
+    from Queue import Full, Queue
+except ImportError:     # Python 3
+    from queue import Full, Queue
+
+
+class QueueFileHandler(logging.Handler):
+    """A handler that writes log records to a file from a background thread, so that logging never blocks a request.
+
+    If the background thread falls more than 'capacity' records behind, new records are dropped rather than making the
+    requests that log them wait. The thread is started when the first record is logged (and again in a forked child
+    process, since threads do not survive a fork).
+
+    """
+
+    def __init__(self, filename, mode='a', encoding='utf-8', capacity=10000):
+        """Create a handler that appends records to the file with the provided name."""
+        logging.Handler.__init__(self)
+        self.filename = os.path.abspath(filename)
+        self.mode = mode
+        self.encoding = encoding
+        self.queue = Queue(capacity)
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def emit(self, record):
+        """Queue the provided record to be formatted and written by the background thread."""
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            pass    # the disk can't keep up; losing a log record is better than slowing down every request
+
+    def close(self):
+        """Write any queued records, stop the background thread, and close the handler."""
+        if self._thread is not None and self._pid == os.getpid():
+            self.queue.put(None)
+            self._thread.join(5)
+            self._thread = None
+        logging.Handler.close(self)
+
+    def _start(self):
+        """Start the background thread that writes the queued records (if another thread hasn't just started it)."""
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self._thread = threading.Thread(target=self._write_records, name='QueueFileHandler')
+                self._thread.daemon = True
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def _write_records(self):
+        """Write queued records to the file until the handler is closed, flushing whenever the queue is empty."""
+        stream = open(self.filename, self.mode)
+        try:
+            while True:
+                record = self.queue.get()
+                if record is None:
+                    break
+                try:
+                    line = self.format(record) + '\n'
+                    if not isinstance(line, str):
+                        line = line.encode(self.encoding)
+                    stream.write(line)
+                    if self.queue.empty():
+                        stream.flush()
+                except Exception:
+                    self.handleError(record)
+        finally:
+            stream.close()
+
+
+class JsonFormatter(logging.Formatter):
+    """A formatter that writes each record as a line of JSON.
+
+    Each line contains the time, level, logger name, and message of the record, along with the items of the record's
+    'data' dictionary, if it has one (pass it with the 'extra' argument: log.info('message', extra={'data': {...}})).
+
+    """
+
+    def format(self, record):
+        """Return the provided record formatted as a single line of JSON."""
+        entry = {
+            'time': datetime.fromtimestamp(record.created).strftime('%Y-%m-%dT%H:%M:%S.%f'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(getattr(record, 'data', {}))
+        return json.dumps(entry, sort_keys=True)
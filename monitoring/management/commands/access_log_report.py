@@ -0,0 +1,69 @@
+"""Management command to summarize the access log of the gtphipsi.monitoring package.
+
+Run this command with 'python manage.py access_log_report' to list the slowest views recorded in the access log (see
+gtphipsi.monitoring.middleware.AccessLogMiddleware), or pass the names of one or more (e.g., rotated) log files to
+summarize those instead.
+
+"""
+
+import json
+from optparse import make_option
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from gtphipsi.monitoring.stats import percentile
+
+
+class Command(BaseCommand):
+    """Summarize the latency and number of queries of each view in the access log, slowest views first."""
+
+    args = '[log_file ...]'
+    help = 'Summarize the latency and number of queries of each view in the access log, slowest views first.'
+    option_list = BaseCommand.option_list + (
+        make_option('--top', type='int', dest='top', default=10,
+                    help='The number of views to list (default: 10).'),
+        make_option('--sort', dest='sort', default='p95', choices=['mean', 'p95', 'max', 'total'],
+                    help='The latency statistic by which to sort the views: mean, p95, max, or total (default: p95).'),
+    )
+
+    def handle(self, *args, **options):
+        """Read the log files, group their records by view, and print the slowest views."""
+        files = args or [os.path.join(settings.GTPHIPSI_APP_ROOT, 'log', 'access.log')]
+        latencies = {}
+        queries = {}
+        skipped = 0
+        for filename in files:
+            try:
+                log_file = open(filename)
+            except IOError as e:
+                raise CommandError('Could not open %s: %s' % (filename, e))
+            for line in log_file:
+                try:
+                    entry = json.loads(line)
+                    view = entry.get('view') or entry.get('page') or entry['path']
+                    latency = float(entry['latency_ms'])
+                except (ValueError, KeyError, TypeError):
+                    skipped += 1
+                    continue
+                latencies.setdefault(view, []).append(latency)
+                queries.setdefault(view, []).append(entry.get('queries') or 0)
+            log_file.close()
+
+        rows = []
+        for view, values in latencies.items():
+            values.sort()
+            stats = {'mean': sum(values) / len(values), 'p95': percentile(values, 0.95), 'max': values[-1],
+                     'total': sum(values)}
+            rows.append((stats[options.get('sort')], view, len(values), stats,
+                         float(sum(queries[view])) / len(queries[view])))
+        rows.sort(reverse=True)
+
+        self.stdout.write('%-60s %8s %10s %10s %10s %8s\n' % ('View', 'Requests', 'Mean (ms)', 'p95 (ms)', 'Max (ms)',
+                                                            'Queries'))
+        for sort_key, view, count, stats, mean_queries in rows[:options.get('top')]:
+            self.stdout.write('%-60s %8d %10.1f %10.1f %10.1f %8.1f\n' % (view[:60], count, stats['mean'], stats['p95'],
+                                                                        stats['max'], mean_queries))
+        if skipped and int(options.get('verbosity', 1)) > 0:
+            self.stdout.write('Skipped %d malformed lines.\n' % skipped)
@@ -0,0 +1,39 @@
+"""Management command to print the per-view statistics recorded by the gtphipsi.monitoring package.
+
+Run this command with 'python manage.py view_profile_report' to print the 50th, 95th, and 99th percentiles of the wall
+time, number of SQL queries, and SQL time of each view over the past hour, as recorded by ViewProfilingMiddleware in
+every server process sharing the cache. This is the same report shown at '/monitoring/views/'. The command runs in a
+process of its own, so it only finds the statistics of the server processes if they use a shared cache backend.
+
+"""
+
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from gtphipsi.monitoring.profiling import collect, has_shared_cache, METRICS
+
+
+class Command(NoArgsCommand):
+    """Print the percentiles of each view's wall time, queries, and SQL time over the past hour, slowest views first."""
+
+    help = 'Print the percentiles of each view\'s wall time, queries, and SQL time over the past hour, slowest first.'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--top', type='int', dest='top', default=20,
+                    help='The number of views to list (default: 20).'),
+    )
+
+    def handle_noargs(self, **options):
+        """Merge the statistics of all processes and print them."""
+        if not has_shared_cache():
+            self.stderr.write('The cache backend is not shared between processes, so no statistics can be found. Set '
+                              'CACHES to a shared backend, such as memcached, to use this command.\n')
+        profiles = sorted(collect().items(), key=lambda item: item[1]['wall_ms'].percentile(0.95), reverse=True)
+        self.stdout.write('%-55s %8s  %-26s %-20s %-26s\n' % ('View', 'Requests', 'Wall ms (p50/p95/p99)',
+                                                            'Queries (p50/p95/p99)', 'SQL ms (p50/p95/p99)'))
+        for view, metrics in profiles[:options.get('top')]:
+            columns = ['%.1f/%.1f/%.1f' % (metrics[metric].percentile(0.5), metrics[metric].percentile(0.95),
+                                           metrics[metric].percentile(0.99)) for metric in METRICS]
+            self.stdout.write('%-55s %8d  %-26s %-20s %-26s\n' % ((view[:55], metrics['wall_ms'].count) + tuple(columns)))
+        if not profiles and int(options.get('verbosity', 1)) > 0:
+            self.stdout.write('No requests have been recorded in the past hour.\n')
@@ -0,0 +1,90 @@
+"""Middleware for the gtphipsi.monitoring package.
+
+This module exports the following middleware classes:
+    - AccessLogMiddleware
+    - ViewProfilingMiddleware
+
+"""
+
+import logging
+import time
+
+from gtphipsi.monitoring import profiling, sql
+
+
+access_log = logging.getLogger('gtphipsi.access')
+
+
+class AccessLogMiddleware(object):
+    """Log one structured record for every request: its view, user, status, latency, and number of SQL queries.
+
+    Records are logged to the 'gtphipsi.access' logger at the INFO level, with their fields in a 'data' dictionary
+    (see gtphipsi.monitoring.handlers.JsonFormatter). If that level is disabled, the middleware does nothing at all. The
+    view is named by the page name passed to gtphipsi.common.log_page_view, or by the view function's dotted path.
+
+    This middleware should come first in MIDDLEWARE_CLASSES, so that its latency covers all of the other middleware.
+
+    """
+
+    def process_request(self, request):
+        """Note the time at which the request started, and start counting its queries."""
+        if access_log.isEnabledFor(logging.INFO):
+            sql.install()
+            sql.reset()
+            request._access_log_start = time.time()
+        return None
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """Note the dotted path of the view function handling the request."""
+        request.view_name = '%s.%s' % (view_func.__module__, view_func.__name__)
+        return None
+
+    def process_response(self, request, response):
+        """Log the record for the request."""
+        start = getattr(request, '_access_log_start', None)
+        if start is not None:
+            queries, query_time = sql.get_stats()
+            user = getattr(request, 'user', None)
+            access_log.info('%s %s', request.method, request.path, extra={'data': {
+                'view': getattr(request, 'view_name', None),
+                'page': getattr(request, 'page_name', None),
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'user': user.username if user is not None and user.is_authenticated() else None,
+                'latency_ms': round((time.time() - start) * 1000, 1),
+                'queries': queries,
+                'query_ms': round(query_time * 1000, 1),
+            }})
+        return response
+
+
+class ViewProfilingMiddleware(object):
+    """Record the wall time, number of SQL queries, and SQL time of every request, by view (see gtphipsi.monitoring.profiling).
+
+    Recording a request only adds to a few in-memory histograms, so this middleware is cheap enough to leave enabled in
+    production. Requests that are not handled by a view (e.g., those answered by other middleware) are not recorded.
+    Like AccessLogMiddleware, this middleware should come first in MIDDLEWARE_CLASSES.
+
+    """
+
+    def process_request(self, request):
+        """Note the time at which the request started, and start counting its queries."""
+        sql.install()
+        sql.reset()
+        request._profiling_start = time.time()
+        return None
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """Note the dotted path of the view function handling the request."""
+        request.view_name = '%s.%s' % (view_func.__module__, view_func.__name__)
+        return None
+
+    def process_response(self, request, response):
+        """Record the statistics of the request under its view's name."""
+        start = getattr(request, '_profiling_start', None)
+        view = getattr(request, 'view_name', None)
+        if start is not None and view is not None:
+            queries, query_time = sql.get_stats()
+            profiling.record(view, (time.time() - start) * 1000, queries, query_time * 1000)
+        return response
@@ -0,0 +1,6 @@
+"""Models for the gtphipsi.monitoring package.
+
+The monitoring package does not store anything in the database; this module exists so that Django recognizes the
+package as an application (and finds its management commands).
+
+"""
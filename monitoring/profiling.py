@@ -0,0 +1,106 @@
+"""Per-view profiling for the gtphipsi.monitoring package.
+
+ViewProfilingMiddleware (see gtphipsi.monitoring.middleware) records the wall time, number of SQL queries, and SQL time
+of every request in rolling histograms kept in memory, one set per view. Since each server process has its own memory,
+every process also copies its histograms to the cache once in a while (at most every FLUSH_INTERVAL seconds), and the
+report page and the 'view_profile_report' management command merge the copies of all processes.
+
+The copies can only be merged if every process uses the same cache, so profiling needs a shared cache backend (such as
+memcached or the database cache) in settings.CACHES. With a per-process backend, such as the default LocMemCache, the
+report page only shows the requests handled by the process that renders it, and the management command (which runs in
+a process of its own) shows nothing; see has_shared_cache().
+
+This module exports the following functions:
+    - record (view, wall_ms, queries, sql_ms)
+    - flush ([force])
+    - collect ()
+    - has_shared_cache ()
+
+This module exports the following constants:
+    - FLUSH_INTERVAL
+    - METRICS
+
+"""
+
+import os
+import socket
+import threading
+import time
+
+from django.core.cache import cache
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from gtphipsi.monitoring.stats import Histogram, RollingHistogram
+
+
+# The minimum number of seconds between copies of a process's histograms to the cache.
+FLUSH_INTERVAL = 30
+
+# The names of the statistics recorded for each view, in the order they are reported.
+METRICS = ('wall_ms', 'queries', 'sql_ms')
+
+# The length of the periods of the rolling histograms (in seconds), and the number of periods they cover (one hour).
+WINDOW = 300
+WINDOWS = 12
+
+# The cache key of the list of the keys under which processes have stored their histograms.
+_PROCESSES_KEY = 'profiling:processes'
+_TIMEOUT = WINDOW * WINDOWS
+
+_profiles = {}  # maps view names to dictionaries mapping metric names to RollingHistogram objects
+_lock = threading.Lock()
+_last_flush = [0.0]
+
+
+def record(view, wall_ms, queries, sql_ms):
+    """Record the statistics of one request handled by the provided view (a dotted path), then flush if it is time."""
+    now = time.time()
+    with _lock:
+        profile = _profiles.get(view)
+        if profile is None:
+            profile = _profiles[view] = dict((metric, RollingHistogram(WINDOW, WINDOWS)) for metric in METRICS)
+        profile['wall_ms'].add(wall_ms, now)
+        profile['queries'].add(queries, now)
+        profile['sql_ms'].add(sql_ms, now)
+    if now - _last_flush[0] >= FLUSH_INTERVAL:
+        flush()
+
+
+def flush(force=False):
+    """Copy this process's histograms to the cache, unless they were copied less than FLUSH_INTERVAL seconds ago."""
+    now = time.time()
+    with _lock:
+        if not force and now - _last_flush[0] < FLUSH_INTERVAL:
+            return
+        _last_flush[0] = now
+        snapshot = dict((view, dict((metric, histogram.merge_into(Histogram(), now))
+                                    for metric, histogram in profile.items()))
+                        for view, profile in _profiles.items())
+    key = 'profiling:%s:%d' % (socket.gethostname(), os.getpid())
+    cache.set(key, (now, snapshot), _TIMEOUT)
+    processes = cache.get(_PROCESSES_KEY) or []
+    if key not in processes:
+        cache.set(_PROCESSES_KEY, [k for k in processes if cache.get(k) is not None] + [key], _TIMEOUT)
+
+
+def collect():
+    """Return a dictionary mapping each view name to a dictionary mapping each metric name to a merged Histogram.
+
+    The histograms of all processes that have flushed their histograms to the cache in the past hour are merged (only
+    this process's histograms, if the cache is not shared; see has_shared_cache()).
+
+    """
+    merged = {}
+    snapshots = cache.get_many(cache.get(_PROCESSES_KEY) or [])
+    for _, snapshot in snapshots.values():
+        for view, profile in snapshot.items():
+            totals = merged.setdefault(view, dict((metric, Histogram()) for metric in METRICS))
+            for metric, histogram in profile.items():
+                totals[metric].merge(histogram)
+    return merged
+
+
+def has_shared_cache():
+    """Return True if the cache backend is shared by all processes, so that collect() sees all of them; False otherwise."""
+    return not isinstance(cache, (LocMemCache, DummyCache))
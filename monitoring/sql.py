@@ -0,0 +1,90 @@
+"""SQL query accounting for the gtphipsi.monitoring package.
+
+Django only records the queries it runs when DEBUG is True, and then it also logs each query and keeps its text, which
+is too expensive to do in production. This module instead counts the queries run by the current thread and adds up the
+time they take, by wrapping the cursors of the default database connection (see install). The numbers are kept per
+thread, since each thread handles one request at a time.
+
+This module exports the following functions:
+    - install ()
+    - reset ()
+    - get_stats ()
+
+"""
+
+import threading
+import time
+
+from django.db import connections, DEFAULT_DB_ALIAS
+
+
+_stats = threading.local()
+
+
+def install():
+    """Start counting the queries run over the current thread's connection to the default database, if not already.
+
+    Only the connection's cursor() method is wrapped; whether Django records queries itself (in connection.queries, as
+    it does when DEBUG is True or while a test counts queries) is still decided every time a cursor is created.
+
+    """
+    connection = connections[DEFAULT_DB_ALIAS]
+    if getattr(connection, '_counting_queries', False):
+        return
+    cursor = connection.cursor
+
+    def counting_cursor():
+        """Return a new cursor from the connection, wrapped so that the queries executed with it are counted."""
+        return _CountingCursor(cursor())
+
+    connection.cursor = counting_cursor
+    connection._counting_queries = True
+
+
+def reset():
+    """Set the current thread's query count and total query time to zero (e.g., at the start of a request)."""
+    _stats.count = 0
+    _stats.time = 0.0
+
+
+def get_stats():
+    """Return a tuple (count, seconds) of the queries run by the current thread since reset() was last called."""
+    return getattr(_stats, 'count', 0), getattr(_stats, 'time', 0.0)
+
+
+class _CountingCursor(object):
+    """A cursor wrapper that counts and times the queries executed with the wrapped cursor."""
+
+    def __init__(self, cursor):
+        """Create a wrapper around the provided cursor (itself a wrapper created by Django)."""
+        self.cursor = cursor
+
+    def execute(self, sql, params=()):
+        """Execute a query with the wrapped cursor, recording it in the current thread's statistics."""
+        start = time.time()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            _record(time.time() - start)
+
+    def executemany(self, sql, param_list):
+        """Execute a query once for each set of parameters, recording it (as one query) in the thread's statistics."""
+        start = time.time()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            _record(time.time() - start)
+
+    def __getattr__(self, attr):
+        """Return the provided attribute of the wrapped cursor."""
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        """Return an iterator over the rows of the wrapped cursor."""
+        return iter(self.cursor)
+
+
+def _record(seconds):
+    """Add a query that took the provided number of seconds to the current thread's statistics."""
+    _stats.count = getattr(_stats, 'count', 0) + 1
+    _stats.time = getattr(_stats, 'time', 0.0) + seconds
@@ -0,0 +1,118 @@
+"""Statistics helpers for the gtphipsi.monitoring package.
+
+Latencies are summarized with histograms rather than lists of samples, so that recording a value takes constant time
+and memory no matter how many requests are recorded. The buckets grow geometrically by a factor of BUCKET_RATIO, so a
+percentile computed from a histogram is within 25% of the true value across the whole range of recorded values (from
+well under a millisecond to minutes, or from zero to thousands of queries).
+
+This module exports the following classes:
+    - Histogram
+    - RollingHistogram
+
+This module exports the following functions:
+    - percentile (values, fraction)
+
+"""
+
+from bisect import bisect_left
+import math
+import time
+
+
+# The ratio between the upper bounds of consecutive histogram buckets.
+BUCKET_RATIO = 1.25
+
+# The upper bounds of the histogram buckets; values above the last bound fall in one extra, unbounded bucket.
+BUCKETS = [0] + [0.1 * BUCKET_RATIO ** i for i in range(72)]
+
+
+def percentile(values, fraction):
+    """Return the value below which the provided fraction of the provided values fall (nearest-rank method).
+
+    Required parameters:
+        - values    =>  a non-empty list of numbers, sorted in ascending order
+        - fraction  =>  the fraction of values that should fall at or below the result (e.g., 0.95 for the 95th percentile)
+
+    """
+    index = int(math.ceil(fraction * len(values))) - 1
+    return values[min(max(index, 0), len(values) - 1)]
+
+
+class Histogram(object):
+    """A histogram of non-negative values, with geometrically growing buckets (see BUCKETS)."""
+
+    def __init__(self):
+        """Create an empty histogram."""
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def add(self, value):
+        """Record the provided value."""
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.maximum:
+            self.maximum = value
+
+    def merge(self, other):
+        """Add all of the values recorded by another histogram to this one."""
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.total += other.total
+        self.maximum = max(self.maximum, other.maximum)
+
+    def mean(self):
+        """Return the mean of the recorded values, or 0 if there are none."""
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, fraction):
+        """Return (the upper bound of the bucket containing) the provided percentile of the recorded values."""
+        if not self.count:
+            return 0.0
+        rank = max(int(math.ceil(fraction * self.count)), 1)
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(BUCKETS[i], self.maximum) if i < len(BUCKETS) else self.maximum
+        return self.maximum
+
+
+class RollingHistogram(object):
+    """A histogram of the values recorded during the most recent 'windows' periods of 'window' seconds each.
+
+    Values are recorded in a histogram for the current period; the histograms of older periods are discarded, so the
+    statistics always describe recent traffic, and memory use is bounded.
+
+    """
+
+    def __init__(self, window=300, windows=12):
+        """Create an empty rolling histogram covering the provided number of periods of the provided length."""
+        self.window = window
+        self.windows = windows
+        self.periods = []   # (period number, Histogram) tuples, oldest first
+
+    def add(self, value, now=None):
+        """Record the provided value in the histogram of the current period."""
+        period = int((time.time() if now is None else now) // self.window)
+        if not self.periods or self.periods[-1][0] != period:
+            self.periods.append((period, Histogram()))
+            self._expire(period)
+        self.periods[-1][1].add(value)
+
+    def merge_into(self, histogram, now=None):
+        """Add the values recorded during the periods that have not expired yet to the provided histogram."""
+        oldest = int((time.time() if now is None else now) // self.window) - self.windows + 1
+        for period, period_histogram in self.periods:
+            if period >= oldest:
+                histogram.merge(period_histogram)
+        return histogram
+
+    def _expire(self, period):
+        """Discard the histograms of periods that are too old to be reported at the provided (current) period."""
+        oldest = period - self.windows + 1
+        while self.periods and self.periods[0][0] < oldest:
+            self.periods.pop(0)
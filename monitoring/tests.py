@@ -0,0 +1,129 @@
+"""
+This file demonstrates writing tests using the unittest module. These will pass
+when you run "manage.py test".
+
+Replace this with more appropriate tests for your application.
+"""
+
+import logging
+
+from django.contrib.auth.models import AnonymousUser, Group, User
+from django.core.urlresolvers import reverse
+from django.http import HttpResponse
+from django.test import TestCase
+from django.test.client import RequestFactory
+
+from gtphipsi.brothers.models import UserProfile, VisibilitySettings
+from gtphipsi.monitoring import profiling, sql
+from gtphipsi.monitoring.middleware import access_log, AccessLogMiddleware, ViewProfilingMiddleware
+
+
+class SimpleTest(TestCase):
+    def test_basic_addition(self):
+        """
+        Tests that 1 + 1 always equals 2.
+        """
+        self.assertEqual(1 + 1, 2)
+
+
+class SqlAccountingTest(TestCase):
+    """Tests that queries are counted per thread without changing how Django itself records them."""
+
+    def test_counts_queries(self):
+        """Every query executed after reset() is counted, and installing twice does not count queries twice."""
+        sql.install()
+        sql.install()
+        sql.reset()
+        User.objects.count()
+        list(User.objects.all())
+        queries, seconds = sql.get_stats()
+        self.assertEqual(queries, 2)
+        self.assertTrue(seconds >= 0)
+        sql.reset()
+        self.assertEqual(sql.get_stats(), (0, 0.0))
+
+    def test_django_still_records_queries(self):
+        """Django still records the queries a test counts, even though DEBUG is False while tests run."""
+        sql.install()
+        with self.assertNumQueries(1):
+            User.objects.count()
+
+
+class MiddlewareTest(TestCase):
+    """Tests that the monitoring middleware counts each request's queries and reports them."""
+
+    def setUp(self):
+        """Capture the records of the access log instead of writing them to its file."""
+        self.handler = _ListHandler()
+        self.saved_handlers = access_log.handlers
+        access_log.handlers = [self.handler]
+
+    def tearDown(self):
+        """Restore the access log's handlers."""
+        access_log.handlers = self.saved_handlers
+
+    def run_request(self, middleware, num_queries):
+        """Pass a request through the provided middleware, running the provided number of queries in its 'view'."""
+        request = RequestFactory().get('/monitoring/test/')
+        request.user = AnonymousUser()
+        middleware.process_request(request)
+        middleware.process_view(request, _test_view, (), {})
+        for i in range(num_queries):
+            User.objects.count()
+        return middleware.process_response(request, HttpResponse())
+
+    def test_access_log(self):
+        """One record is logged per request, with the request's view, status, and number of queries."""
+        self.run_request(AccessLogMiddleware(), 3)
+        self.assertEqual(len(self.handler.records), 1)
+        data = self.handler.records[0].data
+        self.assertEqual((data['view'], data['status'], data['queries'], data['user']),
+                         ('gtphipsi.monitoring.tests._test_view', 200, 3, None))
+        with self.assertNumQueries(1):     # the request left Django's own query recording alone
+            User.objects.count()
+
+    def test_view_profiling(self):
+        """Each request's number of queries is recorded in its view's histogram."""
+        self.run_request(ViewProfilingMiddleware(), 2)
+        self.run_request(ViewProfilingMiddleware(), 4)
+        profiling.flush(force=True)
+        histogram = profiling.collect()['gtphipsi.monitoring.tests._test_view']['queries']
+        self.assertEqual((histogram.count, histogram.total, histogram.maximum), (2, 6, 4))
+
+
+class ViewProfilesTest(TestCase):
+    """Tests that only administrators may see the per-view profiles."""
+
+    def setUp(self):
+        """Create a brother, who is not an administrator."""
+        self.user = User.objects.create_user('brother', 'brother@example.com', 'password')
+        UserProfile.objects.create(user=self.user, badge=1, public_visibility=VisibilitySettings.objects.create(),
+                                   chapter_visibility=VisibilitySettings.objects.create())
+        self.client.login(username='brother', password='password')
+
+    def test_administrators_only(self):
+        """A brother who is not an administrator is sent to the 'forbidden' page; an administrator sees the profiles."""
+        response = self.client.get(reverse('view_profiles'))
+        self.assertRedirects(response, reverse('forbidden'))
+        self.user.groups.add(Group.objects.create(name='Administrators'))
+        response = self.client.get(reverse('view_profiles'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['shared_cache'], profiling.has_shared_cache())
+
+
+class _ListHandler(logging.Handler):
+    """A logging handler that keeps the records logged to it in a list."""
+
+    def __init__(self):
+        """Create a handler with no records."""
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        """Keep the provided record."""
+        self.records.append(record)
+
+
+def _test_view(request):
+    """A stand-in view function, whose dotted path the middleware records."""
+    return HttpResponse()
@@ -0,0 +1,12 @@
+"""URL configuration for the gtphipsi.monitoring package.
+
+All URIs beginning with '/monitoring/' are routed to this URL configuration. All such pages are for administrators only.
+
+"""
+
+from django.conf.urls.defaults import patterns, url
+
+
+urlpatterns = patterns('gtphipsi.monitoring.views',
+    url(r'^views/$', 'view_profiles', name='view_profiles'),
+)
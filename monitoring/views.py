@@ -0,0 +1,44 @@
+"""View functions for the gtphipsi.monitoring package.
+
+This module exports the following view functions:
+    - view_profiles (request)
+
+"""
+
+from django.contrib.auth.decorators import login_required
+from django.core.urlresolvers import reverse
+from django.http import HttpResponseRedirect
+from django.shortcuts import render
+from django.template import RequestContext
+
+from gtphipsi.common import log_page_view
+from gtphipsi.monitoring.profiling import collect, has_shared_cache, METRICS
+
+
+## ============================================= ##
+##                                               ##
+##              Authenticated Views              ##
+##                                               ##
+## ============================================= ##
+
+
+@login_required
+def view_profiles(request):
+    """Render the 50th, 95th, and 99th percentiles of the wall time, queries, and SQL time of each view, slowest first.
+
+    The statistics cover the past hour of requests handled by all server processes running ViewProfilingMiddleware, if
+    the processes share a cache backend (otherwise, only those handled by this process; the page then says so). Only
+    administrators (members of the Administrators group) may view them.
+
+    """
+    log_page_view(request, 'View Profiles')
+    if request.profile is None or not request.profile.is_admin():
+        return HttpResponseRedirect(reverse('forbidden'))
+    profiles = sorted(collect().items(), key=lambda item: item[1]['wall_ms'].percentile(0.95), reverse=True)
+    rows = []
+    for view, metrics in profiles:
+        rows.append({'view': view, 'count': metrics['wall_ms'].count,
+                     'metrics': [(metric, metrics[metric].percentile(0.5), metrics[metric].percentile(0.95),
+                                  metrics[metric].percentile(0.99)) for metric in METRICS]})
+    return render(request, 'monitoring/view_profiles.html', {'rows': rows, 'shared_cache': has_shared_cache()},
+                  context_instance=RequestContext(request))
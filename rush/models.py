@@ -8,6 +8,9 @@ This module exports the following model classes:
 This module exports the following tuples of field choices:
     - SEASON_CHOICES
 
+This module exports the following constant definitions:
+    - RUSH_STATS_CACHE
+
 """
 
 from datetime import datetime
@@ -15,6 +18,16 @@ from datetime import datetime
 from django.contrib.localflavor.us.models import PhoneNumberField
 from django.core.urlresolvers import reverse
 from django.db import models
+from django.db.models import Count
+from django.db.models.signals import post_delete, post_save
+
+from gtphipsi.caching import bump_version, get_cached
+from gtphipsi.chapter.models import InformationCard
+from gtphipsi.rush.stats import empty_stats, info_card_window, summarize
+
+
+# The cache namespace of the rush statistics (see Rush.all_stats() and Rush.get_stats()).
+RUSH_STATS_CACHE = 'rush_stats'
 
 
 # Academic seasons at Georgia Tech.
@@ -37,8 +50,32 @@ class Rush(models.Model):
     @classmethod
     def current(cls):
         """Return the most recent rush instance that has been marked as 'visible'."""
-        queryset = cls.objects.filter(visible=True).order_by('-start_date')
-        return queryset[0] if queryset.count() > 0 else None
+        queryset = cls.objects.filter(visible=True).order_by('-start_date')[:1]
+        return queryset[0] if queryset else None
+
+    @classmethod
+    def all_stats(cls):
+        """Return a dictionary mapping the ID of every rush to a dictionary of statistics (see rush.stats.summarize)."""
+        return get_cached(RUSH_STATS_CACHE, 'all', lambda: cls._load_stats(list(cls.objects.all())))
+
+    @classmethod
+    def _load_stats(cls, rushes):
+        """Return a dictionary mapping the ID of each provided rush to its statistics, loaded from the database.
+
+        The potentials of all of the rushes are counted by a single query, grouped by rush (and by the 'pledged' and
+        'hidden' fields, which summarize() folds into each rush's totals); a second query loads only the dates of the
+        information cards received during the rushes' information card windows.
+
+        """
+        counts = Potential.objects.filter(rush__in=[rush.id for rush in rushes])
+        counts = counts.values_list('rush', 'pledged', 'hidden').annotate(count=Count('id')).order_by()
+        windows = [window for window in (info_card_window(rush) for rush in rushes) if window is not None]
+        card_dates = []
+        if windows:
+            card_dates = InformationCard.objects.filter(created__gte=min(start for start, end in windows),
+                                                        created__lt=max(end for start, end in windows))
+            card_dates = card_dates.values_list('created', flat=True).order_by()
+        return summarize(rushes, counts, card_dates)
 
     def __unicode__(self):
         """Return a Unicode string representation of the rush."""
@@ -62,7 +99,11 @@ class Rush(models.Model):
 
     def get_num_pledges(self):
         """Return the number of pledges associated with the rush."""
-        return self.potentials.filter(pledged=True).count()
+        return self.get_stats()['pledges']
+
+    def get_stats(self):
+        """Return a dictionary of statistics about the rush (see rush.stats.summarize)."""
+        return get_cached(RUSH_STATS_CACHE, str(self.id), lambda: Rush._load_stats([self]).get(self.id, empty_stats()))
 
     class Meta:
         """Define a default sort of start date descending (most recent first)."""
@@ -118,3 +159,16 @@ class Potential(models.Model):
         else:
             path = reverse('show_potential', kwargs={'id': self.id})
         return path
+
+
+def _invalidate_rush_stats(sender, **kwargs):
+    """Discard the cached rush statistics whenever a rush, potential, or information card is changed or deleted."""
+    bump_version(RUSH_STATS_CACHE)
+
+post_save.connect(_invalidate_rush_stats, sender=Rush, dispatch_uid='gtphipsi.rush.models.rush_saved')
+post_delete.connect(_invalidate_rush_stats, sender=Rush, dispatch_uid='gtphipsi.rush.models.rush_deleted')
+post_save.connect(_invalidate_rush_stats, sender=Potential, dispatch_uid='gtphipsi.rush.models.potential_saved')
+post_delete.connect(_invalidate_rush_stats, sender=Potential, dispatch_uid='gtphipsi.rush.models.potential_deleted')
+post_save.connect(_invalidate_rush_stats, sender=InformationCard, dispatch_uid='gtphipsi.rush.models.info_card_saved')
+post_delete.connect(_invalidate_rush_stats, sender=InformationCard,
+                    dispatch_uid='gtphipsi.rush.models.info_card_deleted')
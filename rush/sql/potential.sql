@@ -0,0 +1,9 @@
+-- Composite indexes for the potential and pledge listings of the gtphipsi.rush package.
+--
+-- The listings filter on 'pledged' and 'hidden' (and usually 'rush_id'), then sort by name or by date added. Django
+-- runs this file after creating the rush_potential table ('python manage.py syncdb'); on an existing database, run the
+-- statements printed by 'python manage.py sqlcustom rush'.
+
+CREATE INDEX rush_potential_rush_pledged_hidden ON rush_potential (rush_id, pledged, hidden, first_name);
+CREATE INDEX rush_potential_pledged_hidden_name ON rush_potential (pledged, hidden, first_name);
+CREATE INDEX rush_potential_pledged_hidden_created ON rush_potential (pledged, hidden, created);
@@ -0,0 +1,96 @@
+"""Rush statistics for the gtphipsi.rush package.
+
+The statistics of every rush (the numbers of potentials, pledges, and hidden records, the rate at which potentials
+become pledges, and the number of information cards received in each week leading up to and during the rush) are built
+from the results of two queries: one counting the potentials of all rushes, grouped by rush, and one listing the dates
+on which information cards were received. This module turns those results into statistics; it does not touch the
+database (see the all_stats() and get_stats() methods of the Rush model class, which cache the statistics).
+
+This module exports the following functions:
+    - info_card_window (rush)
+    - summarize (rushes, counts, card_dates)
+    - empty_stats ()
+
+This module exports the following constants:
+    - INFO_CARD_LEAD_WEEKS
+
+"""
+
+from bisect import bisect_left
+from datetime import timedelta
+
+
+# The number of weeks before the start of a rush from which information cards are counted toward that rush.
+INFO_CARD_LEAD_WEEKS = 4
+
+
+def info_card_window(rush):
+    """Return a tuple (start, end) of the dates between which information cards count toward the provided rush.
+
+    The window starts INFO_CARD_LEAD_WEEKS weeks before the rush's start date and ends on the day after the rush's end
+    date (or start date, if the rush has no end date); 'end' is excluded from the window. If the rush has no start date,
+    the function returns None.
+
+    """
+    if rush.start_date is None:
+        return None
+    last_day = rush.start_date if rush.end_date is None or rush.end_date < rush.start_date else rush.end_date
+    return rush.start_date - timedelta(weeks=INFO_CARD_LEAD_WEEKS), last_day + timedelta(days=1)
+
+
+def summarize(rushes, counts, card_dates):
+    """Return a dictionary mapping the ID of each provided rush to a dictionary of statistics about that rush.
+
+    Required parameters:
+        - rushes        =>  a list of the rushes to summarize
+        - counts        =>  an iterable of tuples (rush ID, pledged, hidden, count) of numbers of potentials
+        - card_dates    =>  an iterable of the dates (or datetimes) on which information cards were received
+
+    Each dictionary of statistics has the keys 'potentials', 'pledges', 'hidden', 'total', 'conversion' (the percentage
+    of the rush's potentials who pledged), 'info_cards', and 'weeks' (a list of tuples (date, count) of the number of
+    information cards received in each week of the rush's information card window, starting on 'date').
+
+    """
+    result = dict((rush.id, empty_stats()) for rush in rushes)
+    for rush_id, pledged, hidden, count in counts:
+        if rush_id in result:
+            stats = result[rush_id]
+            stats['pledges' if pledged else 'potentials'] += count
+            if hidden:
+                stats['hidden'] += count
+    dates = sorted(_as_date(date) for date in card_dates)
+    for rush in rushes:
+        stats = result[rush.id]
+        stats['total'] = stats['potentials'] + stats['pledges']
+        if stats['total']:
+            stats['conversion'] = round(100.0 * stats['pledges'] / stats['total'], 1)
+        window = info_card_window(rush)
+        if window is not None:
+            start, end = window
+            weeks = [0] * (((end - start).days + 6) // 7)
+            for date in dates[bisect_left(dates, start):bisect_left(dates, end)]:
+                weeks[(date - start).days // 7] += 1
+            stats['info_cards'] = sum(weeks)
+            stats['weeks'] = [(start + timedelta(weeks=i), count) for i, count in enumerate(weeks)]
+    return result
+
+
+def empty_stats():
+    """Return a dictionary of statistics for a rush having no potentials and no information cards."""
+    return {'potentials': 0, 'pledges': 0, 'hidden': 0, 'total': 0, 'conversion': 0.0, 'info_cards': 0, 'weeks': []}
+
+
+
+
+
+
+## ============================================= ##
+##                                               ##
+##               Private Functions               ##
+##                                               ##
+## ============================================= ##
+
+
+def _as_date(value):
+    """Return the provided date, or the date part of the provided datetime."""
+    return value.date() if hasattr(value, 'date') else value
@@ -5,8 +5,16 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
+from datetime import date, datetime
+
+from django.contrib.auth.models import Group, Permission, User
+from django.core.urlresolvers import reverse
 from django.test import TestCase
 
+from gtphipsi.brothers.models import UserProfile, VisibilitySettings
+from gtphipsi.rush.models import Potential, Rush
+from gtphipsi.rush.stats import empty_stats, summarize
+
 
 class SimpleTest(TestCase):
     def test_basic_addition(self):
@@ -14,3 +22,71 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class SummarizeTest(TestCase):
+    """Tests for the folding of grouped potential counts and information card dates into rush statistics."""
+
+    def test_counts_and_weeks(self):
+        """Tests that counts are totalled per rush and information cards are bucketed into the weeks of each rush."""
+        spring = Rush(id=1, season='S', start_date=date(2012, 1, 30), end_date=date(2012, 2, 3))
+        fall = Rush(id=2, season='F', start_date=date(2012, 8, 20), end_date=None)
+        counts = [(1, False, False, 6), (1, False, True, 2), (1, True, False, 2), (2, True, True, 1),
+                  (3, True, False, 9)]
+        cards = [datetime(2012, 1, 2), datetime(2012, 1, 8, 23), date(2012, 1, 31), date(2012, 2, 4), date(2012, 8, 20)]
+        result = summarize([spring, fall], counts, cards)
+        self.assertEqual(sorted(result), [1, 2])
+        self.assertEqual((result[1]['potentials'], result[1]['pledges'], result[1]['hidden']), (8, 2, 2))
+        self.assertEqual((result[1]['total'], result[1]['conversion']), (10, 20.0))
+        self.assertEqual(result[1]['info_cards'], 3)
+        self.assertEqual([count for week, count in result[1]['weeks']], [2, 0, 0, 0, 1])
+        self.assertEqual(result[1]['weeks'][0][0], date(2012, 1, 2))
+        self.assertEqual((result[2]['pledges'], result[2]['conversion'], result[2]['info_cards']), (1, 100.0, 1))
+
+    def test_no_start_date(self):
+        """Tests that a rush without a start date has no information card weeks."""
+        result = summarize([Rush(id=1, season='U')], [], [date(2012, 6, 1)])
+        self.assertEqual(result[1], empty_stats())
+
+
+class RushStatsTest(TestCase):
+    """Tests for the cached statistics of the Rush model class."""
+
+    def setUp(self):
+        self.rush = Rush.objects.create(season='S', start_date=date(2012, 1, 30), end_date=date(2012, 2, 3))
+        Potential.objects.create(rush=self.rush, first_name='George', last_name='Burdell')
+        Potential.objects.create(rush=self.rush, first_name='Jane', last_name='Doe', pledged=True)
+
+    def test_all_stats_queries(self):
+        """Tests that the statistics of all rushes are loaded by a fixed number of queries and then cached."""
+        Rush.objects.create(season='F', start_date=date(2012, 8, 20), end_date=date(2012, 8, 24))
+        with self.assertNumQueries(3):      # the rushes, the grouped potential counts, and the information card dates
+            stats = Rush.all_stats()
+        with self.assertNumQueries(0):
+            Rush.all_stats()
+        self.assertEqual((stats[self.rush.id]['potentials'], stats[self.rush.id]['pledges']), (1, 1))
+
+    def test_invalidated_by_update(self):
+        """Tests that the cached statistics are discarded when the rush's potentials change."""
+        self.assertEqual(self.rush.get_num_pledges(), 1)
+        Potential.objects.create(rush=self.rush, first_name='John', last_name='Doe', pledged=True)
+        self.assertEqual(self.rush.get_num_pledges(), 2)
+
+
+class GroupPermsTemplateTest(TestCase):
+    """Tests that templates decide which links to show from the permissions of the user's groups."""
+
+    def setUp(self):
+        """Create and sign in a brother, who belongs to a group without any permissions."""
+        self.group = Group.objects.create(name='Rush Chairs')
+        user = User.objects.create_user('brother', 'brother@example.com', 'password')
+        user.groups.add(self.group)
+        UserProfile.objects.create(user=user, badge=1, public_visibility=VisibilitySettings.objects.create(),
+                                   chapter_visibility=VisibilitySettings.objects.create())
+        self.client.login(username='brother', password='password')
+
+    def test_add_rush_link(self):
+        """Tests that the 'New Rush' button is shown only once the user's group is granted the 'add_rush' permission."""
+        self.assertNotContains(self.client.get(reverse('rush_list')), 'New Rush')
+        self.group.permissions.add(Permission.objects.get(codename='add_rush'))
+        self.assertContains(self.client.get(reverse('rush_list')), 'New Rush')
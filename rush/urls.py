@@ -23,6 +23,8 @@ urlpatterns = patterns('gtphipsi.rush.views',
     url(r'^list/$', 'list', name='rush_list'),
     url(r'^add/$', 'add', name='add_rush'),
     url(r'^current/$', 'show', name='current_rush'),
+    url(r'^stats/$', 'stats', name='current_rush_stats'),
+    url(r'^stats/compare/$', 'compare', name='compare_rushes'),
     url(r'^edit-event/(?P<id>\d+)/$', 'edit_event', name='edit_rush_event'),
     url(r'^info-cards/$', 'info_card_list', name='info_card_list'),
     url(r'^info-cards/(?P<id>\d+)/$', 'info_card_show', name='info_card_view'),
@@ -37,6 +39,7 @@ urlpatterns = patterns('gtphipsi.rush.views',
     url(r'^pledges/(?P<id>\d+)/edit/$', 'edit_pledge', name='edit_pledge'),
     url(r'^(?P<name>[FSU]\d{4})/$', 'show', name='view_rush'),
     url(r'^(?P<name>[FSU]\d{4})/edit/$', 'edit', name='edit_rush'),
+    url(r'^(?P<name>[FSU]\d{4})/stats/$', 'stats', name='rush_stats'),
     url(r'^(?P<name>[FSU]\d{4})/add-event/$', 'add_event', name='add_rush_event'),
     url(r'^(?P<name>[FSU]\d{4})/potentials/$', 'potentials', name='potentials'),
     url(r'^(?P<name>[FSU]\d{4})/potentials/add/$', 'add_potential', name='add_rush_potential'),
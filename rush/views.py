@@ -9,6 +9,8 @@ This module exports the following view functions:
     - info_card_thanks (request)
     - list (request)
     - show (request[, name])
+    - stats (request[, name])
+    - compare (request)
     - add (request)
     - edit (request, name)
     - add_event (request, name)
@@ -28,28 +30,36 @@ This module exports the following view functions:
 """
 
 from datetime import datetime
+import json
 import logging
 
 from django.conf import settings
 from django.contrib.auth.decorators import login_required, permission_required
-from django.core.mail import get_connection
 from django.core.mail.message import EmailMessage
+from django.core.paginator import EmptyPage, InvalidPage, Paginator
 from django.core.urlresolvers import reverse
-from django.http import Http404, HttpResponseRedirect
+from django.db.models import Count
+from django.http import Http404, HttpResponse, HttpResponseRedirect
 from django.shortcuts import get_object_or_404, render
 from django.template import RequestContext
 
 from gtphipsi.brothers.models import UserProfile, STATUS_BITS
+from gtphipsi.caching import bump_version
 from gtphipsi.chapter.forms import InformationForm
 from gtphipsi.chapter.models import InformationCard
 from gtphipsi.common import log_page_view, REFERRER
+from gtphipsi.mailqueue.models import QueuedMessage
 from gtphipsi.messages import get_message
 from gtphipsi.rush.forms import PledgeForm, PotentialForm, RushEventForm, RushForm
-from gtphipsi.rush.models import Potential, Rush, RushEvent
+from gtphipsi.rush.models import Potential, Rush, RushEvent, RUSH_STATS_CACHE
+from gtphipsi.rush.stats import empty_stats, INFO_CARD_LEAD_WEEKS
 
 
 log = logging.getLogger('django')
 
+# The largest number of potentials or pledges that may be listed on one page (see the 'per_page' query parameter).
+_MAX_PER_PAGE = 200
+
 
 ## ============================================= ##
 ##                                               ##
@@ -127,7 +137,10 @@ def info_card_thanks(request):
 def list(request):
     """Render a listing of rushes."""
     log_page_view(request, 'Rush List')
-    return render(request, 'rush/list.html', {'rushes': Rush.objects.all()}, context_instance=RequestContext(request))
+    stats = Rush.all_stats()
+    rushes = [(rush, stats.get(rush.id, empty_stats())) for rush in Rush.objects.all()]
+    return render(request, 'rush/list.html', {'rushes': rushes, 'current': Rush.current()},
+                  context_instance=RequestContext(request))
 
 
 @login_required
@@ -145,9 +158,44 @@ def show(request, name=None):
             return HttpResponseRedirect(reverse('rush_list'))
     else:
         rush = _get_rush_or_404(name)  # look up by unique name
-    num_pledges = Potential.objects.filter(rush=rush, pledged=True).count()
-    num_potentials = Potential.objects.filter(rush=rush, pledged=False).count()
-    return render(request, 'rush/show.html', {'rush': rush, 'pledges': num_pledges, 'potentials': num_potentials},
+    stats = rush.get_stats()
+    context = {'rush': rush, 'pledges': stats['pledges'], 'potentials': stats['potentials']}
+    return render(request, 'rush/show.html', context, context_instance=RequestContext(request))
+
+
+@login_required
+def stats(request, name=None):
+    """Render (or, if the 'format' query parameter is 'json', return as JSON) statistics about a particular rush.
+
+    Optional parameters:
+        - name  =>  the unique name (abbreviation) of the rush to view (as a string): defaults to the current rush
+
+    """
+    log_page_view(request, 'Rush Statistics')
+    if name is None:
+        rush = Rush.current()
+        if rush is None:
+            return HttpResponseRedirect(reverse('rush_list'))
+    else:
+        rush = _get_rush_or_404(name)
+    stats = rush.get_stats()
+    if request.GET.get('format') == 'json':
+        return _json_response(_stats_to_json(rush, stats))
+    most = max([count for week, count in stats['weeks']] or [0])
+    weeks = [(week, count, (100 * count // most) if most else 0) for week, count in stats['weeks']]
+    return render(request, 'rush/stats.html', {'rush': rush, 'stats': stats, 'weeks': weeks},
+                  context_instance=RequestContext(request))
+
+
+@login_required
+def compare(request):
+    """Render (or, if the 'format' query parameter is 'json', return as JSON) the statistics of every rush."""
+    log_page_view(request, 'Compare Rushes')
+    stats = Rush.all_stats()
+    rushes = [(rush, stats.get(rush.id, empty_stats())) for rush in Rush.objects.all()]
+    if request.GET.get('format') == 'json':
+        return _json_response([_stats_to_json(rush, rush_stats) for rush, rush_stats in rushes])
+    return render(request, 'rush/compare.html', {'rushes': rushes, 'lead_weeks': INFO_CARD_LEAD_WEEKS},
                   context_instance=RequestContext(request))
 
 
@@ -284,16 +332,15 @@ def potentials(request, name=None):
     """
     log_page_view(request, 'Potentials')
     rush = _get_rush_or_404(name)
-    if 'all' in request.GET and request.GET.get('all') == 'true':
-        hidden = 0
-    else:
-        hidden = Potential.objects.filter(pledged=False, hidden=True).count()
+    show_all = (request.GET.get('all') == 'true')
+    visible, hidden = _get_potential_counts(rush, False)
     descending = (request.GET.get('order', '') == 'desc')     # ascending order by default
-    potentials = _get_potential_queryset(hidden == 0, rush, False, request.GET.get('sort', 'name'), descending)
+    potentials = _get_potential_queryset(show_all, rush, False, request.GET.get('sort', 'name'), descending)
+    context = _get_page_context(request, potentials, (visible + hidden) if show_all else visible)
     current_rush = None if Rush.current() is None else Rush.current().get_unique_name()
-    return render(request, 'rush/potentials.html',
-                  {'potentials': potentials, 'rush': rush, 'hidden': hidden, 'current_rush': current_rush},
-                  context_instance=RequestContext(request))
+    context.update({'potentials': context['page'], 'rush': rush, 'hidden': 0 if show_all else hidden,
+                    'current_rush': current_rush})
+    return render(request, 'rush/potentials.html', context, context_instance=RequestContext(request))
 
 
 @login_required
@@ -396,6 +443,7 @@ def update_potentials(request, name=None):
         else:   # action == 'delete'
             potentials.delete()
             log.info('%s (%s) deleted %d potentials', request.user.username, request.user.get_full_name(), count)
+        bump_version(RUSH_STATS_CACHE)     # update() does not send the signals that invalidate the rush statistics
     rush = _get_rush_or_404(name)
     redirect = reverse('all_potentials') if rush is None else reverse('potentials', kwargs={'name': name})
     return HttpResponseRedirect(redirect)
@@ -412,16 +460,15 @@ def pledges(request, name=None):
     """
     log_page_view(request, 'Pledges')
     rush = _get_rush_or_404(name)
-    if rush is not None or ('all' in request.GET and request.GET.get('all') == 'true'):
-        hidden = 0
-    else:
-        hidden = Potential.objects.filter(hidden=True).count()
+    show_all = rush is not None or (request.GET.get('all') == 'true')
+    visible, hidden = _get_potential_counts(rush, True)
     descending = (request.GET.get('order', '') == 'desc')     # ascending order by default
-    pledges = _get_potential_queryset(hidden == 0, rush, True, request.GET.get('sort', 'name'), descending)
+    pledges = _get_potential_queryset(show_all, rush, True, request.GET.get('sort', 'name'), descending)
+    context = _get_page_context(request, pledges, (visible + hidden) if show_all else visible)
     current_rush = None if Rush.current() is None else Rush.current().get_unique_name()
-    return render(request, 'rush/pledges.html',
-                  {'pledges': pledges, 'hidden': hidden, 'rush': rush, 'current_rush': current_rush},
-                  context_instance=RequestContext(request))
+    context.update({'pledges': context['page'], 'hidden': 0 if show_all else hidden, 'rush': rush,
+                    'current_rush': current_rush})
+    return render(request, 'rush/pledges.html', context, context_instance=RequestContext(request))
 
 
 @login_required
@@ -539,11 +586,9 @@ def _send_info_card_emails(card):
                                 get_message('notify.infocard.body', args=(date, card.to_string(), settings.URI_PREFIX)),
                                 to=['membership@gtphipsi.org'],
                                 bcc=UserProfile.all_emails_with_bit(STATUS_BITS['EMAIL_NEW_INFOCARD']))
-    # open a connection to the SMTP backend so we can send two messages over the same connection
-    conn = get_connection()
-    conn.open()
-    conn.send_messages([message, notification])
-    conn.close()
+    # queue both messages; the 'send_queued_mail' management command delivers them
+    QueuedMessage.enqueue(message)
+    QueuedMessage.enqueue(notification)
 
 
 def _get_potential_queryset(all, rush, pledge, sort_by='name', desc=False):
@@ -571,7 +616,72 @@ def _get_potential_queryset(all, rush, pledge, sort_by='name', desc=False):
             queryset = Potential.objects.filter(hidden=False, rush=rush, pledged=pledge)
     map = {'name': 'first_name', 'date': 'created', 'phone': 'phone', 'rush': 'rush'}
     sort_by = map[sort_by] if map.has_key(sort_by) else 'first_name'
-    return queryset.order_by('-%s' % sort_by) if desc else queryset.order_by(sort_by)
+    # the ID breaks ties, so that each potential appears on exactly one page
+    return queryset.select_related('rush').order_by('-%s' % sort_by if desc else sort_by, 'id')
+
+
+def _get_potential_counts(rush, pledge):
+    """Return a tuple (visible, hidden) of the numbers of potentials or pledges not marked and marked as hidden.
+
+    Required parameters:
+        - rush      =>  the rush to which to limit the counts, or None to count potentials from all rushes
+        - pledge    =>  whether to count pledges or potentials (as a boolean)
+
+    Both numbers are counted by a single query, grouped by the 'hidden' field.
+
+    """
+    queryset = Potential.objects.filter(pledged=pledge)
+    if rush is not None:
+        queryset = queryset.filter(rush=rush)
+    counts = dict(queryset.values_list('hidden').annotate(count=Count('id')).order_by())
+    return counts.get(False, 0), counts.get(True, 0)
+
+
+def _get_page_context(request, queryset, count):
+    """Return a dictionary of template context for the requested page of a listing of potentials or pledges.
+
+    Required parameters:
+        - request   =>  the request for the listing, whose query string may specify 'page' and 'per_page'
+        - queryset  =>  the filtered and sorted queryset of potentials or pledges to list
+        - count     =>  the number of potentials or pledges in the queryset (already known from its counts by
+                        _get_potential_counts(), so the paginator need not count them again)
+
+    The dictionary contains the page ('page'), the number of the first item on the page less one ('offset'), the query
+    string for sorting links ('filters'), and the URLs of the first, previous, next, and last pages.
+
+    """
+    try:
+        per_page = min(max(int(request.GET.get('per_page', settings.POTENTIALS_PER_PAGE)), 1), _MAX_PER_PAGE)
+    except ValueError:
+        per_page = settings.POTENTIALS_PER_PAGE
+    paginator = _CountedPaginator(queryset, per_page, count)
+    try:
+        page = paginator.page(int(request.GET.get('page', '1')))
+    except ValueError:
+        page = paginator.page(1)    # if 'page' parameter is not an integer, default to page 1
+    except (EmptyPage, InvalidPage):
+        page = paginator.page(paginator.num_pages)
+    params = request.GET.copy()
+    params.pop('page', None)
+    page_url = '?%spage=' % (params.urlencode() + '&' if params else '')
+    for name in ('sort', 'order'):
+        params.pop(name, None)
+    return {'page': page, 'offset': page.start_index() - 1 if count else 0,
+            'filters': (params.urlencode() + '&' if params else ''), 'first_url': page_url + '1',
+            'prev_url': '%s%d' % (page_url, page.number - 1), 'next_url': '%s%d' % (page_url, page.number + 1),
+            'last_url': '%s%d' % (page_url, paginator.num_pages)}
+
+
+def _stats_to_json(rush, stats):
+    """Return a dictionary of the provided statistics about the provided rush, in a form that can be encoded in JSON."""
+    result = dict(stats, rush=rush.get_unique_name(), title=rush.title())
+    result['weeks'] = [{'start': week.isoformat(), 'info_cards': count} for week, count in stats['weeks']]
+    return result
+
+
+def _json_response(data):
+    """Return an HTTP response containing the provided data, encoded as JSON."""
+    return HttpResponse(json.dumps(data), content_type='application/json')
 
 
 def _get_redirect_from_rush(rush):
@@ -586,3 +696,17 @@ def _get_redirect_from_rush(rush):
     else:
         redirect = HttpResponseRedirect(rush.get_absolute_url())
     return redirect
+
+
+class _CountedPaginator(Paginator):
+    """A paginator over a list whose length is already known, so that the paginator does not count it again."""
+
+    def __init__(self, object_list, per_page, count):
+        """Create a paginator over the provided list, which has the provided length."""
+        super(_CountedPaginator, self).__init__(object_list, per_page)
+        self.known_count = count
+
+    @property
+    def count(self):
+        """Return the length of the list."""
+        return self.known_count
@@ -101,14 +101,21 @@ TEMPLATE_CONTEXT_PROCESSORS = (
 #   'django.core.context_processors.tz',
     'django.contrib.messages.context_processors.messages',
     'gtphipsi.context_processors.announcements_processor',
+    'gtphipsi.context_processors.user_profile_processor',
+    'gtphipsi.context_processors.group_perms_processor',
     'gtphipsi.context_processors.menu_item_processor'
 )
 
 MIDDLEWARE_CLASSES = (
+    'gtphipsi.monitoring.middleware.AccessLogMiddleware',
+    # Uncomment the next line to record per-view latency and query statistics (see /monitoring/views/); the statistics
+    # of all server processes are only merged if CACHES (below) uses a shared backend, such as memcached:
+    # 'gtphipsi.monitoring.middleware.ViewProfilingMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'gtphipsi.middleware.UserProfileMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
 )
 
@@ -133,6 +140,9 @@ INSTALLED_APPS = (
     'brothers',
     'rush',
     'chapter',
+    'forums',
+    'mailqueue',
+    'monitoring',
 )
 
 TIME_LOGGING_FORMAT = '%d/%b/%Y %H:%M:%S'
@@ -152,6 +162,9 @@ LOGGING = {
         },
         'default': {
             'format': '[%(levelname)s] %(asctime)s %(module)s.%(funcName)s (%(lineno)d) : %(message)s'
+        },
+        'json': {
+            '()': 'gtphipsi.monitoring.handlers.JsonFormatter'
         }
     },
     'handlers': {
@@ -187,6 +200,12 @@ LOGGING = {
         'mail_admins': {
             'level': 'ERROR',
             'class': 'django.utils.log.AdminEmailHandler'
+        },
+        'access_log': {
+            'level': 'INFO',
+            'class': 'gtphipsi.monitoring.handlers.QueueFileHandler',
+            'formatter': 'json',
+            'filename': GTPHIPSI_APP_ROOT + '/log/access.log'
         }
     },
     'loggers': {
@@ -204,10 +223,24 @@ LOGGING = {
             'handlers': ['query_log'],
             'level': 'DEBUG',
             'propagate': False
+        },
+        'gtphipsi.access': {
+            'handlers': ['access_log'],
+            'level': 'INFO',
+            'propagate': False
         }
     }
 }
 
+# Cached values are invalidated by bumping a version number stored in the cache (see gtphipsi.caching), so every
+# process must share the same cache for changes to show up everywhere; use memcached when running several processes.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'gtphipsi'
+    }
+}
+
 AUTH_PROFILE_MODULE = 'brothers.UserProfile'
 
 LOGIN_URL = '/login/'
@@ -235,6 +268,15 @@ MAX_LOGIN_ATTEMPTS = 3
 
 MIN_PASSWORD_LENGTH = 6
 
+# Number of posts to display on each page of a forum thread (also used for the number of threads on each forum page).
+POSTS_PER_PAGE = 20
+
+# Number of brothers to display on each page of the user management page (and of the user directory).
+BROTHERS_PER_PAGE = 50
+
+# Default number of potentials (or pledges) to display on each page of the rush listings (may be changed per request).
+POTENTIALS_PER_PAGE = 50
+
 # Accepted formats:
 # '1852-[0]2-19', '[0]2-19-1852', '[0]2-19-52', '[0]2/19/1852', '[0]2/19/52',
 # 'Feb 19 1852', 'Feb 19, 1852', 'Feb 19 52', 'Feb 19, 52',
@@ -270,6 +312,9 @@ UNDERGRADUATE_PERMISSIONS = [
     'add_announcement', 'change_announcement', 'delete_announcement'
 ]
 
+# Permissions to grant all alumni users when their accounts are created (alumni may read, but not manage, the site).
+ALUMNI_PERMISSIONS = []
+
 # Permissions to grant administrator users.
 ADMINISTRATOR_PERMISSIONS = UNDERGRADUATE_PERMISSIONS + [
     'add_permission', #'change_permission', 'delete_permission',
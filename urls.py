@@ -32,6 +32,7 @@ urlpatterns += patterns('',
      url(r'^rush/', include('gtphipsi.rush.urls')),
      url(r'^chapter/', include('gtphipsi.chapter.urls')),
      url(r'^forums/', include('gtphipsi.forums.urls')),
+     url(r'^monitoring/', include('gtphipsi.monitoring.urls')),
 )
 
 # Hack - to continue to support the old rush schedule URI.
@@ -22,7 +22,6 @@ import logging
 from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
-from django.core.mail import get_connection
 from django.core.mail.message import EmailMessage
 from django.core.urlresolvers import reverse
 from django.http import Http404, HttpResponseRedirect, QueryDict
@@ -34,6 +33,8 @@ from gtphipsi.brothers.models import UserProfile, STATUS_BITS
 from gtphipsi.chapter.forms import ContactForm
 from gtphipsi.chapter.models import Announcement, InformationCard
 from gtphipsi.common import create_user_and_profile, log_page_view, REFERRER
+from gtphipsi.forums.models import ReadWatermark
+from gtphipsi.mailqueue.models import QueuedMessage
 from gtphipsi.messages import get_message
 
 
@@ -55,11 +56,9 @@ def home(request):
         context = {}    # main index doesn't require any context
     else:
         template = 'index_bros_only.html'
-        user = request.user
-        profile = user.get_profile()
-        threads = profile.subscriptions.order_by('-updated')
-        if len(threads) > 5:
-            threads = threads[:5]
+        profile = request.profile
+        threads = ReadWatermark.annotate(profile.subscriptions.select_related('forum', 'owner__user')
+                                         .order_by('-updated'), profile)[:5]
         announcements = Announcement.most_recent(False)
         two_months_ago = datetime.now() - timedelta(days=60)
         info_cards = InformationCard.objects.filter(created__gte=two_months_ago).order_by('-created')
@@ -112,7 +111,7 @@ def sign_in(request):
                     log.info('User %s (%s) signed in - last login was %s', user.username, user.get_full_name(),
                              user.last_login.strftime('%m/%d/%Y %I:%M %p'))
                     login(request, user)
-                    del request.session['login_attempts'], request.session['username'], request.session['group_perms']
+                    del request.session['login_attempts'], request.session['username']
                     return HttpResponseRedirect(_get_redirect_destination(request.META[REFERRER], user.get_profile()))
     else:
         username = ''
@@ -126,8 +125,6 @@ def sign_out(request):
     log_page_view(request, 'Sign Out')
     log.info('User %s (%s) signed out', request.user.username, request.user.get_full_name())
     logout(request)
-    if 'group_perms' in request.session:
-        del request.session['group_perms']
     return HttpResponseRedirect(reverse('home'))
 
 
@@ -191,7 +188,7 @@ def forgot_password(request):
     """Render and process a form to allow users to reset their passwords."""
 
     log_page_view(request, 'Forgot Password')
-    if request.user.is_authenticated() and not request.user.get_profile().is_admin():
+    if request.user.is_authenticated() and not request.profile.is_admin():
         return HttpResponseRedirect(reverse('forbidden'))   # if you're logged in but not admin, you shouldn't be here
 
     username = None
@@ -222,7 +219,7 @@ def reset_password(request, id):
     """
 
     log_page_view(request, 'Reset Password')
-    if request.user.is_authenticated() and not request.user.get_profile().is_admin():
+    if request.user.is_authenticated() and not request.profile.is_admin():
         return HttpResponseRedirect(reverse('forbidden'))   # non-admins should use the 'change password' form
 
     user = get_object_or_404(User, id=id)
@@ -245,7 +242,7 @@ def reset_password(request, id):
             redirect = reverse('reset_password_success')
         else:
             log.info('Admin %s (#%d) reset password for %s (%s) - temporary password emailed to %s',
-                     request.user.get_full_name(), request.user.get_profile().badge, user.username,
+                     request.user.get_full_name(), request.profile.badge, user.username,
                      user.get_full_name(), user.email)
             redirect = reverse('manage_users')
         return HttpResponseRedirect(redirect)
@@ -306,8 +303,6 @@ def _send_contact_emails(contact):
                                 get_message('notify.contact.body', args=(date, contact.to_string())),
                                 to=['webmaster@gtphipsi.org'],
                                 bcc=UserProfile.all_emails_with_bit(STATUS_BITS['EMAIL_NEW_CONTACT']))
-    # open a connection to the SMTP backend so we can send two messages over the same connection
-    conn = get_connection()
-    conn.open()
-    conn.send_messages([message, notification])
-    conn.close()
+    # queue both messages; the 'send_queued_mail' management command delivers them
+    QueuedMessage.enqueue(message)
+    QueuedMessage.enqueue(notification)